@@ -96,3 +96,4 @@ from .properties import *
 from .services import *
 from .settings import *
 from .utility import *
+from .snapshot import *
@@ -11,6 +11,11 @@ from __future__ import unicode_literals
 __all__ = ['Application', 'TypeNotFound', 'InstanceNotFound']
 
 import os
+import sys
+import atexit
+import socket
+import hashlib
+import logging
 from itertools import chain
 
 from bcontext import (ContextStack,
@@ -18,11 +23,21 @@ from bcontext import (ContextStack,
 
 from .utility import (LogConfigurator,
                       StackAwareHierarchicalContext)
+from .schema import startup_timing_schema
+from .snapshot import ApplicationSnapshot
 
 import bcontext
-from butility import parse_key_value_string
+from butility import (parse_key_value_string,
+                      startup_timing,
+                      login_name,
+                      TimingTree)
 from butility.compat import profile
 
+log = logging.getLogger(__name__)
+
+# Paths to files we will write the startup timing to when the program terminates
+_startup_timing_files = set()
+
 
 # -------------------------
 # @name Exceptions
@@ -114,6 +129,21 @@ class Application(object):
     # It will automatically be enabled if this variable is set
     profile_fields_evar = 'BAPP_PROFILE_FIELDS'
 
+    # Environment variable with a path to a file to which to write the startup timing (see butility.startup_timing) 
+    # when the program terminates. Recording will be enabled automatically if it is set.
+    # '{pid}' will be substituted with the process id, and '-' writes to stderr.
+    startup_timing_evar = 'BAPP_STARTUP_TIMING'
+
+    # Environment variable with the format of the startup timing file, one of TimingTree.formats
+    startup_timing_format_evar = 'BAPP_STARTUP_TIMING_FORMAT'
+
+    # Environment variable with a path to an application snapshot file, see new(snapshot=...).
+    # '{uid}' will be substituted with a string identifying the current user.
+    snapshot_evar = 'BAPP_SNAPSHOT'
+
+    # Environment variables which influence where settings are found, and thus invalidate snapshots when changed
+    snapshot_environment_variables = ('HOME', 'USERPROFILE', 'HOMEDRIVE', 'HOMEPATH')
+
     # -- End Subclass Configuration -- @}
 
     # Just a marker for the context which exists while there is no official Application instance
@@ -205,9 +235,15 @@ class Application(object):
 
     def _setup_profiler(self):
         """If we should profile as determined by an environment variable, initialize a profiler and assure 
-        we print profiling stats when the program terminates
+        we print profiling stats when the program terminates. The same goes for the startup timing.
         @note currently we do not track how many profilers have been setup already - this only works if there
         is a single Application instance per process. However, we remove the env var to not react to it again """
+        timing_file = os.environ.get(self.startup_timing_evar)
+        if timing_file:
+            self._setup_startup_timing(timing_file,
+                                       os.environ.get(self.startup_timing_format_evar, TimingTree.FORMAT_JSON))
+        # end handle startup timing
+
         fields = os.environ.get(self.profile_fields_evar)
         if not fields:
             return
@@ -217,8 +253,6 @@ class Application(object):
         pr.enable()
 
         import pstats
-        import sys
-        import atexit
 
         def print_profile_stats():
             try:
@@ -230,6 +264,129 @@ class Application(object):
 
         atexit.register(print_profile_stats)
 
+    @classmethod
+    def _setup_startup_timing(cls, path, format):
+        """Enable recording of butility.startup_timing, and write it to the given file when the program terminates.
+        It is valid to call this multiple times - each file will only be written once.
+        @param path to the file to write, see startup_timing_evar
+        @param format one of TimingTree.formats"""
+        if format not in TimingTree.formats:
+            log.error("Invalid startup timing format '%s' - valid formats are %s", format, ', '.join(TimingTree.formats))
+            return
+        # end verify format
+        startup_timing.enable()
+
+        path = path.replace('{pid}', str(os.getpid()))
+        if path in _startup_timing_files:
+            return
+        # end don't write files twice
+        _startup_timing_files.add(path)
+
+        def write_startup_timing():
+            if path == '-':
+                startup_timing.write(sys.stderr, format)
+                return
+            # end handle stderr
+            try:
+                with open(path, 'w') as fp:
+                    startup_timing.write(fp, format)
+                # end assure file is closed
+            except (IOError, OSError):
+                log.error("Failed to write startup timing to '%s'", path, exc_info=True)
+            # end handle errors
+        # end handler
+
+        atexit.register(write_startup_timing)
+
+    @classmethod
+    def _snapshot_key(cls, *args):
+        """@return a string identifying everything that influences the contents of the context stack, aside 
+        from files and directories, which are tracked by the snapshot itself
+        @param args all arguments to new() which affect the context stack"""
+        key = [cls.__module__, cls.__name__, sys.version, sys.platform, login_name(), socket.gethostname()]
+        key.extend('%r' % (arg,) for arg in args)
+        key.extend('%s=%r' % (name, os.environ.get(name)) for name in cls.snapshot_environment_variables)
+        return hashlib.sha1('\0'.join(key).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def _restore_snapshot(cls, inst, path, key):
+        """Restore the context of the given instance from the snapshot at the given path
+        @return True if the snapshot was valid and restored, False otherwise"""
+        snapshot = ApplicationSnapshot.load(path)
+        if snapshot is None or not snapshot.is_valid(key):
+            return False
+        # end handle invalid snapshot
+        with startup_timing.phase('snapshot restore'):
+            snapshot.restore(inst.context())
+        # end record timing
+        log.debug("Restored application context from snapshot at '%s'", path)
+        return True
+
+    @classmethod
+    def _save_snapshot(cls, inst, path, key, start_at):
+        """Write a snapshot of all contexts of the given instance from start_at upwards to the given path.
+        Failures are logged, but not raised"""
+        try:
+            ApplicationSnapshot.capture(key, inst.context(), start_at).save(path)
+        except Exception:
+            log.warn("Could not write application snapshot to '%s'", path, exc_info=True)
+        # end ignore failures
+
+    @classmethod
+    def _push_contexts(cls, inst, settings_trees, settings_hierarchy, load_plugins_from_trees,
+                       recursive_plugin_loading, plugins_subtree, lazy_plugin_loading, user_settings,
+                       with_default_contexts):
+        """Push all contexts configured by the arguments of new() onto the stack of the given instance"""
+        # This needs lazy import
+        from .contexts import (OSContext,
+                               ApplicationContext)
+
+        if with_default_contexts:
+            typ = cls.OSContextType or OSContext
+            inst.context().push(typ('os'))
+
+            typ = cls.ApplicationContextType or ApplicationContext
+            inst.context().push(typ('app', user_settings=user_settings,
+                                    traverse_settings_hierarchy=settings_hierarchy))
+        # end handle ApplicationContext
+
+        if settings_trees:
+            ctx = inst.context().push(cls.HierarchicalContextType(settings_trees,
+                                                                  traverse_settings_hierarchy=settings_hierarchy,
+                                                                  application=inst))
+            if load_plugins_from_trees:
+                ctx.load_plugins(recurse=recursive_plugin_loading,
+                                 subdirectory=plugins_subtree,
+                                 lazy=lazy_plugin_loading)
+        # end for each path to push
+
+    @classmethod
+    def _new(cls, snapshot, settings_trees, settings_hierarchy, load_plugins_from_trees, recursive_plugin_loading,
+             plugins_subtree, lazy_plugin_loading, user_settings, setup_logging, with_default_contexts):
+        """Implements new()"""
+        inst = cls._init_instance()
+        args = (settings_trees, settings_hierarchy, load_plugins_from_trees, recursive_plugin_loading,
+                plugins_subtree, lazy_plugin_loading, user_settings, with_default_contexts)
+
+        if snapshot:
+            snapshot = snapshot.replace('{uid}', login_name())
+            key = cls._snapshot_key(os.getcwd(), *args)
+        # end prepare snapshot
+
+        if not (snapshot and cls._restore_snapshot(inst, snapshot, key)):
+            start_at = len(inst.context())
+            cls._push_contexts(inst, *args)
+            if snapshot:
+                cls._save_snapshot(inst, snapshot, key, start_at)
+            # end update snapshot
+        # end handle snapshot
+
+        if setup_logging:
+            cls.LogConfiguratorType.initialize()
+        # end handle log setup
+
+        return inst
+
     # -- End Subclass Interface -- @}
 
     # -------------------------
@@ -239,9 +396,11 @@ class Application(object):
     @classmethod
     def new(cls, settings_trees=tuple(), settings_hierarchy=False,
             load_plugins_from_trees=False, recursive_plugin_loading=False, plugins_subtree='plug-ins',
+            lazy_plugin_loading=True,
             user_settings=True,
             setup_logging=True,
-            with_default_contexts=True):
+            with_default_contexts=True,
+            snapshot=None):
         """Create a new Application instance, configured with all items an application needs to function.
         This is mainly a registry for settings, types and instances providing particular instances.
 
@@ -264,42 +423,37 @@ class Application(object):
         @param recursive_plugin_loading if True, plugins may reside in sub-folders and will be loaded anyway
         @param plugins_subtree the directory within each configuration directory which should be searched
         for plug-ins. That way, you can separate plug-ins from other code
+        @param lazy_plugin_loading if True, plug-in files declaring the interfaces they provide will only be loaded
+        once one of these interfaces is requested. See bcontext.LazyPlugin for more information.
         @param user_settings if True, user settings will be loaded from directory at user.config (within application settings)
         @param setup_logging if True, logging will be configured using the LogConfigurator, which in turn
         is setup using our context
         @param with_default_contexts if True, we will initialize an OSContext and an ApplicationContext
+        @param snapshot if set, path to a file with a snapshot of all contexts this method would create, including 
+        their settings and plugin files. If it is still valid, the contexts are restored from it, without 
+        searching or reading any configuration file. Otherwise the contexts are built and the snapshot is 
+        written. If unset, the value of the snapshot_evar environment variable is used, if present.
+        The snapshot is ignored if it or its directory is a symlink, isn't owned by the current user or is writable 
+        by others. Of the environment, only the snapshot_environment_variables invalidate it
         @return a new Application instance
         @note in every program, the Application instance must be initialized before anything that uses the 
         default application is imported. Otherwise, types cannot be registered
+        @note the startup-timing settings are read at the end, which is why only the phases of the first Application
+        are recorded if it is enabled that way. Use the startup_timing_evar to get everything.
         """
-        inst = cls._init_instance()
-
-        # This needs lazy import
-        from .contexts import (OSContext,
-                               ApplicationContext)
-
-        if with_default_contexts:
-            typ = cls.OSContextType or OSContext
-            inst.context().push(typ('os'))
-
-            typ = cls.ApplicationContextType or ApplicationContext
-            inst.context().push(typ('app', user_settings=user_settings,
-                                    traverse_settings_hierarchy=settings_hierarchy))
-        # end handle ApplicationContext
-
-        if settings_trees:
-            ctx = inst.context().push(cls.HierarchicalContextType(settings_trees,
-                                                                  traverse_settings_hierarchy=settings_hierarchy,
-                                                                  application=inst))
-            if load_plugins_from_trees:
-                ctx.load_plugins(recurse=recursive_plugin_loading,
-                                 subdirectory=plugins_subtree)
-        # end for each path to push
-
-        if setup_logging:
-            cls.LogConfiguratorType.initialize()
-        # end handle log setup
-
+        with startup_timing.phase('application'):
+            inst = cls._new(snapshot or os.environ.get(cls.snapshot_evar),
+                            settings_trees, settings_hierarchy, load_plugins_from_trees, recursive_plugin_loading,
+                            plugins_subtree, lazy_plugin_loading, user_settings, setup_logging,
+                            with_default_contexts)
+
+            if not os.environ.get(cls.startup_timing_evar):
+                timing = inst.settings().value_by_schema(startup_timing_schema)
+                if timing.file:
+                    inst._setup_startup_timing(timing.file, timing.format)
+                # end handle timing file
+            # end handle settings
+        # end record timing
         return inst
 
     def instance(self, interface, predicate=lambda service: True):
@@ -75,6 +75,18 @@ class OSContext(Context, ApplicationSettingsMixin):
 
     # -- End Interface -- @}
 
+    # -------------------------
+    # @name Snapshot Interface
+    # @{
+
+    @classmethod
+    def from_snapshot_state(cls, state):
+        """@return a new instance, as information about the system we are running on is never taken from
+        a snapshot"""
+        return cls(state['name'])
+
+    # -- End Snapshot Interface -- @}
+
 # end class OSContext
 
 
@@ -131,4 +143,14 @@ class ApplicationContext(StackAwareHierarchicalContext):
 
     # -- End Interface -- @}
 
+    # -------------------------
+    # @name Snapshot Interface
+    # @{
+
+    def snapshot_dependencies(self):
+        """@return our dependencies, including the user configuration directory, even if it doesn't exist"""
+        return super(ApplicationContext, self).snapshot_dependencies() + [self.user_config_directory()]
+
+    # -- End Snapshot Interface -- @}
+
 # end class ApplicationContext
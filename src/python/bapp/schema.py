@@ -9,7 +9,8 @@
 from __future__ import unicode_literals
 __all__ = []
 
-from butility import Path
+from butility import (Path,
+                      TimingTree)
 from bkvstore import (RootKey,
                       KeyValueStoreSchema)
 
@@ -35,3 +36,11 @@ project_schema = KeyValueStoreSchema('project', {'id': str,
                                                  )
                                                  }
                                      )
+
+# Allows to write the startup timing tree (see butility.startup_timing) into a file when the program terminates
+startup_timing_schema = KeyValueStoreSchema('startup-timing', {
+    # The file to write. '{pid}' will be substituted with the process id. Nothing is written if it is empty
+    'file': str,
+    # The format of the file, one of TimingTree.formats
+    'format': TimingTree.FORMAT_JSON
+})
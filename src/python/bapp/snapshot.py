@@ -0,0 +1,155 @@
+#-*-coding:utf-8-*-
+"""
+@package bapp.snapshot
+@brief Implements snapshots of fully initialized context stacks, to speed up the creation of Applications
+
+@author Sebastian Thiel
+@copyright [GNU Lesser General Public License](https://www.gnu.org/licenses/lgpl.html)
+"""
+from __future__ import unicode_literals
+__all__ = ['ApplicationSnapshot']
+
+import os
+import stat
+import logging
+
+from butility.compat import pickle
+from butility import stat_fingerprint
+
+log = logging.getLogger(__name__)
+
+
+# ==============================================================================
+# @name Utilities
+# ------------------------------------------------------------------------------
+# @{
+
+def _is_trusted(path):
+    """@return True if the given file and its directory are no symlinks, are owned by the current user and
+    can't be written by anyone else. Always True on platforms without user ids"""
+    if not hasattr(os, 'getuid'):
+        return True
+    # end handle platforms without user ids
+    for item in (path, os.path.dirname(os.path.abspath(path))):
+        try:
+            st = os.lstat(item)
+        except OSError:
+            return False
+        # end handle missing paths
+        if stat.S_ISLNK(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o022:
+            return False
+        # end check ownership and permissions
+    # end for each item to check
+    return True
+
+# -- End Utilities -- @}
+
+
+class ApplicationSnapshot(object):
+
+    """A snapshot of all contexts an Application pushed onto its stack during initialization, along with the
+    aggregated settings and the plugin files that were loaded.
+
+    It keeps the fingerprint of all files and directories the contexts depend on, which allows to determine
+    whether restoring it would yield the same result as a rebuild.
+    """
+    __slots__ = (
+        '_key',             # a string identifying the arguments and environment the snapshot was taken with
+        '_fingerprints',    # a list of (path, fingerprint) tuples
+        '_stack_state'      # the state as returned by ContextStack.snapshot_state()
+    )
+
+    # -------------------------
+    # @name Configuration
+    # @{
+
+    # Version of our file format. Snapshots with a different version are ignored
+    version = 1
+
+    # -- End Configuration -- @}
+
+    def __init__(self, key, fingerprints, stack_state):
+        """Initialize this instance - use capture() to obtain a new snapshot"""
+        self._key = key
+        self._fingerprints = fingerprints
+        self._stack_state = stack_state
+
+    # -------------------------
+    # @name Interface
+    # @{
+
+    @classmethod
+    def capture(cls, key, stack, start_at=0):
+        """@return a new snapshot of the given stack
+        @param key a string identifying everything which influenced the contents of the stack, and which isn't
+        a file or directory
+        @param stack the ContextStack to take the snapshot from
+        @param start_at index of the first context on the stack to include"""
+        paths = list()
+        for ctx in stack.stack()[start_at:]:
+            for path in ctx.snapshot_dependencies():
+                if path not in paths:
+                    paths.append(path)
+                # end keep unique paths
+            # end for each dependency
+        # end for each context
+        return cls(key, [(path, stat_fingerprint(path)) for path in paths], stack.snapshot_state(start_at))
+
+    @classmethod
+    def load(cls, path):
+        """@return a snapshot read from the given file, or None if it doesn't exist or couldn't be read. 
+        Files which could have been written by other users are ignored, as loading them could execute any code"""
+        if os.path.lexists(path) and not _is_trusted(path):
+            log.warn("Ignoring application snapshot at '%s' as it or its directory could be changed by others", path)
+            return None
+        # end handle untrusted files
+        try:
+            with open(path, 'rb') as fp:
+                version, key, fingerprints, stack_state = pickle.load(fp)
+            # end assure file is closed
+        except Exception:
+            log.debug("Could not read application snapshot at '%s'", path, exc_info=True)
+            return None
+        # end ignore invalid files
+        if version != cls.version:
+            return None
+        # end ignore incompatible files
+        return cls(key, fingerprints, stack_state)
+
+    def save(self, path):
+        """Write this snapshot to the given file. The file is replaced atomically, if possible.
+        @return self
+        @throw IOError, OSError or pickle.PicklingError if the file could not be written"""
+        tmp_path = '%s.%i.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as fp:
+            os.chmod(tmp_path, 0o600)
+            pickle.dump((self.version, self._key, self._fingerprints, self._stack_state), fp, 2)
+        # end assure file is closed
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        # end rename doesn't replace on windows
+        os.rename(tmp_path, path)
+        return self
+
+    def is_valid(self, key):
+        """@return True if this snapshot was taken with the given key, and if none of the files and directories
+        it depends on changed since"""
+        if key != self._key:
+            return False
+        # end check key
+        for path, fingerprint in self._fingerprints:
+            if stat_fingerprint(path) != fingerprint:
+                log.debug("Application snapshot is outdated as '%s' changed", path)
+                return False
+            # end check fingerprint
+        # end for each fingerprint
+        return True
+
+    def restore(self, stack):
+        """Push all contexts of this snapshot onto the given stack and restore their plugins
+        @return stack"""
+        return stack.restore_snapshot_state(self._stack_state)
+
+    # -- End Interface -- @}
+
+# end class ApplicationSnapshot
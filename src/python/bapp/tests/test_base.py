@@ -14,8 +14,13 @@ from .base import (preserve_application,
                    with_application,
                    AppTestCase)
 
+import os
+import time
+
 from butility import (Interface,
+                      startup_timing,
                       abstractmethod)
+from butility.tests import with_rw_directory
 
 import bapp
 
@@ -87,6 +92,111 @@ class TestCore(AppTestCase):
 
         assert len(app.settings().data())
 
+    @preserve_application
+    def test_startup_timing(self):
+        """Verify startup phases are recorded"""
+        assert not startup_timing.is_enabled(), "should be disabled by default"
+        startup_timing.reset().enable()
+        try:
+            bapp.Application.new(setup_logging=False,
+                                 settings_trees=(self.fixture_path(''),),
+                                 settings_hierarchy=True)
+            phases = startup_timing.to_dict()['children']
+            assert [phase['name'] for phase in phases] == ['application']
+
+            names = set()
+            stack = list(phases)
+            while stack:
+                phase = stack.pop()
+                names.add(phase['name'])
+                stack.extend(phase['children'])
+            # end for each phase
+            for name in ('config discovery', 'file parse'):
+                assert name in names
+            # end for each phase name
+
+            counters = startup_timing.counters()
+            assert counters['files read'] > 0 and counters['bytes read'] > 0 and counters['diff node visits'] > 0
+
+            events = startup_timing.to_chrome_trace()['traceEvents']
+            assert len(events) > len(phases) and all(event['ph'] == 'X' for event in events)
+        finally:
+            startup_timing.enable(False).reset()
+        # end assure timing is disabled
+
+    @with_rw_directory
+    @preserve_application
+    def test_snapshot(self, rw_dir):
+        """Verify contexts are restored from a snapshot until their configuration changes"""
+        config_dir = rw_dir / 'etc'
+        config_dir.makedirs()
+        (config_dir / 'a.yaml').write_text("snapshot:\n  value: 1\n")
+        snapshot = rw_dir / 'app.snapshot'
+
+        def new_application():
+            startup_timing.reset().enable()
+            try:
+                app = bapp.Application.new(setup_logging=False, user_settings=False, settings_trees=(rw_dir,),
+                                           snapshot=snapshot)
+                names = [phase.name for phase in startup_timing.root().children[0].children]
+            finally:
+                startup_timing.enable(False).reset()
+            # end assure timing is disabled
+            return app, 'snapshot restore' in names
+        # end utility
+
+        def snapshot_types(app):
+            """@return types of all contexts that are part of a snapshot, which excludes the early-startup
+            context other modules may have created before the first application"""
+            return [type(ctx) for ctx in app.context().stack()
+                    if ctx.name() != bapp.Application.PRE_APPLICATION_CONTEXT_NAME]
+        # end utility
+
+        app, restored = new_application()
+        assert not restored and snapshot.isfile(), "first run builds the contexts and writes the snapshot"
+        assert app.settings().value('snapshot.value', 0) == 1
+        types = snapshot_types(app)
+
+        app, restored = new_application()
+        assert restored
+        assert snapshot_types(app) == types
+        assert app.settings().value('snapshot.value', 0) == 1
+        assert isinstance(app.context().top(), bapp.StackAwareHierarchicalContext)
+
+        # make sure the modification time changes, even on file systems with low resolution
+        time.sleep(1.1)
+        (config_dir / 'a.yaml').write_text("snapshot:\n  value: 2\n")
+        app, restored = new_application()
+        assert not restored, "changed configuration must invalidate the snapshot"
+        assert app.settings().value('snapshot.value', 0) == 2
+
+        app, restored = new_application()
+        assert restored and app.settings().value('snapshot.value', 0) == 2
+
+        # the environment variables used to find settings are part of the key
+        prev_home = os.environ.get('HOME')
+        os.environ['HOME'] = str(rw_dir)
+        try:
+            assert not new_application()[1], "a different home directory must invalidate the snapshot"
+        finally:
+            if prev_home is None:
+                del os.environ['HOME']
+            else:
+                os.environ['HOME'] = prev_home
+            # end restore variable
+        # end assure environment is restored
+        assert not new_application()[1] and new_application()[1], "snapshot is rebuilt for the previous home"
+
+        # snapshots others could have written are never loaded
+        if hasattr(os, 'getuid'):
+            assert snapshot.stat().st_mode & 0o777 == 0o600
+            snapshot.chmod(0o622)
+            assert not new_application()[1], "snapshot writable by others must be ignored"
+            snapshot.chmod(0o600)
+            link = rw_dir / 'link.snapshot'
+            os.symlink(snapshot, link)
+            assert bapp.snapshot.ApplicationSnapshot.load(link) is None, "symlinks are ignored"
+        # end handle platforms with user ids
 
 # end class TestCore
 
@@ -170,6 +170,26 @@ class StackAwareHierarchicalContext(HierarchicalContext):
 
     # -- End Interface -- @}
 
+    # -------------------------
+    # @name Snapshot Interface
+    # @{
+
+    def snapshot_state(self):
+        """@return our state, including our hash map"""
+        state = super(StackAwareHierarchicalContext, self).snapshot_state()
+        state['hash_map'] = self._hash_map
+        return state
+
+    @classmethod
+    def from_snapshot_state(cls, state):
+        """@return a new instance using the global application"""
+        inst = super(StackAwareHierarchicalContext, cls).from_snapshot_state(state)
+        inst._hash_map = OrderedDict(state['hash_map'])
+        inst._app = None
+        return inst
+
+    # -- End Snapshot Interface -- @}
+
 # end class StackAwareHierarchicalContext
 
 
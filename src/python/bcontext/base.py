@@ -11,17 +11,22 @@ from butility.future import str
 
 
 from butility.future import with_metaclass
-__all__ = ['Context', 'ContextStack', 'StackAutoResolveAdditiveMergeDelegate', 'ApplyChangeContext']
+__all__ = ['Context', 'ContextStack', 'ConcurrentContextStack', 'StackAutoResolveAdditiveMergeDelegate',
+           'ApplyChangeContext']
 
 import re
+import time
 import logging
+import threading
 
 from butility import (OrderedDict,
                       LazyMixin,
                       Interface,
                       Meta,
                       Error,
-                      Path)
+                      Path,
+                      startup_timing,
+                      load_file)
 
 from bdiff import (NoValue,
                    TwoWayDiff,
@@ -33,9 +38,15 @@ from bkvstore import (KeyValueStoreSchemaValidator,
                       KeyValueStoreSchema,
                       RootKey)
 
+from .utility import (LazyPlugin,
+                      redirect_registration)
+
 
 log = logging.getLogger(__name__)
 
+# Serializes loading of LazyPlugins, which may be triggered by concurrent queries
+_lazy_load_lock = threading.RLock()
+
 
 class StackAutoResolveAdditiveMergeDelegate(AutoResolveAdditiveMergeDelegate):
 
@@ -93,9 +104,87 @@ class Context(object):
     # @name Utilities
     # @{
 
+    def _load_lazy_plugins(self, interface):
+        """Load all LazyPlugins in our registry which may provide the given interface. Each of them is replaced
+        by the types and instances registered while loading its file, keeping the registry order intact.
+        LazyPlugins which failed to load are kept, and each query they could have served logs their error."""
+        needs_load = False
+        for item in self._registry:
+            if not (isinstance(item, LazyPlugin) and item.provides(interface)):
+                continue
+            # end skip everything else
+            if item.error() is not None:
+                log.warn("Plugins of %s at '%s' are missing as the file failed to load: %s",
+                         item.module_name(), item.path(), item.error())
+            elif item.is_loadable():
+                needs_load = True
+            # end handle plugin state
+        # end for each item
+        if not needs_load:
+            return
+        # end bail out quickly if there is nothing to load
+
+        _lazy_load_lock.acquire()
+        try:
+            self._load_lazy_plugins_locked(interface)
+        finally:
+            _lazy_load_lock.release()
+        # end assure lock is released
+
+    def _load_lazy_plugins_locked(self, interface):
+        """Implements _load_lazy_plugins(), while no other thread can load plugins"""
+        index = 0
+        while index < len(self._registry):
+            item = self._registry[index]
+            if not (isinstance(item, LazyPlugin) and item.is_loadable() and item.provides(interface)):
+                index += 1
+                continue
+            # end skip everything else
+
+            loaded = Context(item.module_name())
+            st = time.time()
+            # queries of the file itself must not load it again
+            item.set_loading(True)
+            try:
+                with startup_timing.phase('plugin load'):
+                    with redirect_registration(loaded):
+                        load_file(item.path(), item.module_name())
+                    # end with registration into loaded
+                # end record timing
+            except Exception as err:
+                log.error("Failed to load %s from %s", item.module_name(), item.path(), exc_info=True)
+                item.set_error(err)
+            else:
+                log.debug("lazily loaded %s into module %s in %.2fms", item.path(), item.module_name(),
+                          (time.time() - st) * 1000.0)
+            finally:
+                item.set_loading(False)
+            # end handle errors
+
+            # The file may have loaded other plugins, which moves our item
+            for index, registered in enumerate(self._registry):
+                if registered is item:
+                    break
+                # end found item
+            else:
+                index = 0
+                continue
+            # end find item
+            plugins = [plugin for plugin in loaded._registry if plugin not in self._registry]
+            if item.error() is not None:
+                # keep whatever was registered before the failure, and the proxy which knows the error
+                self._registry[index:index] = plugins
+                index += len(plugins) + 1
+            else:
+                self._registry[index:index + 1] = plugins
+                index += len(plugins)
+            # end handle failure
+        # end for each item
+
     def _filter_registry(self, interface, predicate):
         """Iterate the registry and return a list of matching items, but only consider registrees for which 
         predicate(item) returns True"""
+        self._load_lazy_plugins(interface)
         items = list()
         # Items that came later will be used first - this way items that came later can override newer ones
         for item in reversed(self._registry):
@@ -169,7 +258,8 @@ class Context(object):
 
     def register(self, plugin):
         """register an instantiated plugin or a type
-        @param plugin the plugin instance to register or the class to use for instantiation
+        @param plugin the plugin instance to register or the class to use for instantiation, or a LazyPlugin
+        which will be loaded once one of its interfaces is requested
         @note duplicates are not allowed in the registry
         @return the registered plugin
         """
@@ -190,6 +280,42 @@ class Context(object):
 
     # -- End Edit Interface -- @}
 
+    # -------------------------
+    # @name Snapshot Interface
+    # Allows to recreate a context without redoing the work it took to initialize it
+    # @{
+
+    def snapshot_state(self):
+        """@return a picklable dict with all information required by from_snapshot_state() to recreate this
+        instance. The registry is not part of it.
+        @note subclasses with additional state must extend it"""
+        return dict(name=self._name, settings=self.settings()._data())
+
+    @classmethod
+    def from_snapshot_state(cls, state):
+        """@return a new instance of our type, initialized from the given state as returned by snapshot_state(),
+        without calling our constructor.
+        @note restore_plugins() must be called once the new instance is on top of the stack"""
+        inst = cls.__new__(cls)
+        inst._name = state['name']
+        inst._registry = list()
+        inst._kvstore = cls.KeyValueStoreModifierType(state['settings'])
+        return inst
+
+    def restore_plugins(self, state):
+        """Restore the plugins we had at the time the given state was obtained from snapshot_state().
+        @note base implementation does nothing
+        @return self"""
+        return self
+
+    def snapshot_dependencies(self):
+        """@return a list of paths to files or directories which, if changed, would invalidate a snapshot of
+        this instance.
+        @note base implementation returns an empty list"""
+        return list()
+
+    # -- End Snapshot Interface -- @}
+
 # end class Context
 
 
@@ -232,14 +358,14 @@ class ContextStack(with_metaclass(Meta, LazyMixin)):
         # end handle cache name
 
     def __str__(self):
-        return '\n'.join(str(ctx) for ctx in reversed(self._stack))
+        return '\n'.join(str(ctx) for ctx in reversed(self._contexts()))
 
     def pformat(self):
         """ print a comprehensive representation of the stack 
             @todo convert this into returning a data structure which would be useful and printable            
         """
         otp = str()
-        for idx, env in enumerate(self._stack):
+        for idx, env in enumerate(self._contexts()):
             otp += "### Context %i - %s ###############\n\n" % (idx, env.name())
             otp += env.pformat()
         # for each env on stack
@@ -262,7 +388,7 @@ class ContextStack(with_metaclass(Meta, LazyMixin)):
 
     def __len__(self):
         """@return the length of the Context stack """
-        return len(self._stack)
+        return len(self._contexts())
 
     # -- End Protocols -- @}
 
@@ -270,21 +396,35 @@ class ContextStack(with_metaclass(Meta, LazyMixin)):
     # Internal Query Interface
     #
 
+    def _contexts(self):
+        """@return the sequence of contexts to use when querying this stack, bottom first"""
+        return self._stack
+
     def _aggregated_kvstore(self, aggregated_base=None, start_at=0):
         """@return new context as aggregate of all contexts on our stack, bottom up"""
+        kvstore = self._merged_kvstore(self._stack, aggregated_base, start_at)
+        self._num_aggregated_kvstores = len(self._stack)
+        return kvstore
+
+    def _merged_kvstore(self, contexts, aggregated_base=None, start_at=0):
+        """@return a new kvstore with the settings of all given contexts from start_at upwards merged on top 
+        of the given aggregated_base data, which will not be changed"""
         # This delegate makes sure we don't let None values override non-null values
         delegate = StackAutoResolveAdditiveMergeDelegate()
         alg = TwoWayDiff()
 
-        for eid in range(start_at, len(self._stack)):
-            ctx = self._stack[eid]
+        for eid in range(start_at, len(contexts)):
+            ctx = contexts[eid]
             base = delegate.result()
             if base is NoValue:
                 base = aggregated_base or OrderedDict()
             # end setup base
-            alg.diff(delegate, base, ctx.settings()._data())
+            data = ctx.settings()._data()
+            with startup_timing.phase('merge'):
+                alg.diff(delegate, base, data)
+            # end record timing
         # end for each Context
-        self._num_aggregated_kvstores = len(self._stack)
+        startup_timing.count('diff node visits', alg.num_visits())
 
         res = delegate.result()
         if res is NoValue:
@@ -331,11 +471,11 @@ class ContextStack(with_metaclass(Meta, LazyMixin)):
         """
         if until_size > -1:
             # Allow it to have equal size, to make usage easier
-            if until_size > len(self):
+            if until_size > len(self._stack):
                 raise ValueError("can't pop if until_size is larger than our current size")
             # end assure we don't try to 'push'
             res = list()
-            while until_size != len(self):
+            while until_size != len(self._stack):
                 res.append(self.pop())
             # end while there are contexts to pop
         else:
@@ -355,7 +495,7 @@ class ContextStack(with_metaclass(Meta, LazyMixin)):
         """Remove the given context from our stack. It is an error to try removing contexts that are not 
         on the stack
         @return self """
-        self.stack().remove(context)
+        self._stack.remove(context)
         self._mark_rebuild_changed_context()
         return self
 
@@ -364,10 +504,10 @@ class ContextStack(with_metaclass(Meta, LazyMixin)):
         @param position similar to argument in list.insert(position)
         @param context a Context instance
         @return the inserted context"""
-        if position >= len(self):
+        if position >= len(self._stack):
             return self.push(context)
         # end optimize cache
-        self.stack().insert(position, context)
+        self._stack.insert(position, context)
         self._mark_rebuild_changed_context()
         return context
 
@@ -381,6 +521,23 @@ class ContextStack(with_metaclass(Meta, LazyMixin)):
         self._mark_rebuild_changed_context()
         return self
 
+    def copy(self):
+        """@return a new stack of our type with all contexts we currently have, sharing our aggregated settings.
+        Changes to either stack don't affect the other one, but the contexts themselves are shared, and must
+        not be changed."""
+        other = type(self)()
+        kvstore = self.settings()
+        for ctx in self.stack():
+            other.push(ctx)
+        # end for each context
+        other._adopt_settings(kvstore)
+        return other
+
+    def _adopt_settings(self, kvstore):
+        """Use the given kvstore as aggregated settings of all contexts currently on the stack"""
+        self._kvstore = kvstore
+        self._num_aggregated_kvstores = len(self._stack)
+
     # -- End Edit Interface -- @}
 
     # -------------------------
@@ -393,7 +550,7 @@ class ContextStack(with_metaclass(Meta, LazyMixin)):
         interface that should be returned
         """
         res = list()
-        for ctx in reversed(self._stack):
+        for ctx in reversed(self._contexts()):
             res += ctx.types(interface, predicate)
         # end for each context
         return res
@@ -408,7 +565,7 @@ class ContextStack(with_metaclass(Meta, LazyMixin)):
         interface that should be returned
         """
         instances = list()
-        for ctx in reversed(self._stack):
+        for ctx in reversed(self._contexts()):
             instances += ctx.instances(interface, predicate)
             if instances and not find_all:
                 break
@@ -435,7 +592,7 @@ class ContextStack(with_metaclass(Meta, LazyMixin)):
 
     def top(self):
         """@return the Context on the top of stack """
-        return self._stack[-1]
+        return self._contexts()[-1]
 
     def schema_validator(self):
         """@return a KeyValueStoreSchemaValidator instance initialized with all our Context's schemas 
@@ -444,7 +601,7 @@ class ContextStack(with_metaclass(Meta, LazyMixin)):
         client"""
         validator = self.KeyValueStoreValidatorType()
         # bottom up - later contexts override earlier ones
-        for ctx in self._stack:
+        for ctx in self._contexts():
             if hasattr(ctx, 'settings_schema'):
                 schema = ctx.settings_schema()
                 assert isinstance(schema, KeyValueStoreSchema)
@@ -532,9 +689,282 @@ class ContextStack(with_metaclass(Meta, LazyMixin)):
         self._stack[-1].register(plugin)
 
     # -- End Edit Interface -- @}
+
+    # -------------------------
+    # @name Snapshot Interface
+    # @{
+
+    def snapshot_state(self, start_at=0):
+        """@return a picklable dict with the state of all contexts from the given index upwards, along with
+        our aggregated settings. Use it with restore_snapshot_state() to rebuild this stack.
+        @param start_at index of the first context to include. Contexts below it are expected to be on the stack
+        already when the state is restored."""
+        return dict(contexts=[(type(ctx), ctx.snapshot_state()) for ctx in self._stack[start_at:]],
+                    base_settings=[ctx.settings()._data() for ctx in self._stack[:start_at]],
+                    settings=self.settings()._data())
+
+    def restore_snapshot_state(self, state):
+        """Push all contexts stored in the given state, as obtained by snapshot_state(), and restore their plugins.
+        If the contexts on the stack prior to that have the same settings they had when the snapshot was taken,
+        the aggregated settings are restored as well.
+        @return self"""
+        base_settings = [ctx.settings()._data() for ctx in self._stack]
+        for ctx_type, ctx_state in state['contexts']:
+            self.push(ctx_type.from_snapshot_state(ctx_state)).restore_plugins(ctx_state)
+        # end for each context
+
+        if base_settings == state['base_settings']:
+            self._kvstore = self.ContextType.KeyValueStoreModifierType(state['settings'])
+            self._num_aggregated_kvstores = len(self._stack)
+        else:
+            self._mark_rebuild_changed_context()
+        # end handle aggregated settings
+        return self
+
+    # -- End Snapshot Interface -- @}
+
 # end class ContextStack
 
 
+class _StackState(object):
+
+    """An immutable state of a ConcurrentContextStack"""
+    __slots__ = (
+        'contexts',         # tuple of all contexts on the stack
+        'kvstore',          # aggregated settings of the first num_aggregated contexts, or None
+        'num_aggregated'    # amount of contexts aggregated in kvstore
+    )
+
+    def __init__(self, contexts, kvstore=None, num_aggregated=0):
+        self.contexts = contexts
+        self.kvstore = kvstore
+        self.num_aggregated = num_aggregated
+
+# end class _StackState
+
+
+class _StackOverlay(object):
+
+    """A context manager to push a context onto a ConcurrentContextStack, visible only to the calling thread"""
+    __slots__ = ('_stack', '_context')
+
+    def __init__(self, stack, context):
+        self._stack = stack
+        self._context = context
+
+    def __enter__(self):
+        overlays = self._stack._overlays()
+        if self._context in overlays:
+            raise ValueError("context '%s' is an overlay already" % self._context)
+        # end prevent duplicate pushes
+        overlays.append(self._context)
+        return self._context
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._stack._overlays().remove(self._context)
+        return False
+
+# end class _StackOverlay
+
+
+class ConcurrentContextStack(ContextStack):
+
+    """A ContextStack which may be used by multiple threads concurrently.
+
+    All changes to the stack are serialized, and each of them publishes a new immutable state. Queries use 
+    the most recent state without taking a lock. The aggregated settings are computed on first query, 
+    and shared among all threads until the next change.
+
+    Additionally, each thread may put overlay contexts on top of the stack, which are only visible to itself.
+    This allows temporary changes without affecting other threads, or waiting for them:
+
+        ctx = Context('temporary')
+        ctx.settings().set_value('foo', 1)
+        with stack.overlay(ctx):
+            stack.settings()    # includes foo, for this thread only
+
+    Plugins created while a thread has overlays will be registered with its topmost overlay.
+    To use it for an Application, set its ContextStackType accordingly.
+    @note contexts themselves are not protected, and their settings must not be changed once they are on the stack
+    """
+    __slots__ = (
+        '_lock',    # serializes all changes
+        '_state',   # most recent _StackState
+        '_local'    # thread-local storage for overlays and their aggregated settings
+    )
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        super(ConcurrentContextStack, self).__init__()
+
+    # -------------------------
+    # @name Utilities
+    # @{
+
+    def _overlays(self):
+        """@return list of overlay contexts of the current thread, bottom first"""
+        try:
+            return self._local.overlays
+        except AttributeError:
+            self._local.overlays = overlays = list()
+            return overlays
+        # end initialize thread local
+
+    def _publish(self, kvstore=None, num_aggregated=0):
+        """Publish a new state from our current stack. Must be called while holding our lock"""
+        self._state = _StackState(tuple(self._stack), kvstore, num_aggregated)
+
+    def _mark_rebuild_changed_context(self):
+        """Publish a new state without aggregated settings"""
+        self._publish()
+
+    def _contexts(self):
+        """@return the contexts of the most recent state, along with the overlays of the calling thread"""
+        overlays = self._overlays()
+        if overlays:
+            return self._state.contexts + tuple(overlays)
+        # end handle overlays
+        return self._state.contexts
+
+    def _state_kvstore(self, state):
+        """@return the aggregated settings of the given state, which are computed if needed"""
+        if state.num_aggregated == len(state.contexts):
+            return state.kvstore
+        # end use cache
+        kvstore = self._merged_kvstore(state.contexts, state.kvstore and state.kvstore._data(),
+                                       state.num_aggregated)
+        # Caching is optional - never wait for a writer
+        if self._lock.acquire(False):
+            try:
+                if self._state is state:
+                    self._publish(kvstore, len(state.contexts))
+                # end publish only if there was no change in the meanwhile
+            finally:
+                self._lock.release()
+            # end assure lock is released
+        # end cache result
+        return kvstore
+
+    def _adopt_settings(self, kvstore):
+        """Publish a new state using the given kvstore as aggregated settings"""
+        self._lock.acquire()
+        try:
+            self._publish(kvstore, len(self._stack))
+        finally:
+            self._lock.release()
+        # end assure lock is released
+
+    # -- End Utilities -- @}
+
+    # -------------------------
+    # @name Edit Interface
+    # @{
+
+    def push(self, context):
+        """Push the given context, keeping the aggregated settings of the previous state"""
+        self._lock.acquire()
+        try:
+            state = self._state
+            context = super(ConcurrentContextStack, self).push(context)
+            self._publish(state.kvstore, state.num_aggregated)
+        finally:
+            self._lock.release()
+        # end assure lock is released
+        return context
+
+    def pop(self, until_size=-1):
+        self._lock.acquire()
+        try:
+            return super(ConcurrentContextStack, self).pop(until_size)
+        finally:
+            self._lock.release()
+        # end assure lock is released
+
+    def remove(self, context):
+        self._lock.acquire()
+        try:
+            return super(ConcurrentContextStack, self).remove(context)
+        finally:
+            self._lock.release()
+        # end assure lock is released
+
+    def insert(self, position, context):
+        self._lock.acquire()
+        try:
+            return super(ConcurrentContextStack, self).insert(position, context)
+        finally:
+            self._lock.release()
+        # end assure lock is released
+
+    def reset(self):
+        self._lock.acquire()
+        try:
+            return super(ConcurrentContextStack, self).reset()
+        finally:
+            self._lock.release()
+        # end assure lock is released
+
+    def register(self, plugin):
+        """Register the plugin with the topmost overlay of the calling thread, or with the top of the stack"""
+        overlays = self._overlays()
+        if overlays:
+            return overlays[-1].register(plugin)
+        # end handle overlays
+        self._lock.acquire()
+        try:
+            return super(ConcurrentContextStack, self).register(plugin)
+        finally:
+            self._lock.release()
+        # end assure lock is released
+
+    def overlay(self, context):
+        """@return a context manager which puts the given context on top of the stack while it is active,
+        visible only to the calling thread. Overlays may be nested.
+        @param context a Context instance, or a name for a new Context of our ContextType"""
+        if not isinstance(context, Context):
+            context = self.ContextType(context)
+        # end handle names
+        return _StackOverlay(self, context)
+
+    # -- End Edit Interface -- @}
+
+    # -------------------------
+    # @name Query Interface
+    # @{
+
+    def settings(self):
+        """@return aggregated settings of the most recent state and the overlays of the calling thread
+        @note the returned instance is shared, and must be considered read-only"""
+        state = self._state
+        overlays = tuple(self._overlays())
+        if not (state.contexts or overlays):
+            return self.ContextType.KeyValueStoreModifierType(dict())
+        # end handle empty stack
+
+        kvstore = state.contexts and self._state_kvstore(state) or None
+        if not overlays:
+            return kvstore
+        # end handle no overlays
+
+        cache = getattr(self._local, 'settings', None)
+        if cache is not None and cache[0] is kvstore and cache[1] == overlays:
+            return cache[2]
+        # end use thread-local cache
+        res = self._merged_kvstore(overlays, kvstore and kvstore._data())
+        self._local.settings = (kvstore, overlays, res)
+        return res
+
+    def stack(self):
+        """@return a new list with all contexts visible to the calling thread
+        @note changes to it have no effect"""
+        return list(self._contexts())
+
+    # -- End Query Interface -- @}
+
+# end class ConcurrentContextStack
+
+
 # ==============================================================================
 # @name Utilities
 # ------------------------------------------------------------------------------
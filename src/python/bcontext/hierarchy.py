@@ -18,10 +18,14 @@ from butility import (LazyMixin,
                       int_bits,
                       Path,
                       load_files,
+                      find_loadable_files,
+                      parallel_map,
+                      startup_timing,
                       tagged_file_paths,
                       OrderedDict)
 from bkvstore import YAMLKeyValueStoreModifier
 from .base import Context
+from .utility import LazyPlugin
 
 log = logging.getLogger(__name__)
 
@@ -43,6 +47,8 @@ class HierarchicalContext(Context, LazyMixin):
         '_config_dirs',  # Cache for all located configuration directories
         '_config_files',  # All files we have loaded so far, in loading-order
         '_additional_config_files',  # Files provided by the caller, they will be added on top
+        '_plugin_dirs',  # Directories we searched for plugins
+        '_plugin_manifest'  # list of (path, interface_names) tuples of all plugin files we loaded, in order
     )
 
     # -------------------------
@@ -95,9 +101,13 @@ class HierarchicalContext(Context, LazyMixin):
         # end assure correct type
 
         self._additional_config_files = config_files
+        self._plugin_dirs = list()
+        self._plugin_manifest = list()
 
         if traverse_settings_hierarchy:
-            self._config_dirs = self._traverse_config_trees()
+            with startup_timing.phase('config discovery'):
+                self._config_dirs = self._traverse_config_trees()
+            # end record timing
         else:
             self._config_dirs = list()
 
@@ -120,7 +130,9 @@ class HierarchicalContext(Context, LazyMixin):
         if name == '_kvstore':
             self._load_configuration()
         elif name == '_config_files':
-            self._config_files = self._find_config_files()
+            with startup_timing.phase('config discovery'):
+                self._config_files = self._find_config_files()
+            # end record timing
         else:
             return super(HierarchicalContext, self)._set_cache_(name)
         # end handle name
@@ -234,7 +246,55 @@ class HierarchicalContext(Context, LazyMixin):
         nothing was loaded yet"""
         return self._config_files
 
-    def load_plugins(self, recurse=False, subdirectory='plug-ins'):
+    def _load_plugins(self, recurse, subdirectory, lazy):
+        """Implements load_plugins()"""
+        paths = list()
+        for path in self._filter_trees(self.config_trees()):
+            if subdirectory is not None:
+                path /= subdirectory
+            # end amend plugin dir
+            paths.append(path)
+        # end for each tree
+        self._plugin_dirs.extend(paths)
+
+        py_files = find_loadable_files(paths, recurse=recurse)
+        if lazy:
+            lazy_plugins = parallel_map(LazyPlugin.from_file, py_files)
+        else:
+            lazy_plugins = [None] * len(py_files)
+        # end handle eager loading
+
+        manifest = list()
+        for py_file, lazy_plugin in zip(py_files, lazy_plugins):
+            manifest.append((py_file, lazy_plugin and lazy_plugin.interface_names()))
+        # end for each file
+        self._load_plugin_manifest(manifest)
+
+    def _load_plugin_manifest(self, manifest):
+        """Load all plugin files in the given manifest, or register them as LazyPlugin if they declared the
+        interfaces they provide
+        @param manifest list of (path, interface_names) tuples, where interface_names is None for files that
+        need to be loaded right away"""
+        # Files which need loading are loaded in batches, to keep the registration order intact
+        batch = list()
+        for py_file, interface_names in manifest:
+            self._plugin_manifest.append((py_file, interface_names))
+            if interface_names is None:
+                batch.append(py_file)
+                continue
+            # end handle eager files
+            if batch:
+                load_files(batch)
+                del batch[:]
+            # end flush batch
+            self.register(LazyPlugin(py_file, interface_names))
+            log.debug("registered lazy plugin at '%s' providing %s", py_file, ', '.join(interface_names))
+        # end for each file
+        if batch:
+            load_files(batch)
+        # end handle remaining files
+
+    def load_plugins(self, recurse=False, subdirectory='plug-ins', lazy=True):
         """Call this method explicitly once this instance was pushed onto the top of the context stack.
         This assures that new instances are properly registered with this Context, and not the previous one
         on the stack
@@ -242,15 +302,81 @@ class HierarchicalContext(Context, LazyMixin):
         plugin directory
         @param subdirectory an optional name of the subdirectory within each configuration directory which 
         is supposed to contain plugin files. If None, the configuration directory itself is used.
+        @param lazy if True, plugin files declaring the interfaces they provide will only be registered as
+        LazyPlugin, to be loaded once one of their interfaces is requested. All other files are loaded right away.
         @note plugins should be loaded only AFTER this environment was pushed onto the stack. Otherwise
-        loaded plugins will end up in the previous environment, not in this one"""
-        for path in self._filter_trees(self.config_trees()):
-            if subdirectory is not None:
-                path /= subdirectory
-            # end amend plugin dir
-            load_files(path, recurse=recurse)
-        # end load all plugins
+        loaded plugins will end up in the previous environment, not in this one
+        @note all plugin files of all trees are gathered first to allow them to be read concurrently. They are
+        executed in tree order though."""
+        with startup_timing.phase('plugin load'):
+            self._load_plugins(recurse, subdirectory, lazy)
+        # end record timing
 
     # -- End Interface -- @}
 
+    # -------------------------
+    # @name Snapshot Interface
+    # @{
+
+    def snapshot_state(self):
+        """@return our state, including the plugin files we loaded"""
+        state = super(HierarchicalContext, self).snapshot_state()
+        state.update(trees=self._trees,
+                     config_dirs=self._config_dirs,
+                     config_files=self.config_files(),
+                     additional_config_files=self._additional_config_files,
+                     plugin_dirs=self._plugin_dirs,
+                     plugin_manifest=self._plugin_manifest)
+        return state
+
+    @classmethod
+    def from_snapshot_state(cls, state):
+        """@return a new instance, without searching for configuration directories or files"""
+        inst = super(HierarchicalContext, cls).from_snapshot_state(state)
+        inst._trees = list(state['trees'])
+        inst._config_dirs = list(state['config_dirs'])
+        inst._config_files = tuple(state['config_files'])
+        inst._additional_config_files = state['additional_config_files']
+        inst._plugin_dirs = list(state['plugin_dirs'])
+        inst._plugin_manifest = list()
+        return inst
+
+    def restore_plugins(self, state):
+        """Load or register the same plugin files we did when the snapshot was taken, without searching
+        plugin directories or reading files to find their interface declarations
+        @return self"""
+        self._load_plugin_manifest(state['plugin_manifest'])
+        return self
+
+    def snapshot_dependencies(self):
+        """@return all possible configuration directories of our trees and their parent directories, whether
+        they exist or not, as well as all configuration and plugin directories and files. Changes to directories
+        are detected as long as they change their modification time, which is the case if entries are added
+        or removed."""
+        paths = list()
+        for tree in self._trees:
+            tree = tree.abspath()
+            if tree.endswith(self.config_dir_name):
+                paths.append(tree)
+            # end handle configuration directories
+            while True:
+                paths.append(tree / self.config_dir_name)
+                parent = tree.dirname()
+                if parent == tree:
+                    break
+                # end stop at root
+                tree = parent
+            # end for each parent directory
+        # end for each tree
+        paths.extend(self._config_dirs)
+        paths.extend(path for path in self.config_files() if not hasattr(path, 'read'))
+        paths.extend(self._plugin_dirs)
+        for py_file, _ in self._plugin_manifest:
+            paths.append(py_file)
+            paths.append(Path(py_file).dirname())
+        # end for each plugin file
+        return paths
+
+    # -- End Snapshot Interface -- @}
+
 # end class HierarchicalContext
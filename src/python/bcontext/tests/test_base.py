@@ -12,8 +12,12 @@ from __future__ import unicode_literals
 from butility.future import str
 __all__ = []
 
+import sys
+import threading
+
 from butility import (Interface,
                       abstractmethod)
+from butility.tests import with_rw_directory
 
 from .base import TestContext
 
@@ -21,6 +25,39 @@ from bkvstore import KeyValueStoreModifier
 from bcontext import *
 
 
+# ==============================================================================
+# @name Lazy Plugin Utilities
+# ------------------------------------------------------------------------------
+# Plugin files written by the tests refer to these
+# @{
+
+lazy_stack = ContextStack()
+
+# module names of lazily loaded plugin files, once per execution
+lazy_executions = list()
+
+
+class ILazy(Interface):
+    __slots__ = ()
+
+# end class ILazy
+
+
+class IUnrelated(Interface):
+    __slots__ = ()
+
+# end class IUnrelated
+
+
+class LazyPluginBase(Plugin):
+    __slots__ = ()
+    _stack_ = lazy_stack
+
+# end class LazyPluginBase
+
+# -- End Lazy Plugin Utilities -- @}
+
+
 class TestPlugin(TestContext):
 
     def test_context(self):
@@ -137,6 +174,50 @@ class TestPlugin(TestContext):
         kvd = stack.settings().data()
         assert kvd.to_dict() == kv1.data()
 
+    def test_concurrent_stack(self):
+        """verify overlays are visible to their thread only, while changes are visible to everyone"""
+        stack = ConcurrentContextStack()
+        base = stack.push('base')
+        base.settings().set_value('value', 1)
+        assert stack.settings().value('value', 0) == 1
+
+        overlay = Context('overlay')
+        overlay.settings().set_value('value', 2)
+        seen = list()
+
+        def read_settings():
+            seen.append((stack.settings().value('value', 0), len(stack), stack.top() is base))
+        # end reader
+
+        with stack.overlay(overlay) as ctx:
+            assert ctx is overlay
+            assert stack.settings().value('value', 0) == 2
+            assert stack.top() is overlay and len(stack) == 2
+            self.failUnlessRaises(ValueError, stack.overlay(overlay).__enter__)
+
+            thread = threading.Thread(target=read_settings)
+            thread.start()
+            thread.join()
+            assert seen == [(1, 1, True)], "overlays must not be visible to other threads"
+
+            plugin = object()
+            stack.register(plugin)
+            assert plugin in overlay._registry and plugin not in base._registry
+
+            # changes by other threads are visible right away, below the overlays
+            thread = threading.Thread(target=stack.push, args=('pushed',))
+            thread.start()
+            thread.join()
+            assert len(stack) == 3 and stack.top() is overlay
+            assert stack.stack()[1].name() == 'pushed'
+            assert stack.settings().value('value', 0) == 2
+        # end overlay
+
+        assert len(stack) == 2 and stack.top().name() == 'pushed'
+        assert stack.settings().value('value', 0) == 1
+        stack.pop()
+        assert stack.settings().value('value', 0) == 1
+
     def test_plugin(self):
         """verify plugin type registration works"""
         stack = ContextStack()
@@ -187,4 +268,55 @@ class TestPlugin(TestContext):
         assert len(res) == 1
         assert stack.instances(PluginType) == res, "new instance should have been kept in context"
 
+    @with_rw_directory
+    def test_lazy_plugin(self, rw_dir):
+        """verify plugins are loaded on first use if they declare their interfaces"""
+        plugin_dir = rw_dir / 'etc' / 'plug-ins'
+        plugin_dir.makedirs()
+        header = "from bcontext.tests.test_base import (ILazy, LazyPluginBase)\n"
+        (plugin_dir / 'a_lazy.py').write_text("# bcontext-provides: bcontext.tests.test_base.ILazy\n" + header +
+                                              "class LazyType(ILazy, LazyPluginBase):\n    pass\n")
+        (plugin_dir / 'b_eager.py').write_text(header + "class EagerType(ILazy, LazyPluginBase):\n    pass\n")
+        manifest = "# bcontext-provides: bcontext.tests.test_base.ILazy\n"
+        (plugin_dir / 'c_reentrant.py').write_text(manifest + header +
+                                                   "from bcontext.tests.test_base import (lazy_stack, lazy_executions)\n"
+                                                   "lazy_executions.append(__name__)\n"
+                                                   "lazy_stack.types(ILazy)\n"
+                                                   "class ReentrantType(ILazy, LazyPluginBase):\n    pass\n")
+        (plugin_dir / 'd_broken.py').write_text(manifest + "raise ValueError('broken')\n")
+
+        assert LazyPlugin.from_file(plugin_dir / 'b_eager.py') is None
+        lazy_plugin = LazyPlugin.from_file(plugin_dir / 'a_lazy.py')
+        assert lazy_plugin.module_name() == 'a_lazy'
+        assert lazy_plugin.provides(ILazy) and lazy_plugin.provides(Interface) and lazy_plugin.provides(object)
+        assert not lazy_plugin.provides(IUnrelated)
+
+        lazy_stack.push('base')
+        ctx = lazy_stack.push(HierarchicalContext(rw_dir))
+        try:
+            ctx.load_plugins()
+            lazy_stack.push('top')
+            assert 'b_eager' in sys.modules and 'a_lazy' not in sys.modules
+            assert len(lazy_stack.types(IUnrelated)) == 0
+            assert 'a_lazy' not in sys.modules, "unrelated interfaces don't cause loading"
+
+            types = lazy_stack.types(ILazy)
+            assert 'a_lazy' in sys.modules
+            assert [t.__name__ for t in types] == ['ReentrantType', 'EagerType', 'LazyType'], \
+                "registration order is kept"
+            assert lazy_stack.top().types(object) == [], "types are registered with the owning context"
+            assert len(ctx.types(ILazy)) == 3
+            assert lazy_executions == ['c_reentrant'], "files querying their own interface are loaded once"
+
+            broken = [item for item in ctx._registry if isinstance(item, LazyPlugin)]
+            assert len(broken) == 1 and isinstance(broken[0].error(), ValueError), "failures are kept"
+            assert not broken[0].is_loadable() and 'broken' in repr(broken[0])
+        finally:
+            lazy_stack.reset()
+            del lazy_executions[:]
+            for name in ('a_lazy', 'b_eager', 'c_reentrant', 'd_broken'):
+                sys.modules.pop(name, None)
+            # end for each module to remove
+        # end cleanup
+
 # end class TestPlugin
@@ -9,12 +9,19 @@
 from __future__ import unicode_literals
 
 from butility.future import with_metaclass
-__all__ = ['PluginMeta', 'Plugin']
+__all__ = ['PluginMeta', 'Plugin', 'LazyPlugin', 'redirect_registration']
 
+import os
+import re
+import sys
+import logging
+import threading
 from itertools import chain
 
 from butility import Meta
 
+log = logging.getLogger(__name__)
+
 
 # ==============================================================================
 # @name Plugin Handling
@@ -23,6 +30,49 @@ from butility import Meta
 # @{
 
 
+# Keeps a per-thread stack of objects supporting register(plugin), which are used instead of a Plugin's stack
+_registration_targets = threading.local()
+
+
+def _register(plugin_type, plugin):
+    """Register the given plugin type or instance with the current registration target, or with the stack of
+    the given plugin type
+    @return plugin"""
+    targets = getattr(_registration_targets, 'stack', None)
+    if targets:
+        return targets[-1].register(plugin)
+    # end handle redirection
+    return plugin_type._stack().register(plugin)
+
+
+class redirect_registration(object):
+
+    """A context manager to make all Plugin types and instances created in the current thread register with
+    the given target, instead of their stack
+
+    with redirect_registration(context):
+        load_file(path, name)
+    """
+    __slots__ = ('_target')
+
+    def __init__(self, target):
+        """@param target an object supporting register(plugin), like a Context"""
+        self._target = target
+
+    def __enter__(self):
+        if not hasattr(_registration_targets, 'stack'):
+            _registration_targets.stack = list()
+        # end initialize thread local
+        _registration_targets.stack.append(self._target)
+        return self._target
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        _registration_targets.stack.pop()
+        return False
+
+# end class redirect_registration
+
+
 # inherits from InterfaceMeta to support inheritance in the implements() function
 class PluginMeta(Meta):
 
@@ -50,7 +100,7 @@ class PluginMeta(Meta):
             # Therefore, direct Plugin bases are assumed to be the base of the type we would be interested in
             # Which also shouldn't ever get into the registry
             if original_plugin_type is not plugin_base:
-                plugin_base._stack().register(new_type)
+                _register(plugin_base, new_type)
             # end handle type registration
         # end handle Plugin instantiation
 
@@ -87,7 +137,7 @@ class Plugin(with_metaclass(PluginMeta, object)):
             Context for all our instances """
         self = super(Plugin, cls).__new__(cls)
         if cls._auto_register_instance_:
-            cls._stack().register(self)
+            _register(cls, self)
         # end handle registration
         return self
 
@@ -122,4 +172,166 @@ class Plugin(with_metaclass(PluginMeta, object)):
 
 # end class Plugin
 
+
+class LazyPlugin(object):
+
+    """A proxy for a plugin file which wasn't loaded yet. It knows the interfaces the plugins in the file 
+    provide, which allows a Context to load the file only when one of these interfaces is requested.
+
+    Plugin files declare their interfaces with one or more comments at the beginning of the file, each of which
+    may list multiple fully qualified names of interfaces, separated by commas
+
+        # bcontext-provides: bapp.interfaces.IProjectService, mypackage.IFoo
+
+    Files without such a declaration are not suitable for lazy loading.
+
+    While its file is loaded, the proxy is marked as loading, so queries made by the file itself don't load
+    it again. If loading fails, the proxy stays in place and keeps the error, see error().
+    """
+    __slots__ = (
+        '_path',            # path to the plugin file
+        '_module_name',     # name of the module to load the file into
+        '_interface_names',  # fully qualified names of provided interfaces
+        '_interfaces',      # resolved interface types, or None
+        '_loading',         # True while our file is loaded
+        '_error'            # the exception raised when loading our file, or None
+    )
+
+    # -------------------------
+    # @name Configuration
+    # @{
+
+    # Matches a manifest line
+    manifest_regex = re.compile(r'^#\s*bcontext-provides:\s*(.+?)\s*$')
+
+    # Amount of bytes we read from the beginning of a file to find the manifest
+    manifest_read_size = 4096
+
+    # -- End Configuration -- @}
+
+    def __init__(self, path, interface_names, module_name=None):
+        """Initialize this instance
+        @param path to the plugin file
+        @param interface_names a list of fully qualified names of interfaces provided by plugins in the file
+        @param module_name name of the module to load the file into. Defaults to the file's name without 
+        extension, similar to load_files()"""
+        self._path = path
+        self._interface_names = list(interface_names)
+        self._module_name = module_name or os.path.splitext(os.path.basename(path))[0]
+        self._interfaces = None
+        self._loading = False
+        self._error = None
+
+    def __repr__(self):
+        if self._error is not None:
+            return "%s('%s', %s, error=%r)" % (type(self).__name__, self._path, self._interface_names, self._error)
+        # end show failures
+        return "%s('%s', %s)" % (type(self).__name__, self._path, self._interface_names)
+
+    # -------------------------
+    # @name Utilities
+    # @{
+
+    def _resolved_interfaces(self):
+        """@return a list of interface types, or None if at least one of them couldn't be imported"""
+        if self._interfaces is None:
+            interfaces = list()
+            for name in self._interface_names:
+                module_name, _, type_name = name.rpartition('.')
+                try:
+                    __import__(module_name)
+                    interfaces.append(getattr(sys.modules[module_name], type_name))
+                except (ImportError, AttributeError, KeyError, ValueError):
+                    log.warn("Could not import interface '%s' declared by plugin at '%s' - it will be loaded "
+                             "on the next query", name, self._path)
+                    return None
+                # end handle import errors
+            # end for each interface name
+            self._interfaces = interfaces
+        # end resolve interfaces once
+        return self._interfaces
+
+    # -- End Utilities -- @}
+
+    # -------------------------
+    # @name Interface
+    # @{
+
+    @classmethod
+    def from_file(cls, path):
+        """@return a new LazyPlugin instance for the given plugin file, or None if it doesn't declare the 
+        interfaces it provides, or if it can't be read"""
+        names = list()
+        try:
+            with open(path, 'rb') as fp:
+                head = fp.read(cls.manifest_read_size).decode('utf-8', 'replace')
+            # end assure file is closed
+        except (IOError, OSError):
+            return None
+        # end let the actual loader deal with unreadable files
+        for line in head.splitlines():
+            match = cls.manifest_regex.match(line)
+            if match:
+                names.extend(name.strip() for name in match.group(1).split(',') if name.strip())
+            # end handle manifest line
+        # end for each line
+        if not names:
+            return None
+        # end handle file without manifest
+        return cls(path, names)
+
+    def provides(self, interface):
+        """@return True if the plugins in our file may implement the given interface.
+        @note if our declared interfaces cannot be resolved, we always claim to provide the interface"""
+        if interface is object:
+            return True
+        # end everything is an object
+        interfaces = self._resolved_interfaces()
+        if interfaces is None:
+            return True
+        # end be conservative
+        for declared in interfaces:
+            if issubclass(declared, interface):
+                return True
+            # end check match
+        # end for each declared interface
+        return False
+
+    def path(self):
+        """@return path to our plugin file"""
+        return self._path
+
+    def module_name(self):
+        """@return name of the module our file will be loaded into"""
+        return self._module_name
+
+    def interface_names(self):
+        """@return list of fully qualified names of the interfaces we provide"""
+        return self._interface_names
+
+    def is_loadable(self):
+        """@return True if our file should be loaded, which is the case unless it is loaded right now, 
+        or failed to load"""
+        return not self._loading and self._error is None
+
+    def set_loading(self, loading):
+        """Mark our file as being loaded if loading is True
+        @return self"""
+        self._loading = loading
+        return self
+
+    def error(self):
+        """@return the exception raised when loading our file, or None if it didn't fail"""
+        return self._error
+
+    def set_error(self, error):
+        """Keep the given exception which was raised when loading our file, which won't be loaded again
+        @return self"""
+        self._error = error
+        return self
+
+    # -- End Interface -- @}
+
+# end class LazyPlugin
+
 # -- End Plugin Handling -- @}
@@ -26,7 +26,10 @@ class TwoWayDiff(object):
     @note the algorithm works in an unordered fashion, such that additions and deletion events will be send
     in a particular order determined by the code, and not by the underlying data. This means that after a merge,
     your order of keys might be different"""
-    __slots__ = ()
+    __slots__ = ('_num_visits')  # amount of nodes visited by diff() so far
+
+    def __init__(self):
+        self._num_visits = 0
 
     # -------------------------
     # @name Interface
@@ -56,6 +59,7 @@ class TwoWayDiff(object):
         For subsequent invocations, the actual key will be used accordingly.
         The caller should not change this value.
         @return this instance"""
+        self._num_visits += 1
         l_is_tree = delegate.is_tree(left)
         r_is_tree = delegate.is_tree(right)
         l_keys = r_keys = tuple()
@@ -112,6 +116,11 @@ class TwoWayDiff(object):
         # end handle item type
         return self
 
+    def num_visits(self):
+        """@return the amount of nodes visited by all calls to diff() so far, which is a measure for the 
+        work done by this instance"""
+        return self._num_visits
+
     # -- End Interface -- @}
 
     # -------------------------
@@ -22,6 +22,7 @@ from bdiff import (ApplyDifferenceMergeDelegate,
                    merge_data)
 
 from butility import (OrderedDict,
+                      startup_timing,
                       smart_deepcopy)
 
 from .diff import (KeyValueStoreProviderDiffDelegate,
@@ -168,7 +169,11 @@ class KeyValueStoreProvider(object):
         # end handle resolver
 
         delegate = self.DiffProviderDelegateType(*args)
-        self.TwoWayDiffAlgorithmType().diff(delegate, value, default)
+        with startup_timing.phase('schema validation'):
+            alg = self.TwoWayDiffAlgorithmType()
+            alg.diff(delegate, value, default)
+            startup_timing.count('diff node visits', alg.num_visits())
+        # end record timing
 
         value = delegate.result()
         if value is NoValue:
@@ -22,6 +22,7 @@ from butility import (Path,
                       Interface,
                       login_name,
                       abstractmethod,
+                      startup_timing,
                       DEFAULT_ENCODING)
 
 from butility.compat import (pickle,
@@ -192,6 +193,7 @@ class _SerializingKeyValueStoreModifierMixin(object):
                 # end open stream as needed
 
                 data = stream.read()
+                startup_timing.count('files read').count('bytes read', len(data))
                 use_cache = self._use_cache()
                 if use_cache:
                     cache_file = cache_base / \
@@ -237,11 +239,15 @@ class _SerializingKeyValueStoreModifierMixin(object):
             if base is NoValue:
                 base = self.KeyValueStoreModifierDiffDelegateType.DictType()
             # end set base
-            self.TwoWayDiffAlgorithmType().diff(delegate, base, data)
+            alg = self.TwoWayDiffAlgorithmType()
+            alg.diff(delegate, base, data)
+            startup_timing.count('diff node visits', alg.num_visits())
         # end load_and_merge_safely
-        for path_or_stream in self._input_paths:
-            load_and_merge_safely(path_or_stream)
-        # end for each input path
+        with startup_timing.phase('file parse'):
+            for path_or_stream in self._input_paths:
+                load_and_merge_safely(path_or_stream)
+            # end for each input path
+        # end record timing
 
         # tell our base class to non-destructively update with the new data
         res = delegate.result()
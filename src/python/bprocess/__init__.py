@@ -20,3 +20,4 @@ from .schema import *
 from .components import *
 from .app import *
 from .utility import *
+from .forkserver import *
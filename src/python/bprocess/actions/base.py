@@ -10,6 +10,8 @@ from __future__ import unicode_literals
 
 __all__ = ['ActionDelegateMixin', 'PackageAction']
 
+import logging
+
 import bapp
 from btransaction import (Transaction,
                           Operation)
@@ -124,6 +126,10 @@ class ActionDelegateMixin(object):
     name = "ProcessControllerTransaction"
     TransactionType = Transaction
 
+    # The maximum amount of actions to apply concurrently, if they don't depend on each other.
+    # See btransaction.Operation.resource_keys()
+    transaction_max_workers = 4
+
     # -- End Configuration -- @}
 
     def __init__(self):
@@ -137,7 +143,8 @@ class ActionDelegateMixin(object):
         """@return a transaction instance
         @!note it will always be the same one after the first call"""
         if self._transaction is None:
-            self._transaction = self.TransactionType(service(bapp.ILog).new(self.name))
+            self._transaction = self.TransactionType(logging.getLogger(self.name),
+                                                     max_workers=self.transaction_max_workers)
         # end initialize transaction
         return self._transaction
 
@@ -7,90 +7,211 @@
 @copyright [GNU Lesser General Public License](https://www.gnu.org/licenses/lgpl.html)
 """
 from __future__ import unicode_literals
-__all__ = ['CopyAction']
+__all__ = ['CopyAction', 'copy_file']
+
+import os
+import hashlib
+import threading
 
 import bapp
 from bkvstore import PathList
-from butility import Path
+from butility import (Path,
+                      parallel_map,
+                      copy_file)
 
 from .base import PackageAction
 
 
 class CopyAction(PackageAction, bapp.plugin_type()):
 
-    """An action to copy a single file to a folder"""
+    """An action to copy files and directory trees.
+
+    A single source file is copied to the destination path, unless it is an existing directory or ends with a
+    slash. Otherwise, all sources are copied into the destination directory, directories along with all their
+    contents.
+    Files whose destination has the same size and modification time, or the same content, are not copied again.
+    """
     __slots__ = (
-        # True if we wrote the file to the folder
-        '_wrote_destination_file',
-        # True if we created the destination directory in the process
-        '_wrote_destination_dir'
+        # paths to all files we wrote
+        '_written_files',
+        # paths to all directories we created, in order of creation
+        '_created_directories',
+        # to serialize changes to our lists
+        '_lock'
     )
 
     action_schema = {
         'source': PathList,
-        'destination': Path
+        'destination': Path,
+        # The amount of files to copy concurrently
+        'max_workers': 4,
+        # The amount of bytes to copy at once
+        'chunk_size': 1024 * 1024,
+        # If True, files of the same size whose modification time differs are compared by content before copying
+        'compare_content': True
     }
 
     type_name = 'copy'
 
-    description = 'copy single files'
+    description = 'copy files and directories'
 
     def __init__(self, *args):
         super(CopyAction, self).__init__(*args)
-        self._wrote_destination_file = False
-        self._wrote_destination_dir = False
+        self._written_files = list()
+        self._created_directories = list()
+        self._lock = threading.Lock()
 
     # -------------------------
     # @name Utilities
     # @{
 
-    # -- End Utilities -- @}
-
-    def apply(self):
-        if self._dry_run():
-            return
-
+    def _destination_is_directory(self):
+        """@return True if our sources are to be copied into the destination directory"""
         data = self.action_data
+        return (len(data.source) != 1 or data.source[0].isdir() or data.destination.isdir() or
+                data.destination.endswith('/') or data.destination.endswith(os.sep))
 
-        assert not data.destination.isdir(
-        ), "Destination at %s is a directory, which cannot currently be handled for file-copying" % data.destination
+    def _copies(self):
+        """@return tuple(directories, copies) of a list of all destination directories, parents first, and a list
+        of (source, destination) tuples of all files to copy
+        @throw EnvironmentError if a source doesn't exist"""
+        data = self.action_data
+        destination = Path(data.destination.rstrip('/' + os.sep) or data.destination)
+        if not self._destination_is_directory():
+            return [destination.dirname()], [(data.source[0], destination)]
+        # end handle single file
+
+        directories = [destination]
+        copies = list()
+        for source in data.source:
+            if source.isfile():
+                copies.append((source, destination / source.basename()))
+            elif source.isdir():
+                for root, dirs, files in os.walk(source, followlinks=True):
+                    dirs.sort()
+                    root = Path(root)
+                    destination_root = destination / source.basename() / os.path.relpath(root, source)
+                    directories.append(destination_root.normpath())
+                    for name in sorted(files):
+                        copies.append((root / name, (destination_root / name).normpath()))
+                    # end for each file
+                # end for each directory
+            else:
+                raise EnvironmentError("Cannot copy '%s' as it doesn't exist" % source)
+            # end handle source type
+        # end for each source
+        return directories, copies
+
+    def _make_directory(self, directory):
+        """Create the given directory and all missing parents, and remember which ones we created"""
+        missing = list()
+        while not directory.isdir():
+            missing.append(directory)
+            directory = directory.dirname()
+        # end while directory is missing
+        for directory in reversed(missing):
+            try:
+                directory.mkdir()
+            except OSError:
+                # another action may have created it concurrently
+                if not directory.isdir():
+                    raise
+                continue
+            # end handle concurrent creation
+            self._created_directories.append(directory)
+        # end for each directory to create
+
+    def _is_uptodate(self, source, destination):
+        """@return True if the destination has the size and modification time of the source, or the same content.
+        In the latter case, its modification time is adjusted to allow a quicker check next time"""
+        try:
+            destination_stat = os.stat(destination)
+        except OSError:
+            return False
+        # end handle missing destination
+        source_stat = os.stat(source)
+        if source_stat.st_size != destination_stat.st_size:
+            return False
+        # end handle size change
+        if int(source_stat.st_mtime) == int(destination_stat.st_mtime):
+            return True
+        # end handle same modification time
+        if not self.action_data.compare_content:
+            return False
+        # end handle content comparison
+
+        chunk_size = self.action_data.chunk_size
+        digests = list()
+        for path in (source, destination):
+            sha = hashlib.sha1()
+            with open(path, 'rb') as fp:
+                for chunk in iter(lambda: fp.read(chunk_size), b''):
+                    sha.update(chunk)
+                # end for each chunk
+            # end assure file is closed
+            digests.append(sha.digest())
+        # end for each path
+        if digests[0] != digests[1]:
+            return False
+        # end handle changed content
+        os.utime(destination, (destination_stat.st_atime, source_stat.st_mtime))
+        return True
+
+    def _copy(self, item):
+        """Copy the given (source, destination) tuple unless the destination is up-to-date"""
+        source, destination = item
+        self._abort_point()
+        if self._is_uptodate(source, destination):
+            self.log.debug("Skipping '%s' as '%s' is up-to-date", source, destination)
+            return
+        # end handle up-to-date files
+        self.log.info("Copying '%s' to '%s'", source, destination)
+        with self._lock:
+            self._written_files.append(destination)
+        # end with lock
+        copy_file(source, destination, self.action_data.chunk_size)
 
-        assert not data.destination.endswith('/'), "Destination can currently only be treated as file"
+    # -- End Utilities -- @}
 
-        # create directories if required
-        dest_dir = data.destination.dirname()
-        if not dest_dir.isdir():
-            dest_dir.makedirs()
-            self._wrote_destination_dir = True
-        # END assure destination dir exists
+    def resource_keys(self):
+        """@return the paths we read and write, which allows copies of different files to run concurrently.
+        A destination directory that doesn't exist yet is one of them, as the copy which creates it has to
+        remove it on rollback"""
+        data = self.action_data
+        paths = list(data.source) + [data.destination]
+        if not data.destination.dirname().isdir():
+            paths.append(data.destination.dirname())
+        # end handle directories to create
+        return [path.abspath() for path in paths]
 
-        assert len(data.source) == 1, "Can currently only copy a single file !"
-        source = data.source[0]
+    def apply(self):
+        directories, copies = self._copies()
+        if self._dry_run():
+            return
+        # end simulate only
 
-        self.log.info("Copying '%s' to '%s'" % (source, data.destination))
-        source.copy(data.destination)
-        self._wrote_destination_file = True
+        for directory in directories:
+            self._make_directory(directory)
+        # end for each directory
+        parallel_map(self._copy, copies, max_workers=self.action_data.max_workers)
 
     def rollback(self):
-        data = self.action_data
-        if self._wrote_destination_file and data.destination.isfile():
-            self.log.info("Removing previously copied destination file: %s", data.destination)
-            data.destination.remove()
-            self._wrote_destination_file = False
-        # END handle destination
-
-        if self._wrote_destination_dir:
+        for path in reversed(self._written_files):
+            if path.isfile():
+                self.log.info("Removing previously copied destination file: %s", path)
+                path.remove()
+            # end handle file
+        # END for each written file
+        del self._written_files[:]
+
+        for directory in reversed(self._created_directories):
             try:
-                dirname = data.destination.dirname()
-                while True:
-                    dirname.rmdir()
-                    self.log.info("Removed empty directory: %s", dirname)
-                    dirname = dirname.dirname()
-                # END loop until error
+                directory.rmdir()
+                self.log.info("Removed empty directory: %s", directory)
             except OSError:
                 pass
             # END handle exception
-            self._wrote_destination_dir = False
-        # END handle dest dir removal
+        # end for each directory we created
+        del self._created_directories[:]
 
 # end class CopyAction
@@ -65,7 +65,8 @@ class ProcessAwareApplication(bapp.Application):
         if kwargs.get('load_plugins_from_trees', False):
             # At this stage, we only have this information in hash_maps, and of course the traditional contexts
             lpkwargs = dict(recurse=kwargs.get('recursive_plugin_loading', False),
-                            subdirectory=kwargs.get('plugins_subtree', 'plug-ins'))
+                            subdirectory=kwargs.get('plugins_subtree', 'plug-ins'),
+                            lazy=kwargs.get('lazy_plugin_loading', True))
             proc_ctx.load_plugins(**lpkwargs)
 
             # We just load these as we
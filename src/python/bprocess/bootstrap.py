@@ -18,8 +18,19 @@ __all__ = ['Bootstrapper']
 import sys
 import os
 import logging
+import struct
+import socket
+import stat
+import hashlib
+import tempfile
 from itertools import chain
 
+try:
+    import cPickle as pickle
+except ImportError:
+    import pickle
+# end get fastest pickle
+
 basename = os.path.basename
 dirname = os.path.dirname
 
@@ -63,6 +74,17 @@ class Bootstrapper:
     ## a per-directory file carrying information on where to find the bootstrapper
     boot_info_file = '.bprocess_path'
 
+    ## If this environment variable is set to a non-empty value, launches are prepared by a resident
+    ## bootstrap daemon, which is started on demand. See bprocess.forkserver.BootstrapServer
+    daemon_evar = 'BPROCESS_BOOTSTRAP_DAEMON'
+
+    ## Environment variable with the directory to keep daemon sockets in. Defaults to a per-user directory
+    ## within $XDG_RUNTIME_DIR, or the system's temporary directory if it is unset
+    daemon_directory_evar = 'BPROCESS_BOOTSTRAP_DAEMON_DIR'
+
+    ## Seconds a daemon may be idle before it exits
+    daemon_idle_timeout = 600
+
     ## -- End Configuration -- @}
 
     # -------------------------
@@ -96,7 +118,7 @@ class Bootstrapper:
         # handle absolute paths
         
         # otherwise, treat it as relative to the executable dir
-        return os.path.join(os.path.dirname(executable), link_destination)
+        return os.path.normpath(os.path.join(os.path.dirname(executable), link_destination))
 
     def _resolve_posix_symlink(self, executable):
         """@return the absolute resolved posix link"""
@@ -127,13 +149,11 @@ class Bootstrapper:
             return None
         # end handle no symlink case
         
-    def _boot_info(self, executable):
-        """Try to make our root-package available which should include the components framework
-        to do that actual woractual_executablek for us
-        Raise an error if that didn't work
+    def _resolve_hops(self, executable):
+        """Follow all links from the given executable to the bootstrapper
         The returned hops are excluding the actual executable (first hop) and the last one, the bootstrapper 
         location within bcore, which is handled implicitly
-        @return root module, controller type, hops"""
+        @return tuple(root_package_path, hops)"""
         hops = list()
 
         current_hop = executable
@@ -162,8 +182,14 @@ class Bootstrapper:
                 raise AssertionError(msg % actual_executable)
             # end second attempt to make resolution
         # end handle root_package not found
-        
+        return root_package_path, hops
 
+    def _boot_info(self, executable):
+        """Try to make our root-package available which should include the components framework
+        to do that actual work for us
+        Raise an error if that didn't work
+        @return root module, controller type, hops"""
+        root_package_path, hops = self._resolve_hops(executable)
         module = self._init_root_package_from_path(root_package_path)
         try:
             return module, getattr(module, self.process_controller_type_name), hops
@@ -232,6 +258,130 @@ implementation: %s" % (module_for_import, root_package_path, str(err)))
         #end
 
     ## -- End Utiltiies -- @}
+
+    # -------------------------
+    ## @name Daemon Client
+    # The daemon prepares launches using a warm interpreter, so we just have to execve() the result.
+    # The protocol is the one of bprocess.forkserver, which we can't import here
+    # @{
+
+    ## Frame header, made of the channel and the size of the payload
+    _frame_header = struct.Struct('!BI')
+
+    ## Channel ids for our request, and the response to it
+    _channel_request = 0
+    _channel_result = 4
+
+    def _private_directory(self, directory):
+        """@return directory, which is created if needed, or None if it is not safe to use as it is a symlink,
+        isn't owned by us or is accessible by others"""
+        try:
+            os.makedirs(directory, 0o700)
+        except OSError:
+            pass
+        # end ignore existing directories, lstat() tells us what we have
+        try:
+            info = os.lstat(directory)
+        except OSError:
+            return None
+        # end handle directories we couldn't create
+        if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+            return None
+        # end handle unsafe directories
+        return directory
+
+    def _peer_uid(self, sock):
+        """@return the user id of the process at the other end of the given unix domain socket, or None if
+        the platform doesn't tell us"""
+        option = getattr(socket, 'SO_PEERCRED', sys.platform.startswith('linux') and 17 or None)
+        if option is None:
+            return None
+        # end handle unsupported platforms
+        return struct.unpack('3i', sock.getsockopt(socket.SOL_SOCKET, option, struct.calcsize('3i')))[1]
+
+    def _daemon_socket_path(self, root_package_path):
+        """@return path to the socket of the daemon for our root package, interpreter, user and host, or None
+        if its directory is not private to us"""
+        directory = os.environ.get(self.daemon_directory_evar) or \
+            os.path.join(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(),
+                         'bprocess-bootstrap-%i' % os.getuid())
+        if self._private_directory(directory) is None:
+            return None
+        # end handle unsafe directories
+        fingerprint = hashlib.sha1(('%s\0%s' % (root_package_path, sys.executable)).encode('utf-8')).hexdigest()
+        return os.path.join(directory, '%s-%s.sock' % (socket.gethostname().split('.')[0][:32], fingerprint[:12]))
+
+    def _start_daemon(self, root_package_path, socket_path):
+        """Start a daemon for the given root package in the background, which will be listening on socket_path"""
+        import subprocess
+        code = 'import sys; sys.path.insert(0, %r); from bprocess.forkserver import BootstrapServer; ' \
+               'BootstrapServer(%r, %r).serve()' % (root_package_path, socket_path, self.daemon_idle_timeout)
+        devnull = open(os.devnull, 'r+b')
+        try:
+            subprocess.Popen([sys.executable, '-c', code], cwd='/',
+                             stdin=devnull, stdout=devnull, stderr=devnull,
+                             close_fds=True, preexec_fn=os.setsid)
+        finally:
+            devnull.close()
+        # end assure file is closed
+
+    def _recv_exactly(self, sock, size):
+        """@return size bytes read from sock
+        @throw EOFError if the connection was closed before"""
+        data = b''
+        while len(data) < size:
+            chunk = sock.recv(size - len(data))
+            if not chunk:
+                raise EOFError("Connection closed by daemon")
+            # end handle closed connection
+            data += chunk
+        # end while there is something to read
+        return data
+
+    def _launch_via_daemon(self, root_package_path, hops, executable, args):
+        """Let the daemon prepare the launch and replace this process with the result.
+        Returns only if the daemon isn't running, or can't prepare this launch, in which case it is started
+        or we launch the program ourselves respectively.
+        @note we also return if the daemon's socket isn't in a private directory, or if it is not run by us"""
+        socket_path = self._daemon_socket_path(root_package_path)
+        if socket_path is None:
+            return
+        # end handle unsafe socket directory
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            try:
+                sock.connect(socket_path)
+            except socket.error:
+                self._start_daemon(root_package_path, socket_path)
+                return
+            # end start daemon for the next launch
+            if self._peer_uid(sock) not in (None, os.getuid()):
+                return
+            # end never send our environment to other users
+
+            request = pickle.dumps(dict(executable=executable, args=list(args), hops=hops,
+                                        cwd=os.getcwd(), env=dict(os.environ)), 2)
+            sock.sendall(self._frame_header.pack(self._channel_request, len(request)) + request)
+            channel, size = self._frame_header.unpack(self._recv_exactly(sock, self._frame_header.size))
+            response = pickle.loads(self._recv_exactly(sock, size))
+        except (socket.error, EOFError):
+            return
+        finally:
+            sock.close()
+        # end assure socket is closed
+
+        if channel != self._channel_result:
+            return
+        # end ignore unexpected responses
+        if response[0] == 'execve':
+            _, path, argv, env, cwd = response
+            os.chdir(cwd)
+            os.execve(path, argv, env)
+        elif response[0] == 'exit':
+            sys.exit(response[1])
+        # end handle response, otherwise we launch it ourselves
+
+    ## -- End Daemon Client -- @}
     
     # -------------------------
     ## @name Interface
@@ -242,6 +392,11 @@ implementation: %s" % (module_for_import, root_package_path, str(err)))
         Initialize this instance
         @param executable file we are running (never /bin/python)
         @param args all arguments the program received"""
+        if os.name == 'posix' and os.environ.get(self.daemon_evar):
+            root_package_path, hops = self._resolve_hops(executable)
+            self._launch_via_daemon(root_package_path, hops, os.path.splitext(executable)[0], args)
+        # end try daemon
+
         root_module, process_controller_type, hops = self._boot_info(executable)
 
         # allow extensions to be used transparently to help starting the right interpreter on windows.
@@ -8,7 +8,7 @@
 """
 from __future__ import unicode_literals
 from butility.future import str
-__all__ = ['ProcessControlContextController', 'ProcessConfigurationIncompatibleError']
+__all__ = ['ProcessControlContextController', 'ProcessConfigurationIncompatibleError', 'AssetContextCache']
 
 import bapp
 from .schema import (process_schema,
@@ -27,7 +27,8 @@ from bdiff import (TwoWayDiff,
                    DiffIndexDelegate)
 from butility import (Version,
                       OrderedDict,
-                      abstractmethod)
+                      abstractmethod,
+                      stat_fingerprint)
 
 import logging
 
@@ -49,6 +50,102 @@ class ProcessConfigurationIncompatibleError(IContextController.ContextIncompatib
 # end class ProcessConfigurationIncompatibleError
 
 
+class _AssetContext(object):
+
+    """The contexts pushed for an asset directory, along with everything we learned about them"""
+    __slots__ = (
+        'base',             # tuple of contexts below ours when they were pushed
+        'contexts',         # list of contexts pushed for the directory, bottom first
+        'fingerprints',     # list of (path, fingerprint) tuples of all files and directories the contexts depend on
+        'incompatibility',  # None if compatible, a ProcessConfigurationIncompatibleError, or unset if unchecked
+        'imported'          # True if the modules of our packages were imported while our contexts were on the stack
+    )
+
+    def __init__(self, base, contexts, fingerprints):
+        self.base = base
+        self.contexts = contexts
+        self.fingerprints = fingerprints
+        self.imported = False
+
+# end class _AssetContext
+
+
+class AssetContextCache(object):
+
+    """A least-recently-used cache of contexts prepared for asset directories.
+
+    Entries are only returned if none of the files and directories their contexts depend on changed since,
+    and if the contexts below them are still the same.
+    """
+    __slots__ = (
+        '_size',    # maximum amount of entries
+        '_entries'  # OrderedDict of directory -> _AssetContext, least recently used first
+    )
+
+    def __init__(self, size=16):
+        """Initialize this instance to keep at most size entries"""
+        self._size = size
+        self._entries = OrderedDict()
+
+    # -------------------------
+    # @name Interface
+    # @{
+
+    def new_entry(self, base, contexts):
+        """@return a new entry for the given contexts, whose dependencies are fingerprinted right away
+        @param base the contexts on the stack below the given ones
+        @param contexts the contexts pushed for the directory"""
+        fingerprints = list()
+        for ctx in contexts:
+            for path in ctx.snapshot_dependencies():
+                fingerprints.append((path, stat_fingerprint(path)))
+            # end for each dependency
+        # end for each context
+        return _AssetContext(tuple(base), list(contexts), fingerprints)
+
+    def get(self, directory, base):
+        """@return the entry for the given directory, or None if there is none, or if it is outdated
+        @param base the contexts currently on the stack, below the ones of the entry"""
+        entry = self._entries.pop(directory, None)
+        if entry is None:
+            return None
+        # end handle cache miss
+        if len(entry.base) != len(base) or any(a is not b for a, b in zip(entry.base, base)):
+            return None
+        # end handle changed stack
+        for path, fingerprint in entry.fingerprints:
+            if stat_fingerprint(path) != fingerprint:
+                log.debug("Asset context for '%s' is outdated as '%s' changed", directory, path)
+                return None
+            # end check fingerprint
+        # end for each fingerprint
+        self._entries[directory] = entry
+        return entry
+
+    def put(self, directory, entry):
+        """Store the given entry for the directory, dropping the least recently used one if we are full
+        @return self"""
+        self._entries.pop(directory, None)
+        self._entries[directory] = entry
+        while len(self._entries) > self._size:
+            self._entries.pop(next(iter(self._entries)))
+        # end while we are too large
+        return self
+
+    def clear(self):
+        """Remove all entries
+        @return self"""
+        self._entries.clear()
+        return self
+
+    def __len__(self):
+        return len(self._entries)
+
+    # -- End Interface -- @}
+
+# end class AssetContextCache
+
+
 class ProcessControlContextController(IContextController, ApplicationSettingsMixin,
                                       FlatteningPackageDataIteratorMixin, bapp.plugin_type()):
 
@@ -57,7 +154,8 @@ class ProcessControlContextController(IContextController, ApplicationSettingsMix
     _after_scene_save() methods"""
     __slots__ = (
         '_initial_stack_len',  # Length of the stack when this instance was initialized
-        '_context_stack'  # The context stack we should manipulate
+        '_context_stack',  # The context stack we should manipulate
+        '_asset_contexts'  # An AssetContextCache with the contexts of recently visited asset directories
     )
 
     # Describes the data we want to compare within the package data. Add more fields here if required
@@ -81,6 +179,9 @@ class ProcessControlContextController(IContextController, ApplicationSettingsMix
     # Otherwise the context, even though we changed the scene, will be the one of the previous scene
     restore_stack_if_new_context_is_incompatible = True
 
+    # Amount of asset directories whose contexts we keep, to quickly switch back to them
+    asset_context_cache_size = 16
+
     # -- End Configuration -- @}
 
     def __init__(self, context_stack, *args, **kwargs):
@@ -90,6 +191,7 @@ class ProcessControlContextController(IContextController, ApplicationSettingsMix
         super(ProcessControlContextController, self).__init__()
         self._initial_stack_len = None
         self._context_stack = context_stack
+        self._asset_contexts = AssetContextCache(self.asset_context_cache_size)
 
     # -------------------------
     # @name Overridable Methods
@@ -191,6 +293,7 @@ class ProcessControlContextController(IContextController, ApplicationSettingsMix
         length will be used
         @note its valid to call it multiple times, to re-adjust the are of the static context accordingly"""
         self._initial_stack_len = length or len(self._context_stack)
+        self._asset_contexts.clear()
 
     # -- End Interface -- @}
 
@@ -221,11 +324,42 @@ class ProcessControlContextController(IContextController, ApplicationSettingsMix
         log.debug("changing scene context to '%s'", filepath)
 
         res = self.pop_asset_context()
-        self._push_configuration(filepath.dirname())
+        directory = filepath.dirname()
+        base = self._context_stack.stack()[:self._initial_stack_len]
+        entry = self._asset_contexts.get(directory, base)
+        if entry is None:
+            self._push_configuration(directory)
+            entry = self._asset_contexts.new_entry(base, self._context_stack.stack()[self._initial_stack_len:])
+            self._asset_contexts.put(directory, entry)
+        else:
+            log.debug("re-using cached context of '%s'", directory)
+            for ctx in entry.contexts:
+                self._context_stack.push(ctx)
+            # end for each context to restore
+        # end handle cache
+
         try:
-            self._check_process_compatibility(self._context_stack.settings())
-            # if this worked, load plugins
-            PythonPackageIterator().import_modules()
+            # The result only depends on the configuration of the contexts, the one of our process doesn't change
+            if not hasattr(entry, 'incompatibility'):
+                try:
+                    self._check_process_compatibility(self._context_stack.settings())
+                    entry.incompatibility = None
+                except ProcessConfigurationIncompatibleError as err:
+                    entry.incompatibility = err
+                # end memoize result
+            elif entry.incompatibility is not None:
+                log.error(str(entry.incompatibility))
+            # end check compatibility once
+            if entry.incompatibility is not None:
+                raise entry.incompatibility
+            # end handle incompatible context
+
+            # if this worked, load plugins. As the package configuration is the one of our process, the modules
+            # don't change, and contexts which received their plugins already don't need them again
+            if not entry.imported and ControlledProcessInformation.has_data():
+                PythonPackageIterator().import_modules()
+                entry.imported = True
+            # end import modules once per context
         except ProcessConfigurationIncompatibleError:
             # If this method fails, we have to undo the previous stack changes, as we are (supposed) to remain
             # in the context of the given file
@@ -11,27 +11,30 @@ from __future__ import division
 from butility.future import (str,
                              PY2)
 __all__ = ['ProcessController', 'DisplayContextException', 'DisplaySettingsException',
-           'DisplayHelpException', 'DisplayLoadedYamlException']
+           'DisplayHelpException', 'DisplayLoadedYamlException', 'execute_concurrently']
 
 import sys
 import os
 import logging
 import traceback
+import functools
 
 from pprint import pformat
 
 import bapp
 from butility import (Path,
+                      OrderedDict,
                       TRACE,
-                      update_env_path,
                       GraphIterator,
                       LazyMixin,
                       load_files,
                       DictObject,
                       set_log_level,
                       parse_key_value_string,
+                      startup_timing,
                       DEFAULT_ENCODING)
-from butility.compat import profile
+from butility.compat import (profile,
+                             asyncio)
 
 from bcontext import Context
 from bkvstore import KeyValueStoreModifier
@@ -48,6 +51,10 @@ from .schema import (controller_schema,
                      package_manager_schema)
 from .utility import (ProcessControllerPackageSpecification,
                       ControlledProcessInformation,
+                      LaunchPlanCache,
+                      PackageDependencyIndex,
+                      EnvironmentBuilder,
+                      PathStatCache,
                       PythonPackageIterator)
 
 
@@ -184,6 +191,9 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
         '_delegate_override',  # the delegate the caller might have set
         '_dry_run',           # if True, we will not actually run the application,
         '_package_data_cache',  # intermediate data cache, to reduce overhead during iteration
+        '_package_index',     # a PackageDependencyIndex on top of our package data, or None
+        '_stat_cache',        # a PathStatCache for all file system queries of this launch
+        '_propagate',         # prefixes of settings keys to pass on to the launched process, or None for all
         '_resolve_args',      # if True, we will resolve arguments in some way
         '_logging_override',  # log level we parsed from the commandline, or None
         '_debug_mode',        # a flag to indicate we are in debug mode
@@ -275,6 +285,17 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
     # The kind of application we create if not provided during __init__
     ApplicationType = Application
 
+    # Environment variable with a directory in which to cache launch plans, see LaunchPlanCache.
+    # If unset, launch plans are not cached
+    launch_plan_cache_evar = 'BPROCESS_LAUNCH_PLAN_CACHE_DIR'
+
+    # Directory in which to cache launch plans if the launch_plan_cache_evar isn't set, or None
+    launch_plan_cache_directory = None
+
+    # Prefixes of settings keys which are always passed on to the launched process, if any of its packages
+    # declares the settings it needs using the 'propagate' field. {program} is substituted with the package name
+    default_propagated_settings = ('process', controller_schema.key() + '.{program}', 'logging')
+
     # -- End Subclass Configuration -- @}
 
     def __init__(self, executable, args=list(), delegate=None, cwd=None, dry_run=False,
@@ -338,6 +359,9 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
         # when needed. The latter wouldn't work if we set the attribute directly
         self._prebuilt_app = application
         self._package_data_cache = dict()
+        self._package_index = None
+        self._stat_cache = PathStatCache()
+        self._propagate = None
 
     def _set_cache_(self, name):
         if name in ('_app', '_executable_path', '_delegate'):
@@ -383,6 +407,14 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
         self._package_data_cache[key] = pd
         return pd
 
+    def _package_dependency_index(self):
+        """@return a PackageDependencyIndex for the current package database, which is shared until the 
+        package data cache is cleared"""
+        if self._package_index is None:
+            self._package_index = PackageDependencyIndex(self._package_data)
+        # end create index on demand
+        return self._package_index
+
     def _package(self, name):
         """@return _ProcessControllerPackageSpecification instance matching the given name
         @throws KeyError if it doesn't exist"""
@@ -450,15 +482,108 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
                                                                stdin, stdout, stderr))
         return self.execute()
 
+    @classmethod
+    def prepare_many(cls, specs, cwd=None, dry_run=False, application=None):
+        """Prepare the launch of many programs at once, sharing as much of the work as possible.
+
+        All controllers using the same settings directories start from one base Application, sharing its
+        contexts and their aggregated settings, which are loaded only once. Controllers of the same program and 
+        wrapper arguments additionally share the resolved package data, along with its dependency index.
+        All of them share the file system queries made while preparing the launch.
+        @param specs iterable of (executable, args) tuples, see __init__() for the meaning of both. Specs with
+        context arguments, like @path, get an Application of their own.
+        @param cwd the current working directory of all programs, or None to use the actual one
+        @param dry_run if True, no program will actually be launched by execute()
+        @param application if not None, the Application to use as base for all programs instead of a new one
+        @return a list of ProcessController instances ready for execute(), one per spec, in order
+        @throws EnvironmentError if any program could not be prepared
+        @note the resolved package data must not depend on process.raw_arguments, as it is shared among
+        programs with different arguments"""
+        base_apps = dict()      # settings trees -> Application
+        packages = dict()       # (program, trees, wrapper args) -> (package data cache, package index)
+        stat_cache = PathStatCache()
+        controllers = list()
+
+        for executable, args in specs:
+            pctrl = cls(executable, args, cwd=cwd, dry_run=dry_run)
+            pctrl._stat_cache = stat_cache
+
+            if not any(arg.startswith(cls.wrapper_context_prefix) for arg in pctrl._args):
+                trees = pctrl._settings_trees(pctrl._bootstrap_directory())
+                base_app = application or base_apps.get(trees)
+                if base_app is None:
+                    base_app = base_apps[trees] = pctrl._new_application(trees)
+                # end create base application once
+                pctrl._prebuilt_app = type(base_app)(base_app.context().copy(), previous_application=base_app)
+
+                key = (pctrl._name(), trees, tuple(arg for arg in pctrl._args
+                                                   if arg.startswith(cls.wrapper_arg_prefix)))
+                package_data_cache, package_index = packages.setdefault(key, (dict(), None))
+                pctrl._package_data_cache = package_data_cache
+                pctrl._package_index = package_index
+
+                with startup_timing.phase('prepare'):
+                    pctrl.application()
+                # end record timing
+
+                # Only share data which wasn't invalidated by changes to the context of this controller
+                if pctrl._package_data_cache is package_data_cache and package_index is None:
+                    packages[key] = (package_data_cache, pctrl._package_index)
+                # end share package index
+            else:
+                pctrl.application()
+            # end handle shared application
+            controllers.append(pctrl)
+        # end for each spec
+        return controllers
+
+    def execute_async(self, stdout_handler=None, stderr_handler=None):
+        """Like execute(), but launches the program as child without blocking, using asyncio.
+        @param stdout_handler if not None, a function f(line) to receive each line of the standard output, as bytes
+        @param stderr_handler like stdout_handler, but for the standard error
+        @return an asyncio.Future resolving to the asyncio.subprocess.Process once it finished. If it is cancelled,
+        the process is killed.
+        @throws EnvironmentError if the executable cannot be found, or if asyncio isn't available
+        @note the current event loop is used"""
+        delegate, args, cwd, env, launch_mode = self._prepare_launch()
+        if self._dry_run:
+            result = asyncio.get_event_loop().create_future()
+            result.set_result(DictObject(dict(returncode=0)))
+            return result
+        # end handle dry-run
+        return delegate.start_async(args, cwd, env, stdout_handler, stderr_handler)
+
     # -- End Interface -- @}
 
     # -------------------------
     # @name Interface
     # @{
 
+    def _bootstrap_directory(self):
+        """@return the directory of our boot executable, or our own directory if it doesn't exist"""
+        bootstrap_dir = self._boot_executable.dirname()
+        if not bootstrap_dir.isdir():
+            new_bootstrap_dir = Path(__file__).dirname()
+            log.warn("Adjusted bootstrap_dir %s to %s as previous one didn't exist", bootstrap_dir, new_bootstrap_dir)
+            bootstrap_dir = new_bootstrap_dir
+        # end assure we have at least a good initial configuration
+        return bootstrap_dir
+
+    def _settings_trees(self, bootstrap_dir):
+        """@return the directories our Application should load its settings from"""
+        return self._filter_application_directories((bootstrap_dir,) + self._context_paths + (self._cwd,))
+
+    def _new_application(self, settings_trees):
+        """@return a new Application, loading settings from the given directories"""
+        return self.ApplicationType.new(settings_trees=settings_trees,
+                                        settings_hierarchy=self.traverse_process_path_hierachy,
+                                        user_settings=self.load_user_settings,
+                                        setup_logging=False)
+
     def _clear_package_data_cache(self):
-        """Clear our package cache"""
+        """Clear our package cache, along with the dependency index built from it"""
         self._package_data_cache = dict()
+        self._package_index = None
 
     def _name(self):
         """Name of the process we should control"""
@@ -472,7 +597,7 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
 
         # First iteration sets the python path
         package_cache = list()
-        for package_name, depth in self._iter_(self._name(), self.upstream, self.breadth_first):
+        for package_name, depth in self._package_dependency_index().closure(self._name()):
             package = self._package(package_name)
             pdata = package.data()
             package_cache.append((package, pdata))
@@ -508,13 +633,12 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
                 import_modules.insert(0, module)
         # end for each package
 
-        for path in plugin_paths:
-            load_files(path)
-        # end for each sorted plug-in to load
-
-        for module in import_modules:
-            PythonPackageIterator.import_module(module, force_reimport=True)
-        # end for each module to import
+        with startup_timing.phase('plugin load'):
+            load_files(plugin_paths)
+            for module in import_modules:
+                PythonPackageIterator.import_module(module, force_reimport=True)
+            # end for each module to import
+        # end record timing
 
         return self
 
@@ -529,7 +653,7 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
 
         rel_to_abs = lambda paths, pkg: (pkg.to_abs_path(p) for p in paths)
 
-        for package_name, depth in self._iter_(self._name(), self.upstream, self.breadth_first):
+        for package_name, depth in self._package_dependency_index().closure(self._name()):
             pkg = self._package(package_name)
             pd = pkg.data()
             if pd.include:
@@ -564,7 +688,7 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
         # end for each primary package
 
         # Look for one within our requirement chain
-        for package_name, depth in self._iter_(self._name(), self.upstream, self.breadth_first):
+        for package_name, depth in self._package_dependency_index().closure(self._name()):
             pd = self._package_data(package_name)
             if pd.delegate.name() != default_name:
                 # note: we always provide the name of the original package, as this will yield more information
@@ -682,6 +806,59 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
 
         return res, cwd, ctx
 
+    def _inherit_environment(self):
+        """Copy the environment of our process into the one of the program we launch"""
+        # Always copy the environment, never write it directly to assure we can do in-process launches
+        self._environ.update(os.environ)
+
+        if PY2:
+            # Now we can easily get variable values with non-ascii characters in them, which breaks
+            # necks in py2.
+            # Just be sure we get them into a usable format. Also note that unicode in environments
+            # is ok on posix, but not on windows, and even on posix we have to be sure
+            # there is nothing non-ascii, as python tries to do that for us otherwise. Py3 is fine !
+            def convert_if_needed(item):
+                if isinstance(item, bytes):
+                    return item.decode(DEFAULT_ENCODING, 'replace').encode('ascii', 'replace')
+                return item
+            # end utility
+
+            for k, v in self._environ.items():
+                self._environ[convert_if_needed(k)] = convert_if_needed(v)
+            # end handle unicode conversion
+        # end
+
+    def _launch_plan_cache(self, program, args):
+        """@return tuple(cache, key) of the LaunchPlanCache to use and the key of the plan for the given program, 
+        or (None, None) if launch plans should not be cached
+        @param program name of the program we launch
+        @param args the original arguments we were called with
+        @note must be called once all configuration was loaded"""
+        directory = os.environ.get(self.launch_plan_cache_evar) or self.launch_plan_cache_directory
+        if not directory or self._delegate_override is not None or self._next_exception:
+            return None, None
+        # end handle disabled cache
+        hash_map = ControlledProcessInformation.config_file_hash_map(self._app.context())
+        key = LaunchPlanCache.key(type(self).__module__, type(self).__name__, program, self._boot_executable,
+                                  args, self._args, self._cwd, os.getcwd(), self._context_paths,
+                                  sorted(self._environ.items()), list(hash_map.items()))
+        return LaunchPlanCache(directory), key
+
+    def _replay_launch_plan(self, program, plan):
+        """Setup our environment, arguments and executable from the given launch plan, as obtained by 
+        LaunchPlanCache.get()
+        @note must be called once the plugins were loaded, and our delegate was found to be the default one"""
+        if plan['inherit']:
+            self._inherit_environment()
+        # end handle inherited environment
+        self._environ.update(plan['environ'])
+        self._args = list(plan['args'])
+        self._cwd = plan['cwd']
+        self._resolve_args = plan['resolve_args']
+        self._executable_path = plan['executable']
+        self._propagate = plan['propagate']
+        log.debug("Using cached launch plan for '%s'", program)
+
     @classmethod
     def _resolve_package_alias(cls, package, fpackage_by_name):
         """@return alias_package for the given package. alias_package may be package
@@ -698,6 +875,168 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
         # end handle alias executable
         return package
 
+    def _build_environment(self, program, root_package, delegate, normalize_paths):
+        """Apply the environment, arguments and actions of all packages reachable from the given program.
+        Our arguments, working directory and the delegate's transaction are adjusted in the process
+        @param program name of the program we launch
+        @param root_package the package of the program
+        @param delegate our delegate, used to verify and resolve values
+        @param normalize_paths if True, paths will be normalized before they are put into the environment
+        @return tuple(env, plan_values, plan_paths, propagate) of the EnvironmentBuilder with all variables, values
+        which may reference environment variables, (path, existed) tuples of all checked paths, and prefixes of
+        settings keys to pass on to the process"""
+        platform = OSContext.platform_service_type()
+        ld_env_var = platform.search_path_variable(platform.SEARCH_DYNLOAD)
+        exec_env_var = platform.search_path_variable(platform.SEARCH_EXECUTABLES)
+
+        # Collects all variables we set, and which package set them
+        env = EnvironmentBuilder(self._environ)
+        cwd_handled = False  # Will be True if a package altered the current working dir
+
+        # Values which may reference environment variables, and paths we checked, for use in the launch plan
+        plan_values = list()
+        plan_paths = list()
+
+        # Prefixes of settings keys to pass on to the process
+        propagate = list()
+
+        normpath = lambda p: normalize_paths and p.normpath() or p
+
+        # Packages ignored by others are skipped by the index
+        packages = list()
+        for package_name in self._package_dependency_index().reachable(program):
+            # save this one call ...
+            if package_name == program:
+                packages.append((package_name, root_package))
+            else:
+                packages.append((package_name, self._package(package_name)))
+            # end save one package call
+        # end for each package
+
+        # Verify all paths which don't need to be resolved in bulk, as each check can be expensive
+        candidates = list()
+        for package_name, package in packages:
+            penv = package.data().environment
+            items = [(ld_env_var, path) for path in penv.linker_search_paths]
+            items.extend((exec_env_var, path) for path in penv.executable_search_paths)
+            for evar, values in penv.variables.items():
+                if delegate.variable_is_path(evar):
+                    items.extend((evar, value) for value in values)
+                # end handle path variables
+            # end for each variable
+            candidates.extend((evar, package.to_abs_path(path)) for evar, path in items if '$' not in path)
+        # end for each package
+        candidates = list(OrderedDict.fromkeys(candidates))
+        verified_paths = dict(zip(candidates, delegate.verify_paths(candidates)))
+
+        def verify_path(evar, path):
+            try:
+                return verified_paths[(evar, path)]
+            except KeyError:
+                return delegate.verify_path(evar, path)
+            # end handle paths which were not verified in bulk
+        # end utility
+
+        for package_name, package in packages:
+            log.debug("Using package '%s'", package_name)
+            propagate.extend(package.data().propagate)
+
+            # Adjust arguments
+            ####################
+            pargs = package.data().arguments
+            self._args = pargs.prepend + self._args
+            self._args.extend(pargs.append)
+            self._resolve_args |= pargs.resolve
+
+            # CWD Adjustment
+            if not cwd_handled and package.data().cwd:
+                new_cwd = package.data().cwd
+                if self._cwd == os.getcwd():
+                    log.debug("%s: setting cwd override to '%s'", package_name, new_cwd)
+                    # Only set it if the directory existed
+                    if new_cwd.isdir():
+                        self._cwd = new_cwd
+                    else:
+                        log.error(
+                            "%s: Configured working directory '%s' was not accessible - ignoring it", package_name, new_cwd)
+                    # end assure it exists
+
+                else:
+                    log.debug(
+                        "%s: Will not use package-cwd '%s' as the cwd was overridden by caller", package_name, new_cwd)
+                # end don't change overridden cwd
+                cwd_handled = True
+            # end first one to set cwd wins
+
+            # Special Search Paths
+            #######################
+            resolve_evars = package.data().environment.resolve
+            for evar, paths in ((ld_env_var, package.data().environment.linker_search_paths),
+                                (exec_env_var, package.data().environment.executable_search_paths)):
+                for path in paths:
+                    plan_values.append(path)
+                    if resolve_evars:
+                        path = delegate.resolve_value(path, env)
+                    # end
+                    abs_path = package.to_abs_path(path)
+                    path = verify_path(evar, abs_path)
+                    if not abs_path.containsvars():
+                        plan_paths.append((str(abs_path), path is not None))
+                    # end record checked paths
+                    if path is not None:
+                        env.append_path(evar, normpath(path), package_name)
+                    # end append path if possible
+                # end for each path
+            # end for each special environment variable
+
+            # Set environment variables
+            ############################
+            for evar, values in list(package.data().environment.variables.items()):
+                evar_is_path = delegate.variable_is_path(evar)
+                for value in values:
+                    # for now we append, as we walk dependencies breadth-first and items coming later
+                    # should be effective later
+                    plan_values.append(value)
+                    if resolve_evars:
+                        value = delegate.resolve_value(value, env)
+                    # end
+                    if evar_is_path:
+                        abs_path = package.to_abs_path(value)
+                        value = verify_path(evar, abs_path)
+                        if not abs_path.containsvars():
+                            plan_paths.append((str(abs_path), value is not None))
+                        # end record checked paths
+                        if value is None:
+                            continue
+                        # end handle invalid path
+                        value = normpath(value)
+                    # end prepare path's value
+
+                    if evar_is_path and delegate.variable_is_appendable(evar, value):
+                        env.append_path(evar, value, package_name)
+                    else:
+                        # Packages coming in later will overwrite previous values, in any case
+                        if evar in env:
+                            log.debug("%s: overwriting variable %s with previous value '%s'",
+                                      package_name, evar, env[evar])
+                        # end
+                        env.set_value(evar, value, package_name)
+                    # end handle path variables
+                # end for each value to set
+            # end for each variable,values tuple
+
+            # BUILD TRANSACTION
+            ###################
+            for action_key in package.data().actions:
+                Action = delegate.action(action_key)
+                # TODO: It looks odd if it adds itself implicitly, possibly change that to be added explicitly
+                log.debug("Adding action '%s'", action_key)
+                Action(delegate.transaction(), action_key, Action.data(action_key), package_name, package.data())
+            # end for each action
+        # end for each program
+
+        return env, plan_values, plan_paths, propagate
+
     def _setup_execution_context(self):
         """Initialize the context in which the process will be executed to the point right before it will actually
         be launched. This is called automaticlaly by during __init__() and must be called exactly once.
@@ -722,13 +1061,7 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
         # Have to deal with the possibility that people don't provide an absolute directory or that the directory
         # is outside of the vincinity of the default configuration
         program = self._name()
-
-        bootstrap_dir = self._boot_executable.dirname()
-        if not bootstrap_dir.isdir():
-            new_bootstrap_dir = Path(__file__).dirname()
-            log.warn("Adjusted bootstrap_dir %s to %s as previous one didn't exist", bootstrap_dir, new_bootstrap_dir)
-            bootstrap_dir = new_bootstrap_dir
-        # end assure we have at least a good initial configuration
+        bootstrap_dir = self._bootstrap_directory()
 
         # Have to get our arguments of the list here, to be able to respond to it properly
         orig_args = self._args
@@ -738,14 +1071,7 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
         if self._prebuilt_app:
             self._app = app = self._prebuilt_app
         else:
-            self._app = app = self.ApplicationType.new(
-                settings_trees=self._filter_application_directories(
-                    (bootstrap_dir,) +
-                    self._context_paths +
-                    (self._cwd,)),
-                settings_hierarchy=self.traverse_process_path_hierachy,
-                user_settings=self.load_user_settings,
-                setup_logging=False)
+            self._app = app = self._new_application(self._settings_trees(bootstrap_dir))
         # end initialize application
         app.context().push(_ProcessControllerContext(program, self._boot_executable, bootstrap_dir, orig_args))
 
@@ -791,10 +1117,6 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
 
         # Evaluate Program Database
         ############################
-        platform = OSContext.platform_service_type()
-        ld_env_var = platform.search_path_variable(platform.SEARCH_DYNLOAD)
-        exec_env_var = platform.search_path_variable(platform.SEARCH_EXECUTABLES)
-
         # our program's package
         try:
             # Set it now, we might not get into the loop where it would be set natively. However, except case
@@ -818,13 +1140,28 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
                 self.set_delegate(self._find_delegate(root_package, alias_package))
             # end use delegate overrides
 
-            self._executable_path = alias_package.executable(self._environ)
+            # Use the launch plan computed previously, if possible. Plugins are loaded by now, which makes their
+            # paths available, and tells us whether they provide a delegate which wouldn't have cached the plan
+            plan_cache, plan_key = self._launch_plan_cache(program, orig_args)
+            if plan_cache is not None and type(self.delegate()) is self.ProcessControllerDelegateType:
+                plan = plan_cache.get(plan_key)
+                if plan is not None:
+                    self._replay_launch_plan(program, plan)
+                    return self
+                # end replay plan
+            # end handle launch plan cache
+
+            self._executable_path = alias_package.executable(self._environ, self._stat_cache)
             prev_len = len(app.context())
+            context_changed = False
 
-            self.delegate().prepare_context(self._executable_path, self._environ, self._args, self._cwd)
+            with startup_timing.phase('delegate prepare'):
+                self.delegate().prepare_context(self._executable_path, self._environ, self._args, self._cwd)
+            # end record timing
 
             # If there were changes to the contxt, which means we have to refresh all our data so far
             if len(app.context()) != prev_len:
+                context_changed = True
                 # As the settings changed, our cache needs update too
                 self._clear_package_data_cache()
 
@@ -880,7 +1217,7 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
                     remove_previous_configuration()
                 # end handle new configuration context
 
-                self._executable_path = alias_package.executable(self._environ)
+                self._executable_path = alias_package.executable(self._environ, self._stat_cache)
 
                 # If the delegate put on an additional environment, we have to reload everything
                 log.debug('reloading data after delegate altered environment')
@@ -891,176 +1228,68 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
                 self.set_delegate(self._find_delegate(root_package, alias_package))
             # end update data
 
-            if root_package.data().environment.inherit:
+            inherit = root_package.data().environment.inherit
+            if inherit:
                 # this is useful if we are started from another wrapper, or if
-                # Always copy the environment, never write it directly to assure we can do in-process launches
-                self._environ.update(os.environ)
-
-                if PY2:
-                    # Now we can easily get variable values with non-ascii characters in them, which breaks
-                    # necks in py2.
-                    # Just be sure we get them into a usable format. Also note that unicode in environments
-                    # is ok on posix, but not on windows, and even on posix we have to be sure
-                    # there is nothing non-ascii, as python tries to do that for us otherwise. Py3 is fine !
-                    def convert_if_needed(item):
-                        if isinstance(item, bytes):
-                            return item.decode(DEFAULT_ENCODING, 'replace').encode('ascii', 'replace')
-                        return item
-                    # end utility
-
-                    for k, v in self._environ.items():
-                        self._environ[convert_if_needed(k)] = convert_if_needed(v)
-                    # end handle unicode conversion
-                # end
+                self._inherit_environment()
             # end reuse full parent environment
+            inherited_environ = dict(self._environ)
 
             # PREPARE PROCESS ENVIRONMENT
             ##############################
             delegate = self.delegate()
             log.log(TRACE, "Using delegate of type '%s'", type(delegate).__name__)
 
-            # In order to allow skipping particular packages, we keep an ignore list
-            # It is just implemented here as this is the only place where it should be required
-            exclude_packages = set()
-
-            # A dictionary holding all variables we set - paths use a list, everything
-            # else a simple key-value pair
-            debug = dict()
-            cwd_handled = False  # Will be True if a package altered the current working dir
-
-            normpath = lambda p: pm.environment.normalize_paths and p.normpath() or p
-            for package_name, depth in self._iter_(program, self.upstream, self.breadth_first):
-                log.debug("Using package '%s'", package_name)
-                # save this one call ...
-                if package_name == program:
-                    package = root_package
-                else:
-                    package = self._package(package_name)
-                # end save one package call
-
-                # don't exclude what's in an excluded package
-                if package_name in exclude_packages:
-                    log.debug("Excluding %s", package_name)
-                    continue
-                # end ignore excluded packages
-
-                # update ex
-                exclude_packages |= set(package.data().ignore)
-                if package.data().ignore:
-                    log.debug('%s: added exclude packages %s', package_name, ', '.join(package.data().ignore))
-                # end handle logging
-
-                # Adjust arguments
-                ####################
-                pargs = package.data().arguments
-                self._args = pargs.prepend + self._args
-                self._args.extend(pargs.append)
-                self._resolve_args |= pargs.resolve
-
-                # CWD Adjustment
-                if not cwd_handled and package.data().cwd:
-                    new_cwd = package.data().cwd
-                    if self._cwd == os.getcwd():
-                        log.debug("%s: setting cwd override to '%s'", package_name, new_cwd)
-                        # Only set it if the directory existed
-                        if new_cwd.isdir():
-                            self._cwd = new_cwd
-                        else:
-                            log.error(
-                                "%s: Configured working directory '%s' was not accessible - ignoring it", package_name, new_cwd)
-                        # end assure it exists
-
-                    else:
-                        log.debug(
-                            "%s: Will not use package-cwd '%s' as the cwd was overridden by caller", package_name, new_cwd)
-                    # end don't change overridden cwd
-                    cwd_handled = True
-                # end first one to set cwd wins
-
-                # Special Search Paths
-                #######################
-                resolve_evars = package.data().environment.resolve
-                for evar, paths in ((ld_env_var, package.data().environment.linker_search_paths),
-                                    (exec_env_var, package.data().environment.executable_search_paths)):
-                    for path in paths:
-                        if resolve_evars:
-                            path = delegate.resolve_value(path, self._environ)
-                        # end
-                        path = delegate.verify_path(evar, package.to_abs_path(path))
-                        if path is not None:
-                            path = normpath(path)
-                            debug.setdefault(evar, list()).append((str(path), package_name))
-                            update_env_path(evar, path, append=True, environment=self._environ)
-                        # end append path if possible
-                    # end for each path
-                # end for each special environment variable
-
-                # Set environment variables
-                ############################
-                for evar, values in list(package.data().environment.variables.items()):
-                    evar_is_path = delegate.variable_is_path(evar)
-                    for value in values:
-                        # for now we append, as we walk dependencies breadth-first and items coming later
-                        # should be effective later
-                        if resolve_evars:
-                            value = delegate.resolve_value(value, self._environ)
-                        # end
-                        if evar_is_path:
-                            value = delegate.verify_path(evar, package.to_abs_path(value))
-                            if value is None:
-                                continue
-                            # end handle invalid path
-                            value = normpath(value)
-                        # end prepare path's value
-
-                        if evar_is_path and delegate.variable_is_appendable(evar, value):
-                            debug.setdefault(evar, list()).append((str(value), package_name))
-                            update_env_path(evar, value, append=True, environment=self._environ)
-                        else:
-                            # Packages coming in later will overwrite previous values, in any case
-                            if evar in self._environ:
-                                log.debug("%s: overwriting variable %s with previous value '%s'",
-                                          package_name, evar, self._environ[evar])
-                            # end
-                            debug[evar] = (str(value), package_name)
-                            self._environ[evar] = str(value)
-                        # end handle path variables
-                    # end for each value to set
-                # end for each variable,values tuple
-
-                # BUILD TRANSACTION
-                ###################
-                for action_key in package.data().actions:
-                    Action = delegate.action(action_key)
-                    # TODO: It looks odd if it adds itself implicitly, possibly change that to be added explicitly
-                    log.debug("Adding action '%s'", action_key)
-                    Action(delegate.transaction(), action_key, Action.data(action_key), package_name, package.data())
-                # end for each action
-            # end for each program
+            with startup_timing.phase('environment build'):
+                env, plan_values, plan_paths, propagate = self._build_environment(program, root_package, delegate,
+                                                                                  pm.environment.normalize_paths)
+            # end record timing
         except KeyError as err:
             msg = "Configuration for program '%s' not found - error was: %s" % (package_name, str(err))
             raise EnvironmentError(msg)
         # end handle unknown dependencies
 
+        if propagate:
+            defaults = [prefix.format(program=program) for prefix in self.default_propagated_settings]
+            self._propagate = list(OrderedDict.fromkeys(defaults + propagate))
+        # end handle settings to propagate
+
         # Obtain the executable path one more time, after all, it may be dependent on environment
         # variables that want to be resolved now
-        self._executable_path = alias_package.executable(self._environ)
+        self._environ = env.environment()
+        self._executable_path = alias_package.executable(self._environ, self._stat_cache)
 
         # We also have to resolve all values, unconditionally.
-        for evar, value in self._environ.items():
-            if '$' not in value:
-                continue
-            self._environ[evar] = delegate.resolve_value(value, self._environ)
-        # end for each variable to subsitiute
+        plan_values.extend(value for value in self._environ.values() if '$' in value)
+        self._environ = env.resolved_environment(delegate.resolve_value)
+
+        # Cache the launch plan if it doesn't depend on anything but the configuration and environment.
+        # Custom delegates, transactions and changes to the context by the delegate could do anything.
+        if plan_cache is not None and type(delegate) is self.ProcessControllerDelegateType and \
+                not context_changed and not delegate.has_transaction():
+            if inherit:
+                environ = dict((k, v) for k, v in self._environ.items() if inherited_environ.get(k) != v)
+            else:
+                environ = self._environ
+            # end handle inherited environment
+            plan_values.extend(self._args)
+            plan_values.extend(alias_package.data().executable)
+            all_environ = dict(os.environ)
+            all_environ.update(self._environ)
+            names = LaunchPlanCache.environment_references(plan_values, all_environ) | set(environ.keys())
+            plan_cache.put(plan_key, LaunchPlanCache.new_plan(inherit, environ, self._args, self._cwd,
+                                                              self._executable_path, self._resolve_args,
+                                                              dict((name, os.environ.get(name)) for name in names),
+                                                              plan_paths, self._propagate))
+        # end store launch plan
 
         # DEBUGGING
         ############
         if self.is_debug_mode():
             # print out all files participating in environment stack
             log.debug("EFFECTIVE WRAPPER ENVIRONMENT VARIABLES (with possibly unresolved $VARIABLE_SUBSTITUTIONS)")
-            log.debug(pformat(debug))
+            log.debug(pformat(env.contributions()))
             log.debug("ENTIRE ENVIRONMENT (INCLUDING $VARIABLE_SUBSTITUTIONS)")
-            from butility import OrderedDict
             log.debug(OrderedDict(self._environ))
         # end show debug information
 
@@ -1069,15 +1298,10 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
             raise self._next_exception()
         # end
 
-    def execute(self):
-        """execute the executable we were initialized with, based on the context we built during initialization
-        @return spawned or forked process instance of type Subprocess.Popen after it finished execution.
-        Alterntively it can execv() a process and never returns.
-        @note if execv is used, you should shutdown your frameworks and release your resources before 
-        calling this method
-        @throws EnvironmentError if the executable cannot be found, or if program configuration could not be
-        determined.
-        """
+    def _prepare_launch(self):
+        """Prepare everything to launch our program, and store the process information in its environment
+        @return tuple(delegate, args, cwd, env, launch_mode) with everything needed by delegate.start()
+        @throws EnvironmentError if the executable cannot be found"""
         # Prepare EXECUTABLE
         #####################
         # Its not required to have a valid root unless the executable or one of the  is relative
@@ -1097,7 +1321,8 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
         # NOTE: This should be part of the delegate, and generally we would need to separate classes more
         # as this file is way too big !!
         ControlledProcessInformation.store(env, self._app.context(),
-                                           chunk_size=delegate.environment_storage_chunk_size())
+                                           chunk_size=delegate.environment_storage_chunk_size(),
+                                           key_prefixes=self._propagate)
 
         # we just use replace mode by default
         launch_mode = delegate.launch_mode() or delegate.LAUNCH_MODE_REPLACE
@@ -1121,6 +1346,18 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
             st.print_stats()
         # end print profile results
 
+        return delegate, args, cwd, env, launch_mode
+
+    def execute(self):
+        """execute the executable we were initialized with, based on the context we built during initialization
+        @return spawned or forked process instance of type Subprocess.Popen after it finished execution.
+        Alterntively it can execv() a process and never returns.
+        @note if execv is used, you should shutdown your frameworks and release your resources before 
+        calling this method
+        @throws EnvironmentError if the executable cannot be found, or if program configuration could not be
+        determined.
+        """
+        delegate, args, cwd, env, launch_mode = self._prepare_launch()
         if not self._dry_run:
             return delegate.start(args, cwd, env, launch_mode)
         else:
@@ -1145,3 +1382,92 @@ class ProcessController(GraphIterator, LazyMixin, ApplicationSettingsMixin):
     # -- End Interface -- @}
 
 # end class ProcessController
+
+
+# ==============================================================================
+# @name Asynchronous Execution
+# ------------------------------------------------------------------------------
+# @{
+
+def execute_concurrently(controllers, max_concurrency=4, stdout_handler=None, stderr_handler=None):
+    """Launch the programs of all given controllers using ProcessController.execute_async(), running at most
+    max_concurrency of them at a time.
+    @param controllers iterable of initialized ProcessController instances
+    @param max_concurrency maximum amount of programs to run concurrently
+    @param stdout_handler if not None, a function f(controller, line) called with each line the program of
+    controller writes to its standard output
+    @param stderr_handler like stdout_handler, but for the standard error
+    @return an asyncio.Future resolving to a list of finished processes, one per controller, in order.
+    If one program can't be launched, the future fails and all running ones are killed, which also happens
+    if it is cancelled.
+    @note run it with asyncio.get_event_loop().run_until_complete(execute_concurrently(...))"""
+    assert max_concurrency > 0, 'need to run at least one program at a time'
+    if asyncio is None:
+        raise EnvironmentError("Asynchronous process launches require asyncio")
+    # end handle python version
+
+    pending = list(reversed(list(enumerate(controllers))))
+    processes = [None] * len(pending)
+    running = dict()    # future -> index of controller
+    result = asyncio.get_event_loop().create_future()
+
+    def handler(fun, controller):
+        return fun and functools.partial(fun, controller)
+    # end utility
+
+    def fail(err):
+        result.set_exception(err)
+        for future in list(running):
+            future.cancel()
+        # end for each future to cancel
+    # end utility
+
+    def start_next():
+        while pending and len(running) < max_concurrency and not result.done():
+            index, controller = pending.pop()
+            try:
+                future = controller.execute_async(handler(stdout_handler, controller),
+                                                  handler(stderr_handler, controller))
+            except Exception as err:
+                fail(err)
+                return
+            # end handle launch errors
+            running[future] = index
+            future.add_done_callback(finished)
+        # end while we can launch programs
+        if not running and not pending and not result.done():
+            result.set_result(processes)
+        # end handle completion
+    # end utility
+
+    def finished(future):
+        index = running.pop(future)
+        error = not future.cancelled() and future.exception() or None
+        if result.done():
+            return
+        # end handle cancellation
+        if future.cancelled():
+            result.cancel()
+            return
+        # end handle cancelled programs
+        if error is not None:
+            fail(error)
+            return
+        # end handle failed programs
+        processes[index] = future.result()
+        start_next()
+    # end utility
+
+    def cancelled(future):
+        if future.cancelled():
+            for pending_future in list(running):
+                pending_future.cancel()
+            # end for each future to cancel
+        # end handle cancellation
+    # end utility
+
+    result.add_done_callback(cancelled)
+    start_next()
+    return result
+
+# -- End Asynchronous Execution -- @}
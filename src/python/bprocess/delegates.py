@@ -17,6 +17,7 @@ __all__ = ['ProcessControllerDelegate', 'ApplyChangeContext', 'ProxyProcessContr
 import os
 import sys
 import re
+import socket
 import logging
 import subprocess
 
@@ -36,7 +37,9 @@ from bcontext import (Context,
 from .interfaces import IProcessControllerDelegate
 
 from butility import (update_env_path,
+                      startup_timing,
                       DEFAULT_ENCODING)
+from butility.compat import asyncio
 
 from .actions import ActionDelegateMixin
 
@@ -46,7 +49,10 @@ from .schema import (controller_schema,
                      proxy_delegate_package_schema,
                      NamedServiceProcessControllerDelegate)
 
-from .utility import PackageDataIteratorMixin
+from .utility import (PackageDataIteratorMixin,
+                      PathStatCache)
+from .forkserver import (ForkServerClient,
+                         python_command)
 from butility import (Path,
                       ProxyMeta)
 
@@ -58,6 +64,69 @@ log = logging.getLogger('bprocess.delegate')
 # ------------------------------------------------------------------------------
 # @{
 
+def _chain_future(source, target):
+    """Make target receive the outcome of the source future, and cancel source if target is cancelled"""
+    def copy(future):
+        error = not future.cancelled() and future.exception() or None
+        if target.done():
+            return
+        # end handle cancelled target
+        if future.cancelled():
+            target.cancel()
+        elif error is not None:
+            target.set_exception(error)
+        else:
+            target.set_result(future.result())
+        # end handle outcome
+    # end utility
+
+    def cancel(future):
+        if future.cancelled():
+            source.cancel()
+        # end handle cancellation
+    # end utility
+
+    source.add_done_callback(copy)
+    target.add_done_callback(cancel)
+
+
+def _read_lines(loop, stream, handler):
+    """Call handler with each line read from the given asyncio.StreamReader
+    @return a future which is done once the end of the stream was reached"""
+    result = loop.create_future()
+
+    def read_next():
+        reading = asyncio.ensure_future(stream.readline(), loop=loop)
+        reading.add_done_callback(on_line)
+        return reading
+    # end utility
+
+    def on_line(future):
+        if result.done():
+            return
+        # end handle cancellation
+        try:
+            line = future.result()
+            if not line:
+                result.set_result(None)
+                return
+            # end handle end of stream
+            handler(line)
+        except BaseException as err:
+            if future.cancelled():
+                result.cancel()
+            else:
+                result.set_exception(err)
+            # end handle cancellation
+            return
+        # end handle errors
+        read_next()
+    # end utility
+
+    read_next()
+    return result
+
+
 class SimpleProxyProcessControllerDelegate(object):
 
     """A simple proxy which behaves differently based on its input channel arguments"""
@@ -156,7 +225,7 @@ class ProcessControllerDelegate(IProcessControllerDelegate, ActionDelegateMixin,
     It is possible to provide arguments that are interpreted only by the wrappers delegate. Those arguments
     start with a triple-dash ('---') and can be the following
     """
-    __slots__ = ('_controller_settings', '_package_name')
+    __slots__ = ('_controller_settings', '_package_name', '_stat_cache')
 
     # if True, configuration will be parsed from paths given as commandline argument. This is useful
     # to extract context based on passed files (for instance, for rendering)
@@ -170,6 +239,7 @@ class ProcessControllerDelegate(IProcessControllerDelegate, ActionDelegateMixin,
         self._package_name = package_name
         self._controller_settings = \
             self._app.context().settings().value_by_schema(package_manager_schema, resolve=True).environment.variables
+        self._stat_cache = PathStatCache()
 
     # -------------------------
     # @name Configuration
@@ -181,6 +251,16 @@ class ProcessControllerDelegate(IProcessControllerDelegate, ActionDelegateMixin,
     # The type we use when instantiating our own context types
     StackAwareHierarchicalContextType = StackAwareHierarchicalContext
 
+    # Maps the names allowed in the 'launch_mode' field of a package to the respective launch mode
+    launch_mode_names = {'replace': IProcessControllerDelegate.LAUNCH_MODE_REPLACE,
+                         'child': IProcessControllerDelegate.LAUNCH_MODE_CHILD,
+                         'sibling': IProcessControllerDelegate.LAUNCH_MODE_SIBLING,
+                         'forkserver': IProcessControllerDelegate.LAUNCH_MODE_FORKSERVER}
+
+    # Environment variables which influence the modules a python interpreter imports. Fork servers are kept
+    # per program and value of these variables
+    forkserver_environment_variables = ('PYTHONPATH', 'PYTHONHOME', 'LD_LIBRARY_PATH')
+
     # -- End Configuration -- @}
 
     def environment_storage_chunk_size(self):
@@ -229,11 +309,18 @@ class ProcessControllerDelegate(IProcessControllerDelegate, ActionDelegateMixin,
         @note we assume that variables will be substituted later, and must let it pass"""
         if path.containsvars():
             return path
-        if not path.exists():
+        if not self._stat_cache.exists(path):
             log.warn("%s: '%s' dropped as it could not be read", environment_variable, path)
             return None
         return path
 
+    def verify_paths(self, items):
+        """Obtains information about all paths concurrently, before calling verify_path() on each of them
+        @note results are cached for the lifetime of this instance"""
+        items = list(items)
+        self._stat_cache.prefetch(path for evar, path in items if not path.containsvars())
+        return [self.verify_path(evar, path) for evar, path in items]
+
     def resolve_arg(self, arg, env):
         """@return the argument without any environment variables
         @note this method exists primarly for interception by subclasses"""
@@ -261,18 +348,36 @@ class ProcessControllerDelegate(IProcessControllerDelegate, ActionDelegateMixin,
         # end for arg in args
 
         if self.has_transaction():
-            if self.transaction().apply().failed():
+            with startup_timing.phase('transaction apply'):
+                failed = self.transaction().apply().failed()
+            # end record timing
+            if failed:
                 raise self.transaction().exception()
+            # end handle failure
+            self.transaction().commit()
         # end handle transaction
 
         return (executable, env, new_args, cwd)
 
     def launch_mode(self):
-        """@return fork by default, or spawn if required"""
+        """@return the launch mode configured for our package, replace by default, or spawn if required
+        @throw ValueError if the configured launch mode is unknown"""
         if self.has_transaction():
-            return any(op.delegate_must_spawn is not None and op.delegate_must_spawn or False for op in self.transaction()) and self.LAUNCH_MODE_CHILD or None
+            if any(op.delegate_must_spawn is not None and op.delegate_must_spawn or False for op in self.transaction()):
+                return self.LAUNCH_MODE_CHILD
+            # end handle spawn
         # end
-        return self.LAUNCH_MODE_REPLACE
+        name = self._app.context().settings().value('%s.%s.launch_mode' % (controller_schema.key(),
+                                                                           self._package_name), '')
+        if not name:
+            return not self.has_transaction() and self.LAUNCH_MODE_REPLACE or None
+        # end handle default
+        try:
+            return self.launch_mode_names[name]
+        except KeyError:
+            raise ValueError("Invalid launch_mode '%s' in package '%s' - must be one of %s"
+                             % (name, self._package_name, ', '.join(sorted(self.launch_mode_names))))
+        # end provide nice error
 
     def process_filedescriptors(self):
         """Default implementation uses no stdin, and connects the parent processes stderr and stdout to the
@@ -284,6 +389,53 @@ class ProcessControllerDelegate(IProcessControllerDelegate, ActionDelegateMixin,
         process.communicate()
         return process
 
+    def communicate_async(self, process, stdout_handler=None, stderr_handler=None):
+        """Pass all lines of the piped channels of the process to the respective handler, and wait for it
+        to finish"""
+        loop = asyncio.get_event_loop()
+        futures = list()
+        for stream, handler in ((process.stdout, stdout_handler), (process.stderr, stderr_handler)):
+            if stream is not None:
+                futures.append(_read_lines(loop, stream, handler or (lambda line: None)))
+            # end handle piped stream
+        # end for each channel
+        futures.append(asyncio.ensure_future(process.wait(), loop=loop))
+
+        result = loop.create_future()
+
+        def done(future):
+            # always retrieve the exception, even if we are cancelled already
+            error = not future.cancelled() and future.exception() or None
+            if result.done():
+                return
+            # end handle cancellation
+            if future.cancelled():
+                result.cancel()
+            elif error is not None:
+                result.set_exception(error)
+            else:
+                result.set_result(process)
+            # end handle outcome
+        # end utility
+
+        def finished(future):
+            if not future.cancelled() and future.exception() is None:
+                return
+            # end ignore regular results
+            for pending in futures:
+                pending.cancel()
+            # end for each future to cancel
+            if process.returncode is None:
+                log.debug("Killing process %i as its communication was cancelled or failed", process.pid)
+                process.kill()
+            # end kill running process
+        # end utility
+
+        gathered = asyncio.gather(*futures)
+        gathered.add_done_callback(done)
+        result.add_done_callback(finished)
+        return result
+
     # -------------------------
     # @name Subclass Interface
     # @{
@@ -386,6 +538,87 @@ class ProcessControllerDelegate(IProcessControllerDelegate, ActionDelegateMixin,
 
         return new_env
 
+    def _start_in_forkserver(self, args, cwd, env):
+        """Start the program defined by args in a fork server, which is started on demand
+        @return a ForkServerProcess instance, or None if the program can't be started that way. This is the case
+        if it isn't a python program, or if it needs a standard input
+        @note the fork server is started with the given environment, which is why it is used to identify it"""
+        if os.name != 'posix':
+            return None
+        # end handle platform
+        command = python_command(args)
+        if command is None:
+            return None
+        # end handle non-python programs
+
+        stdin, stdout, stderr = self.process_filedescriptors()
+        if stdin is not None or any(channel is not None and not hasattr(channel, 'fileno')
+                                    for channel in (stdout, stderr)):
+            return None
+        # end handle unsupported channels
+
+        fingerprint = ForkServerClient.fingerprint(self._package_name, args[0],
+                                                   *(env.get(name) for name in self.forkserver_environment_variables))
+        try:
+            client = ForkServerClient(ForkServerClient.socket_path(fingerprint))
+            return client.spawn(args[0], command, env, cwd, stdout, stderr)
+        except (socket.error, EOFError, OSError) as err:
+            log.warn("Could not use fork server for '%s' (%s) - falling back to spawning it", self._package_name, err)
+            return None
+        # end handle server errors
+
+    def start_async(self, args, cwd, env, stdout_handler=None, stderr_handler=None):
+        """Like start() in LAUNCH_MODE_CHILD, but without blocking, using asyncio.
+        @param stdout_handler if not None, the standard output is piped and each line is passed to it,
+        see communicate_async()
+        @param stderr_handler like stdout_handler, but for the standard error
+        @return an asyncio.Future resolving to the asyncio.subprocess.Process once it is done, as returned by
+        communicate_async()
+        @throw EnvironmentError if asyncio isn't available"""
+        if asyncio is None:
+            raise EnvironmentError("Asynchronous process launches require asyncio")
+        # end handle python version
+        loop = asyncio.get_event_loop()
+        stdin, stdout, stderr = self.process_filedescriptors()
+        if stdout_handler is not None:
+            stdout = asyncio.subprocess.PIPE
+        # end pipe stdout
+        if stderr_handler is not None:
+            stderr = asyncio.subprocess.PIPE
+        # end pipe stderr
+
+        result = loop.create_future()
+        starting = asyncio.ensure_future(asyncio.create_subprocess_exec(*args,
+                                                                         stdin=stdin, stdout=stdout, stderr=stderr,
+                                                                         cwd=cwd, env=self._sanitize_environment(env)),
+                                         loop=loop)
+
+        def started(future):
+            if result.done():
+                return
+            # end handle cancellation
+            if future.cancelled():
+                result.cancel()
+                return
+            # end handle cancelled start
+            if future.exception() is not None:
+                result.set_exception(future.exception())
+                return
+            # end handle failed start
+            communicating = self.communicate_async(future.result(), stdout_handler, stderr_handler)
+            _chain_future(communicating, result)
+        # end utility
+
+        def cancelled(future):
+            if future.cancelled():
+                starting.cancel()
+            # end cancel start
+        # end utility
+
+        starting.add_done_callback(started)
+        result.add_done_callback(cancelled)
+        return result
+
     def start(self, args, cwd, env, launch_mode):
         """Called to actually launch the process using the given arguments. Unless launch_mode is 'replace, this 
         method will not return. Otherwise it returns the Subprocess.popen process
@@ -401,6 +634,14 @@ class ProcessControllerDelegate(IProcessControllerDelegate, ActionDelegateMixin,
 
         env = self._sanitize_environment(env)
 
+        if launch_mode == self.LAUNCH_MODE_FORKSERVER:
+            process = self._start_in_forkserver(args, cwd, env)
+            if process is not None:
+                return self.communicate(process)
+            # end handle forked process
+            launch_mode = self.LAUNCH_MODE_CHILD
+        # end handle fork server
+
         if launch_mode == self.LAUNCH_MODE_CHILD:
             stdin, stdout, stderr = self.process_filedescriptors()
             process = subprocess.Popen(args, shell=False,
@@ -0,0 +1,779 @@
+#-*-coding:utf-8-*-
+"""
+@package bprocess.forkserver
+@brief A server keeping a warm python interpreter around, to launch python programs from it using fork()
+
+Launching a python program usually requires the interpreter to start, and to import bcore, before the program
+can do anything useful. The ForkServer does all that once, and forks a new worker process for each program
+to launch, which then only has to set its environment, arguments and working directory.
+
+The standard output and error channels of the worker are streamed back to the client through the
+unix domain socket the server is listening on.
+
+@note only works on posix, and only for non-interactive programs, as the standard input of workers is
+always empty.
+@author Sebastian Thiel
+@copyright [GNU Lesser General Public License](https://www.gnu.org/licenses/lgpl.html)
+"""
+from __future__ import unicode_literals
+from butility.future import PY2
+__all__ = ['ForkServer', 'ForkServerClient', 'ForkServerProcess', 'BootstrapServer', 'python_command']
+
+import os
+import sys
+import re
+import imp
+import time
+import errno
+import select
+import signal
+import socket
+import stat
+import struct
+import hashlib
+import logging
+import tempfile
+import traceback
+import subprocess
+
+from butility import (login_name,
+                      DEFAULT_ENCODING)
+from butility.compat import pickle
+
+log = logging.getLogger('bprocess.forkserver')
+
+
+# ==============================================================================
+# @name Protocol
+# ------------------------------------------------------------------------------
+# Each message is a frame, made of a channel id, the length of the payload and the payload itself.
+# @{
+
+# The client sends a pickled dict with the command, environment and working directory to use
+CHANNEL_REQUEST = 0
+# Output of the worker, sent by the server
+CHANNEL_STDOUT = 1
+CHANNEL_STDERR = 2
+# The server sends the pickled process id of the worker once it was started
+CHANNEL_STARTED = 3
+# The server sends the pickled return code once the worker is done
+CHANNEL_RESULT = 4
+# The client asks the server to exit, instead of sending a request
+CHANNEL_SHUTDOWN = 5
+
+_header = struct.Struct(str('!BI'))
+
+
+def _send_frame(sock, channel, data):
+    """Send the given data through the given socket as a frame"""
+    sock.sendall(_header.pack(channel, len(data)) + data)
+
+
+def _recv_exactly(sock, size):
+    """@return exactly size bytes read from the given socket
+    @throw EOFError if the socket was closed before"""
+    chunks = list()
+    while size:
+        chunk = sock.recv(min(size, 65536))
+        if not chunk:
+            raise EOFError("Connection was closed unexpectedly")
+        # end handle closed connection
+        chunks.append(chunk)
+        size -= len(chunk)
+    # end while there is something to read
+    return b''.join(chunks)
+
+
+def _recv_frame(sock):
+    """@return tuple(channel, data) of the next frame read from the given socket"""
+    channel, size = _header.unpack(_recv_exactly(sock, _header.size))
+    return channel, _recv_exactly(sock, size)
+
+
+def _peer_uid(sock):
+    """@return the user id of the process at the other end of the given unix domain socket, or None if the
+    platform doesn't tell us"""
+    option = getattr(socket, 'SO_PEERCRED', sys.platform.startswith('linux') and 17 or None)
+    if option is None:
+        return None
+    # end handle unsupported platforms
+    return struct.unpack(str('3i'), sock.getsockopt(socket.SOL_SOCKET, option, struct.calcsize(str('3i'))))[1]
+
+
+def _private_directory(directory):
+    """@return directory, which is created if needed
+    @throw OSError if it is not safe to keep sockets in it, as it is a symlink, isn't owned by us or is
+    accessible by others"""
+    try:
+        os.makedirs(directory, 0o700)
+    except OSError:
+        pass
+    # end ignore existing directories, lstat() tells us what we have
+    info = os.lstat(directory)
+    if not stat.S_ISDIR(info.st_mode) or info.st_uid != os.getuid() or info.st_mode & 0o077:
+        raise OSError(errno.EACCES, "Directory is not private to the current user", directory)
+    # end handle unsafe directories
+    return directory
+
+# -- End Protocol -- @}
+
+
+# ==============================================================================
+# @name Utilities
+# ------------------------------------------------------------------------------
+# @{
+
+# Matches the basename of python interpreters
+re_python_executable = re.compile(r'^python[0-9.]*(\.exe)?$')
+
+
+def python_command(args):
+    """@return a tuple of (mode, target, argv) if the given arguments run a python program in a way we can
+    emulate in a forked interpreter, or None otherwise.
+    Supported are 'python -c code [args]', 'python -m module [args]' and 'python script.py [args]'.
+    mode is one of '-c', '-m' or 'script', target is the code, module or script, and argv is what the program
+    will see in sys.argv
+    @param args list of arguments, the first one is the executable"""
+    if len(args) < 2 or not re_python_executable.match(os.path.basename(args[0])):
+        return None
+    # end handle non-python programs and interactive interpreters
+    if args[1] in ('-c', '-m'):
+        if len(args) < 3:
+            return None
+        # end handle missing target
+        return (args[1], args[2], [args[1] == '-c' and '-c' or args[2]] + list(args[3:]))
+    # end handle code and modules
+    if args[1].startswith('-'):
+        return None
+    # end handle interpreter flags, which we don't support
+    return ('script', args[1], list(args[1:]))
+
+
+def _run_python(mode, target, argv):
+    """Run the given python program in the current interpreter, like the interpreter itself would do it
+    @return exit code of the program"""
+    import runpy
+    sys.argv = list(argv)
+    try:
+        if mode == '-m':
+            runpy.run_module(target, run_name='__main__', alter_sys=True)
+        elif mode == 'script':
+            sys.path[0] = os.path.dirname(os.path.abspath(target))
+            runpy.run_path(target, run_name='__main__')
+        else:
+            module = imp.new_module(str('__main__'))
+            sys.modules['__main__'] = module
+            exec(compile(target, '<string>', 'exec'), module.__dict__)
+        # end handle mode
+    except SystemExit as err:
+        if err.code is None or isinstance(err.code, int):
+            return err.code or 0
+        # end handle numeric codes
+        sys.stderr.write('%s\n' % err.code)
+        return 1
+    except BaseException:
+        traceback.print_exc()
+        return 1
+    # end handle exceptions
+    return 0
+
+
+def _native(value):
+    """@return value as native string, which are bytes in python 2"""
+    if isinstance(value, bytes):
+        return value
+    return value.encode(DEFAULT_ENCODING)
+
+
+def _run_worker(request, stdout_fd, stderr_fd):
+    """Setup the current forked process according to request, and run its program. Never returns"""
+    code = 1
+    try:
+        devnull = os.open(os.devnull, os.O_RDONLY)
+        os.dup2(devnull, 0)
+        os.dup2(stdout_fd, 1)
+        os.dup2(stderr_fd, 2)
+        for fd in (devnull, stdout_fd, stderr_fd):
+            os.close(fd)
+        # end for each file descriptor we don't need anymore
+
+        os.chdir(request['cwd'])
+        env = request['env']
+        if PY2:
+            env = dict((_native(k), _native(v)) for k, v in env.items())
+        # end assure native strings
+        os.environ.clear()
+        os.environ.update(env)
+        code = _run_python(*request['command'])
+
+        import atexit
+        getattr(atexit, '_run_exitfuncs', lambda: None)()
+    except BaseException:
+        traceback.print_exc()
+    finally:
+        for stream in (sys.stdout, sys.stderr):
+            try:
+                stream.flush()
+            except Exception:
+                pass
+            # end ignore closed streams
+        # end for each stream to flush
+        os._exit(code)
+    # end assure we never return
+
+
+def _returncode(status):
+    """@return a return code like the one of subprocess.Popen from the given os.waitpid() status"""
+    if os.WIFSIGNALED(status):
+        return -os.WTERMSIG(status)
+    return os.WEXITSTATUS(status)
+
+# -- End Utilities -- @}
+
+
+class ForkServer(object):
+
+    """A server listening on a unix domain socket, forking a worker for each requested python program.
+
+    It exits once it was idle for a while, and removes its socket file.
+    """
+    __slots__ = (
+        '_socket_path',   # path to our unix domain socket
+        '_idle_timeout',  # seconds without any request after which we exit
+        '_sessions',      # set of process ids of all sessions currently in progress
+        '_shutdown_fd'    # write end of a pipe to ask the serve() loop to exit, or None if we are not serving
+    )
+
+    # -------------------------
+    # @name Configuration
+    # @{
+
+    # Seconds to wait for connections, before checking our idle time
+    poll_interval = 0.5
+
+    # -- End Configuration -- @}
+
+    def __init__(self, socket_path, idle_timeout=300):
+        """Initialize this instance
+        @param socket_path path at which to create our unix domain socket
+        @param idle_timeout seconds without requests after which the server exits"""
+        self._socket_path = socket_path
+        self._idle_timeout = idle_timeout
+        self._sessions = set()
+        self._shutdown_fd = None
+
+    # -------------------------
+    # @name Utilities
+    # @{
+
+    def _reap_sessions(self):
+        """Collect the status of all sessions which are done"""
+        for pid in list(self._sessions):
+            try:
+                done, status = os.waitpid(pid, os.WNOHANG)
+            except OSError:
+                done = pid
+            # end handle sessions we don't know anymore
+            if done:
+                self._sessions.remove(pid)
+            # end forget finished sessions
+        # end for each session
+
+    def _request_shutdown(self, *args):
+        """Ask the serve() loop to exit. It is safe to call from signal handlers and from sessions"""
+        try:
+            os.write(self._shutdown_fd, b'x')
+        except OSError:
+            pass
+        # end ignore full pipes, a shutdown is requested already
+
+    def _bind(self):
+        """@return a listening socket, or None if another server is listening on our socket already"""
+        listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if os.path.exists(self._socket_path):
+            try:
+                listener.connect(self._socket_path)
+                listener.close()
+                return None
+            except socket.error:
+                os.remove(self._socket_path)
+            # end handle stale socket files
+            listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # end handle existing socket
+        listener.bind(self._socket_path)
+        listener.listen(16)
+        listener.settimeout(self.poll_interval)
+        return listener
+
+    def _handle(self, connection):
+        """Handle the request on the given connection in a forked session process"""
+        channel, data = _recv_frame(connection)
+        if channel == CHANNEL_SHUTDOWN:
+            self._request_shutdown()
+            return
+        # end handle shutdown
+        assert channel == CHANNEL_REQUEST, "Expected request, got channel %i" % channel
+        self._handle_request(connection, pickle.loads(data))
+
+    # -- End Utilities -- @}
+
+    # -------------------------
+    # @name Subclass Interface
+    # @{
+
+    def _handle_request(self, connection, request):
+        """Handle the given request, running in a forked session process.
+        A worker is forked for the requested program, and its output is sent to the client until it is done"""
+        stdout_r, stdout_w = os.pipe()
+        stderr_r, stderr_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            connection.close()
+            os.close(stdout_r)
+            os.close(stderr_r)
+            _run_worker(request, stdout_w, stderr_w)
+        # end handle worker
+        os.close(stdout_w)
+        os.close(stderr_w)
+
+        try:
+            _send_frame(connection, CHANNEL_STARTED, pickle.dumps(pid, 2))
+            channels = {stdout_r: CHANNEL_STDOUT, stderr_r: CHANNEL_STDERR}
+            while channels:
+                for fd in select.select(list(channels), [], [])[0]:
+                    data = os.read(fd, 65536)
+                    if not data:
+                        os.close(fd)
+                        del channels[fd]
+                        continue
+                    # end handle closed pipe
+                    _send_frame(connection, channels[fd], data)
+                # end for each readable pipe
+            # end while the worker has open pipes
+            returncode = _returncode(os.waitpid(pid, 0)[1])
+            _send_frame(connection, CHANNEL_RESULT, pickle.dumps(returncode, 2))
+        except (socket.error, EOFError):
+            # the client is gone, and so is the reason to run the worker
+            os.kill(pid, signal.SIGTERM)
+            os.waitpid(pid, 0)
+        # end handle client disconnects
+
+    # -- End Subclass Interface -- @}
+
+    # -------------------------
+    # @name Interface
+    # @{
+
+    def serve(self, preload_modules=tuple()):
+        """Serve requests until we were idle for longer than our idle timeout, or until we are terminated.
+        If another server is listening on our socket already, we return immediately.
+        @param preload_modules names of modules to import before serving, to make them available to
+        all workers
+        @return self"""
+        for name in preload_modules:
+            __import__(name)
+        # end for each module to import
+
+        listener = self._bind()
+        if listener is None:
+            return self
+        # end handle other server
+
+        # Signal handlers only write to a pipe, which we watch along with the listener. Raising from within
+        # the handler could interrupt a fork(), and the exception might never reach us
+        import fcntl
+        shutdown_r, self._shutdown_fd = os.pipe()
+        fcntl.fcntl(self._shutdown_fd, fcntl.F_SETFL, fcntl.fcntl(self._shutdown_fd, fcntl.F_GETFL) | os.O_NONBLOCK)
+        previous_handler = signal.signal(signal.SIGTERM, self._request_shutdown)
+        last_activity = time.time()
+        try:
+            while True:
+                try:
+                    readable = select.select([listener, shutdown_r], [], [], self.poll_interval)[0]
+                except select.error as err:
+                    if err.args[0] != errno.EINTR:
+                        raise
+                    # end ignore interruptions
+                    readable = list()
+                # end handle signals
+                self._reap_sessions()
+                if shutdown_r in readable:
+                    break
+                # end handle shutdown requests
+
+                connection = None
+                if listener in readable:
+                    try:
+                        connection = listener.accept()[0]
+                    except socket.timeout:
+                        pass
+                    except socket.error as err:
+                        if err.args[0] not in (errno.EINTR, errno.EAGAIN):
+                            raise
+                        # end ignore interruptions
+                    # end handle clients which are gone already
+                # end accept connection
+
+                if connection is None:
+                    if not self._sessions and time.time() - last_activity > self._idle_timeout:
+                        break
+                    # end handle idle timeout
+                    continue
+                # end handle no connection
+                if _peer_uid(connection) not in (None, os.getuid()):
+                    log.warn("Rejected connection from user %i", _peer_uid(connection))
+                    connection.close()
+                    continue
+                # end never unpickle requests of other users
+
+                last_activity = time.time()
+                connection.settimeout(None)
+                pid = os.fork()
+                if pid == 0:
+                    code = 1
+                    try:
+                        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                        listener.close()
+                        os.close(shutdown_r)
+                        self._handle(connection)
+                        code = 0
+                    except BaseException:
+                        traceback.print_exc()
+                    finally:
+                        os._exit(code)
+                    # end assure we never return
+                # end handle session
+                connection.close()
+                self._sessions.add(pid)
+            # end serve until shutdown or idle
+        finally:
+            signal.signal(signal.SIGTERM, previous_handler)
+            os.close(shutdown_r)
+            os.close(self._shutdown_fd)
+            self._shutdown_fd = None
+            listener.close()
+            try:
+                os.remove(self._socket_path)
+            except OSError:
+                pass
+            # end ignore missing socket file
+        # end assure socket is removed
+        return self
+
+    # -- End Interface -- @}
+
+# end class ForkServer
+
+
+class ForkServerProcess(object):
+
+    """A handle to a program running in a fork server, which behaves similar to a subprocess.Popen instance.
+
+    Output of the program is written to the file descriptors of the given file objects while waiting for it.
+    """
+    __slots__ = (
+        '_connection',  # socket connected to the session serving our program
+        '_outputs',     # dict of channel: file descriptor to write output of the channel to
+        'pid',          # process id of the worker running our program
+        'returncode'    # return code of our program, or None if it is still running
+    )
+
+    def __init__(self, connection, pid, stdout=None, stderr=None):
+        """Initialize this instance
+        @param connection socket connected to the fork server
+        @param pid process id of the worker
+        @param stdout a file object to write the standard output to, or None to use our own one
+        @param stderr a file object to write the standard error to, or None to use our own one"""
+        self._connection = connection
+        self._outputs = {CHANNEL_STDOUT: (stdout or sys.__stdout__).fileno(),
+                         CHANNEL_STDERR: (stderr or sys.__stderr__).fileno()}
+        self.pid = pid
+        self.returncode = None
+
+    # -------------------------
+    # @name Interface
+    # @{
+
+    def poll(self):
+        """@return our return code, or None if the program is still running"""
+        return self.returncode
+
+    def wait(self):
+        """Write the output of the program until it is done
+        @return its return code"""
+        try:
+            while self.returncode is None:
+                channel, data = _recv_frame(self._connection)
+                if channel == CHANNEL_RESULT:
+                    self.returncode = pickle.loads(data)
+                    break
+                # end handle result
+                fd = self._outputs[channel]
+                while data:
+                    data = data[os.write(fd, data):]
+                # end assure everything is written
+            # end while program is running
+        finally:
+            if self.returncode is not None or sys.exc_info()[0] is not None:
+                self._connection.close()
+            # end close connection when done
+        # end assure connection is closed
+        return self.returncode
+
+    def communicate(self, input=None):
+        """Wait for the program to finish
+        @return (None, None), as output is never captured"""
+        assert input is None, "Cannot send input to programs in fork servers"
+        self.wait()
+        return (None, None)
+
+    # -- End Interface -- @}
+
+# end class ForkServerProcess
+
+
+class ForkServerClient(object):
+
+    """Launches python programs in a fork server, which is started on demand.
+
+    Each server is identified by a fingerprint, which must change whenever the interpreter, or the modules
+    it imported, would be different. Servers are kept in a directory private to the current user.
+    """
+    __slots__ = ('_socket_path')
+
+    # -------------------------
+    # @name Configuration
+    # @{
+
+    # Environment variable with the directory in which to keep server sockets. Defaults to a user-specific
+    # directory in $XDG_RUNTIME_DIR, or in the system's temporary directory if it is unset
+    directory_evar = 'BPROCESS_FORKSERVER_DIR'
+
+    # Seconds to wait for a newly started server to accept connections
+    startup_timeout = 10.0
+
+    # Seconds a server may be idle before it exits
+    idle_timeout = 300
+
+    # Modules the server imports before serving
+    preload_modules = ('bapp', 'bprocess')
+
+    # -- End Configuration -- @}
+
+    def __init__(self, socket_path):
+        """Initialize this instance
+        @param socket_path path to the socket of the server to use, see socket_path()"""
+        self._socket_path = socket_path
+
+    # -------------------------
+    # @name Utilities
+    # @{
+
+    def _connect(self):
+        """@return a socket connected to our server
+        @throw socket.error if there is no server"""
+        connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            connection.connect(self._socket_path)
+        except socket.error:
+            connection.close()
+            raise
+        # end assure socket is closed on error
+        return connection
+
+    def _start_server(self, executable, env):
+        """Start a new server using the given python executable and environment"""
+        core_tree = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        code = 'import sys; sys.path.insert(0, %r); from bprocess.forkserver import ForkServer; ' \
+               'ForkServer(%r, %r).serve(%r)' % (str(core_tree), str(self._socket_path), self.idle_timeout,
+                                                 tuple(str(name) for name in self.preload_modules))
+        with open(os.devnull, 'r+b') as devnull:
+            subprocess.Popen([executable, '-c', code], env=env, cwd=os.path.dirname(self._socket_path),
+                             stdin=devnull, stdout=devnull, stderr=devnull,
+                             close_fds=True, preexec_fn=os.setsid)
+        # end assure devnull is closed
+        log.debug("Started fork server at '%s'", self._socket_path)
+
+    # -- End Utilities -- @}
+
+    # -------------------------
+    # @name Interface
+    # @{
+
+    @classmethod
+    def socket_path(cls, fingerprint):
+        """@return path to the socket of the server with the given fingerprint, in a directory that is created
+        on demand, and only accessible by us
+        @throw OSError if the directory is accessible by others, or isn't owned by us"""
+        directory = _private_directory(os.environ.get(cls.directory_evar) or
+                                       os.path.join(os.environ.get('XDG_RUNTIME_DIR') or tempfile.gettempdir(),
+                                                    'bprocess-forkserver-%s' % login_name()))
+        # Socket paths have a maximum length of about 100 characters, keep it short
+        return os.path.join(directory, '%s.sock' % fingerprint[:16])
+
+    @classmethod
+    def fingerprint(cls, *args):
+        """@return a string identifying a server from the given arguments, which must have a stable
+        representation"""
+        return hashlib.sha1('\0'.join('%r' % (arg,) for arg in args).encode('utf-8')).hexdigest()
+
+    def spawn(self, executable, command, env, cwd, stdout=None, stderr=None):
+        """Run the given python command in our server, which is started if needed.
+        @param executable the python interpreter to start the server with
+        @param command a tuple as returned by python_command()
+        @param env the environment of the program. It is used to start the server as well
+        @param cwd working directory of the program
+        @param stdout file object to receive the output of the program, or None to use our own
+        @param stderr file object to receive the error output of the program, or None to use our own
+        @return a ForkServerProcess instance
+        @throw socket.error or EOFError if the server could not be used, or if it is run by another user"""
+        try:
+            connection = self._connect()
+        except socket.error:
+            self._start_server(executable, env)
+            connection = None
+        # end start server on demand
+        if connection is None:
+            deadline = time.time() + self.startup_timeout
+            while True:
+                try:
+                    connection = self._connect()
+                    break
+                except socket.error:
+                    if time.time() > deadline:
+                        raise
+                    # end handle timeout
+                    time.sleep(0.01)
+                # end handle server not yet listening
+            # end while server is starting
+        # end wait for server
+
+        try:
+            if _peer_uid(connection) not in (None, os.getuid()):
+                raise socket.error(errno.EACCES, "Fork server at '%s' is run by another user" % self._socket_path)
+            # end never send our environment to other users
+            _send_frame(connection, CHANNEL_REQUEST, pickle.dumps(dict(command=command, env=env, cwd=cwd), 2))
+            channel, data = _recv_frame(connection)
+            assert channel == CHANNEL_STARTED, "Expected start confirmation, got channel %i" % channel
+        except BaseException:
+            connection.close()
+            raise
+        # end assure connection is closed on error
+        return ForkServerProcess(connection, pickle.loads(data), stdout, stderr)
+
+    def shutdown(self):
+        """Ask our server to exit, if it is running. Programs it is currently running are not affected.
+        @return True if the server was running, False otherwise"""
+        try:
+            connection = self._connect()
+        except socket.error:
+            return False
+        # end handle no server
+        try:
+            _send_frame(connection, CHANNEL_SHUTDOWN, b'')
+        finally:
+            connection.close()
+        # end assure connection is closed
+        return True
+
+    # -- End Interface -- @}
+
+# end class ForkServerClient
+
+
+class BootstrapServer(ForkServer):
+
+    """A daemon preparing launches for the bootstrapper, which just has to execve() the result.
+
+    Each request is handled in a forked session, using the environment and working directory of the 
+    bootstrapper. It uses the default ProcessController, and a launch plan cache which is kept next to the 
+    socket unless the environment configures one.
+    Launches which can't be prepared this way, like programs that are spawned, or those which fail, are handed
+    back to the bootstrapper, which then launches them on its own.
+    """
+    __slots__ = ('_plan_cache_directory')
+
+    # -------------------------
+    # @name Configuration
+    # @{
+
+    # Arguments we handle, which are all but wrapper arguments other than overrides and ---dry-run.
+    # ---debug and the like are only handled by the bootstrapper, as their output would go to our log otherwise
+    re_handled_wrapper_arg = re.compile(r'^(?!---)|^---(?!with-)[^=]+=|^---dry-run$')
+
+    # -- End Configuration -- @}
+
+    def __init__(self, socket_path, idle_timeout=600, plan_cache_directory=None):
+        """Initialize this instance
+        @param plan_cache_directory directory for cached launch plans, or None to use one next to our socket"""
+        super(BootstrapServer, self).__init__(socket_path, idle_timeout)
+        self._plan_cache_directory = plan_cache_directory or os.path.splitext(socket_path)[0] + '.plans'
+
+    # -------------------------
+    # @name Utilities
+    # @{
+
+    def _prepare_launch(self, request):
+        """@return a response tuple for the given request, either ('execve', path, args, env, cwd),
+        ('exit', code) or ('fallback', reason)"""
+        if not all(self.re_handled_wrapper_arg.match(arg) for arg in request['args']):
+            return ('fallback', 'unsupported wrapper argument')
+        # end handle wrapper args
+
+        env = request['env']
+        if PY2:
+            env = dict((_native(k), _native(v)) for k, v in env.items())
+        # end assure native strings
+        os.environ.clear()
+        os.environ.update(env)
+        os.chdir(request['cwd'])
+
+        from bprocess import (ProcessController,
+                              ProcessControllerDelegate)
+
+        class DaemonProcessController(ProcessController):
+            __slots__ = ()
+            launch_plan_cache_directory = self._plan_cache_directory
+        # end class DaemonProcessController
+
+        controller = DaemonProcessController(request['executable'], request['args'],
+                                             context_paths=request['hops'])
+        delegate, args, cwd, env, launch_mode = controller._prepare_launch()
+        if controller._dry_run:
+            return ('exit', 0)
+        # end handle dry-run
+        dtype = type(delegate)
+        if launch_mode != delegate.LAUNCH_MODE_REPLACE or \
+           dtype.start != ProcessControllerDelegate.start or dtype._pre_execve != ProcessControllerDelegate._pre_execve:
+            return ('fallback', 'launch mode %s' % launch_mode)
+        # end handle launches we can't hand over
+        return ('execve', args[0], args, delegate._sanitize_environment(env), cwd)
+
+    # -- End Utilities -- @}
+
+    # -------------------------
+    # @name Subclass Interface
+    # @{
+
+    def _handle_request(self, connection, request):
+        """Prepare the launch and send the response"""
+        try:
+            response = self._prepare_launch(request)
+        except Exception:
+            response = ('fallback', traceback.format_exc())
+        # end let the bootstrapper handle errors
+        _send_frame(connection, CHANNEL_RESULT, pickle.dumps(response, 2))
+
+    # -- End Subclass Interface -- @}
+
+    # -------------------------
+    # @name Interface
+    # @{
+
+    def serve(self, preload_modules=('bprocess',)):
+        """Serve until we are idle for too long, with bprocess imported by default"""
+        return super(BootstrapServer, self).serve(preload_modules)
+
+    # -- End Interface -- @}
+
+# end class BootstrapServer
@@ -32,7 +32,11 @@ class IProcessControllerDelegate(Interface):
     # Indicate you want to fork the process, and maintain it as a sibling
     LAUNCH_MODE_SIBLING = 'sibling/fork'
 
-    launch_modes = (LAUNCH_MODE_REPLACE, LAUNCH_MODE_CHILD, LAUNCH_MODE_SIBLING)
+    # Indicate you want to fork the process from a server with a warm python interpreter, as a child.
+    # Falls back to LAUNCH_MODE_CHILD if the program can't be run that way
+    LAUNCH_MODE_FORKSERVER = 'child/forkserver'
+
+    launch_modes = (LAUNCH_MODE_REPLACE, LAUNCH_MODE_CHILD, LAUNCH_MODE_SIBLING, LAUNCH_MODE_FORKSERVER)
 
     # -- End Constants -- @}
 
@@ -91,6 +95,13 @@ class IProcessControllerDelegate(Interface):
         @return the path that is to be set, or None if the path should be dropped
         @note its up to the implementor to log this incident"""
 
+    @abstractmethod
+    def verify_paths(self, items):
+        """As verify_path(), but verifies many paths at once, which allows implementations to check them
+        concurrently.
+        @param items iterable of (environment_variable, path) tuples, see verify_path()
+        @return a list with the result of verify_path() for each item, in order"""
+
     @abstractmethod
     def resolve_value(self, value, env):
         """Using the environment `env`, the value at an environment variable will be substituted recursively.
@@ -142,6 +153,18 @@ class IProcessControllerDelegate(Interface):
         @return the given process
         """
 
+    @abstractmethod
+    def communicate_async(self, process, stdout_handler=None, stderr_handler=None):
+        """Like communicate(), but for an asyncio.subprocess.Process, without blocking.
+        @param process an asyncio.subprocess.Process as created by start_async()
+        @param stdout_handler if not None, a function f(line) called with each line the process writes to its
+        standard output, as bytes
+        @param stderr_handler like stdout_handler, but for the standard error
+        @return an asyncio.Future resolving to the given process once it is done. If it is cancelled, the
+        process is killed
+        @note only available if asyncio is available
+        """
+
     # -- End Delegate Interface -- @}
 
 # end class IProcessControllerDelegate
@@ -176,6 +199,10 @@ class IControlledProcessInformation(Interface):
     # in BPROCESS_POST_LAUNCH_INFORMATION
     config_file_hash_map_environment_variable = 'BPROCESS_CONFIG_FILE_HASHMAP'
 
+    # If set to a directory, the data stored in BPROCESS_POST_LAUNCH_INFORMATION will be written to a file in it
+    # instead, and the environment variable will only refer to that file.
+    storage_directory_environment_variable = 'BPROCESS_POST_LAUNCH_INFORMATION_DIR'
+
     # -- End Configuration -- @}
 
     # -------------------------
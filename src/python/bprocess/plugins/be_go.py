@@ -11,19 +11,25 @@ __all__ = ['LauncherBeSubCommand']
 
 import os
 import sys
+import logging
 
 import bapp
 from bapp import ApplicationSettingsMixin
 from butility import (Version,
+                      OrderedDict,
                       SpellingCorrector)
 from bcmd import InputError
 from be import BeSubCommand
 from bprocess import (PackageDataIteratorMixin,
                       ProcessController,
+                      ControlledProcessInformation,
+                      LaunchPlanCache,
                       package_schema)
 import bprocess
 from bprocess.bootstrap import Bootstrapper
 
+log = logging.getLogger('bprocess.plugins.be_go')
+
 
 class LauncherBeSubCommand(BeSubCommand, ApplicationSettingsMixin, PackageDataIteratorMixin,
                            bapp.plugin_type()):
@@ -42,6 +48,14 @@ class LauncherBeSubCommand(BeSubCommand, ApplicationSettingsMixin, PackageDataIt
     # Those are to be passed to the application
     allow_unknown_args = True
 
+    # Environment variable with a directory in which to keep the index of executable programs, see
+    # _executable_index(). If unset, the executable_index_directory is used
+    executable_index_evar = 'BPROCESS_EXECUTABLE_INDEX_DIR'
+
+    # Directory in which to keep the executable index if the executable_index_evar isn't set, or None to
+    # compute it each time
+    executable_index_directory = None
+
     def _add_subparser(self, add_parser, *args, **kwargs):
         """make sure we don't get support for help."""
         kwargs['add_help'] = False
@@ -64,11 +78,14 @@ class LauncherBeSubCommand(BeSubCommand, ApplicationSettingsMixin, PackageDataIt
         parser.usage = '... %s [+spawn] program [args]' % self.name
         return self
 
-    def _executable_package_names(self):
-        """@return a list of program names that are executable, based on our context
+    def _index_executables(self):
+        """@return tuple(programs, variables) of an OrderedDict of executable program names: name of the package
+        providing the executable once aliases are resolved, and a set of names of environment variables the
+        executables depend on.
         We have to emulate the behaviour of the process controller, using it's own functionality
         """
-        res = list()
+        programs = OrderedDict()
+        variables = set()
         packages = self.settings_value(bapp.main().context().settings())
         becmd = self._main_command_name()
         for package_name in list(packages.keys()):
@@ -77,24 +94,69 @@ class LauncherBeSubCommand(BeSubCommand, ApplicationSettingsMixin, PackageDataIt
             # end don't place ourselves to prevent the guys from calling themselves just for fun ;)
             package = self._to_package(package_name, packages[package_name])
             package = ProcessController._resolve_package_alias(package, lambda n: self._to_package(n, packages[n]))
+            variables |= LaunchPlanCache.environment_references(package.data().executable, os.environ)
             try:
                 # this raises if there is nothing
                 package.executable(os.environ)
-                res.append(package_name)
+                programs[package_name] = package.name()
             except Exception:
                 continue
             # end handle no executable configured
         # end for each package
-        return res
-
-    def execute(self, args, remaining_args):
-        programs = self._executable_package_names()
+        return programs, variables
+
+    def _executable_index(self):
+        """@return an OrderedDict of executable program names: name of the package providing the executable.
+        If an index directory is configured, the index is read from there as long as the configuration files and
+        the environment variables it depends on didn't change, and written otherwise.
+        @note executables are checked for existence only when the index is computed. Use _is_executable() to
+        verify a program before launching it"""
+        directory = os.environ.get(self.executable_index_evar) or self.executable_index_directory
+        if not directory:
+            return self._index_executables()[0]
+        # end handle disabled index
+
+        context = bapp.main().context()
+        hash_map = ControlledProcessInformation.config_file_hash_map(context)
+        key = LaunchPlanCache.key(type(self).__module__, type(self).__name__, self._main_command_name(),
+                                  [ctx.name() for ctx in context.stack()], list(hash_map.items()))
+        # The index is stored like a launch plan, which verifies the environment variables it depends on
+        cache = LaunchPlanCache(directory)
+        programs = cache.get_payload(key)
+        if programs is None:
+            programs, variables = self._index_executables()
+            programs = list(programs.items())
+            cache.put_payload(key, programs, dict((name, os.environ.get(name)) for name in variables))
+        else:
+            log.debug("Using cached executable index for %i programs", len(programs))
+        # end handle cache miss
+        return OrderedDict(programs)
+
+    def _is_executable(self, program):
+        """@return True if the given program can be launched, as it has an existing executable.
+        Only the packages of the program are read, following its alias"""
+        settings = bapp.main().context().settings()
+        package_by_name = lambda n: self._to_package(n, settings.value(self._package_key(n), package_schema,
+                                                                       resolve=True))
+        try:
+            package = ProcessController._resolve_package_alias(package_by_name(program), package_by_name)
+            package.executable(os.environ)
+        except Exception:
+            return False
+        # end handle missing packages or executables
+        return program != self._main_command_name()
 
-        if not programs:
-            raise InputError("No program configured for launch")
-        # end handle nothing there
+    def _executable_package_names(self):
+        """@return a list of program names that are executable, based on our context"""
+        return list(self._executable_index().keys())
 
+    def execute(self, args, remaining_args):
         if not remaining_args:
+            programs = self._executable_package_names()
+            if not programs:
+                raise InputError("No program configured for launch")
+            # end handle nothing there
+
             sys.stdout.write(self._parser.usage + '\n\n')
             sys.stdout.write('Please choose one of the following:\n\n')
             for name in programs:
@@ -104,7 +166,12 @@ class LauncherBeSubCommand(BeSubCommand, ApplicationSettingsMixin, PackageDataIt
         # end handle query mode
 
         program = remaining_args[0]
-        if program not in programs:
+        # Only the chosen program is verified - all others are needed only if it doesn't exist
+        if not self._is_executable(program):
+            programs = self._executable_package_names()
+            if not programs:
+                raise InputError("No program configured for launch")
+            # end handle nothing there
             maybe_this_one = SpellingCorrector(programs).correct(program)
             did_you_mean = ''
             if maybe_this_one != program:
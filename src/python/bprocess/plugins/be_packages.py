@@ -0,0 +1,114 @@
+#-*-coding:utf-8-*-
+"""
+@package bprocess.plugins.be_packages
+@brief A be sub-command to query the dependency graph of the package database
+
+@author Sebastian Thiel
+@copyright [GNU Lesser General Public License](https://www.gnu.org/licenses/lgpl.html)
+"""
+from __future__ import unicode_literals
+__all__ = ['PackagesBeSubCommand']
+
+import sys
+
+import bapp
+from bapp import ApplicationSettingsMixin
+from bkvstore import (KeyValueStoreSchema,
+                      AnyKey,
+                      StringList)
+from butility import (Version,
+                      SpellingCorrector)
+from bcmd import InputError
+from be import BeSubCommand
+from bprocess import (PackageDataIteratorMixin,
+                      PackageDependencyIndex,
+                      PackageCycleError)
+
+
+class PackagesBeSubCommand(BeSubCommand, ApplicationSettingsMixin, PackageDataIteratorMixin,
+                           bapp.plugin_type()):
+
+    """Answers questions about the requirements of configured packages, like 'who requires X'"""
+    __slots__ = ()
+
+    name = 'packages'
+    version = Version('0.1.0')
+    description = "query package requirements"
+
+    # we only need the fields forming the dependency graph
+    _schema = PackageDataIteratorMixin.new_controller_schema(KeyValueStoreSchema(AnyKey,
+                                                                                 {'requires': StringList,
+                                                                                  'ignore': StringList}))
+
+    # -------------------------
+    # @name Constants
+    # @{
+
+    QUERY_REQUIRED_BY = 'required-by'
+    QUERY_REQUIRES = 'requires'
+    QUERY_ORDER = 'order'
+
+    queries = (QUERY_REQUIRED_BY, QUERY_REQUIRES, QUERY_ORDER)
+
+    # -- End Constants -- @}
+
+    def setup_argparser(self, parser):
+        parser.add_argument('query',
+                            choices=self.queries,
+                            help="'%s' lists all packages requiring the given one, '%s' lists all packages it requires "
+                                 "and '%s' lists it and its requirements in the order they have to be set up in"
+                                 % self.queries)
+        parser.add_argument('package',
+                            help='name of the package to query')
+        parser.add_argument('-d', '--direct',
+                            action='store_true',
+                            default=False,
+                            help='If set, only direct requirements or dependents will be listed')
+        return self
+
+    def _package_index(self):
+        """@return a PackageDependencyIndex with all packages of our context"""
+        packages = self.settings_value(bapp.main().context().settings())
+
+        def package_data(name):
+            try:
+                return packages[name]
+            except KeyError:
+                raise InputError("A package named '%s' is required, but wasn't configured" % name)
+            # end provide nice exceptions
+        # end utility
+
+        return PackageDependencyIndex(package_data, list(packages.keys()))
+
+    def execute(self, args, remaining_args):
+        index = self._package_index()
+
+        names = index.names()
+        if args.package not in names:
+            maybe_this_one = SpellingCorrector(names).correct(args.package)
+            did_you_mean = ''
+            if maybe_this_one != args.package:
+                did_you_mean = ", did you mean '%s'" % maybe_this_one
+            # end compose did you mean
+            raise InputError("unknown package named '%s'%s" % (args.package, did_you_mean))
+        # end handle name
+
+        transitive = not args.direct
+        if args.query == self.QUERY_REQUIRED_BY:
+            res = index.required_by(args.package, transitive)
+        elif args.query == self.QUERY_REQUIRES:
+            res = index.requires(args.package, transitive)
+        else:
+            try:
+                res = index.topological_order(args.package)
+            except PackageCycleError as err:
+                raise InputError(str(err))
+            # end convert exception
+        # end handle query
+
+        for name in res:
+            sys.stdout.write(name + '\n')
+        # end for each name
+        return self.SUCCESS
+
+# end class PackagesBeSubCommand
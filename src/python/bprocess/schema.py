@@ -176,6 +176,8 @@ package_schema = KeyValueStoreSchema(AnyKey,
                                       },
                                       'version': Version(),
                                       'include': PathList,
+                                      'propagate': StringList,
+                                      'launch_mode': str,
                                       'arguments': {
                                           'append': StringList,
                                           'prepend': StringList,
@@ -12,13 +12,15 @@ from __future__ import division
 
 __all__ = []
 
+import os
 import logging
 
 from butility.tests import (TestCase,
                             with_rw_directory)
 
 from btransaction import Transaction
-from bprocess.actions import CopyAction
+from bprocess.actions import (CopyAction,
+                              copy_file)
 from bkvstore import KeyValueStoreModifier
 
 
@@ -70,5 +72,74 @@ class ActionTests(TestCase):
             assert not dest_file.dirname().dirname().exists()
         # END for each dryrun mode
 
+        # copies of different files into the same new directory can run concurrently
+        t = Transaction(logging.root, max_workers=4)
+        destinations = list()
+        for index in range(4):
+            data = CopyAction.data(dk, kvstore)
+            data.source.append(source)
+            data.destination = dest_file.dirname() / ('destination_%i.ext' % index)
+            destinations.append(data.destination)
+            CopyAction(t, 'doesntmatter', data, 'package', None)
+        # end for each copy
+        assert t.apply().succeeded()
+        assert all(path.isfile() for path in destinations)
+        t.rollback()
+        assert not dest_file.dirname().dirname().exists()
+
+    @with_rw_directory
+    def test_copy_many(self, base_dir):
+        """Verify multiple files and trees can be copied, and that up-to-date files are skipped"""
+        big = (base_dir / 'big').write_bytes(os.urandom(1024 * 100 + 3))
+        copy_file(big, base_dir / 'big.copy', chunk_size=1024)
+        assert (base_dir / 'big.copy').bytes() == big.bytes()
+        assert int(os.stat(big).st_mtime) == int(os.stat(base_dir / 'big.copy').st_mtime), 'stat is copied'
+
+        tree = base_dir / 'tree'
+        (tree / 'sub').makedirs()
+        (tree / 'a').write_bytes(b'a')
+        (tree / 'sub' / 'b').write_bytes(b'b')
+
+        kvstore = KeyValueStoreModifier(dict())
+        dk = CopyAction.data_key('many')
+        kvstore.set_value(dk, 'foo')
+        data = CopyAction.data(dk, kvstore)
+        data.source.extend([big, tree])
+        data.destination = base_dir / 'out' / 'dir'
+
+        def copy():
+            t = Transaction(logging.root)
+            action = CopyAction(t, 'doesntmatter', data, 'package', None)
+            assert t.apply().succeeded()
+            return t, action
+        # end utility
+
+        t, action = copy()
+        out = data.destination
+        assert (out / 'big').bytes() == big.bytes()
+        assert (out / 'tree' / 'a').bytes() == b'a' and (out / 'tree' / 'sub' / 'b').bytes() == b'b'
+        assert len(action._written_files) == 3
+
+        # unchanged files are skipped, same for files with the same content but different modification time
+        os.utime(out / 'tree' / 'a', (0, 0))
+        (tree / 'sub' / 'b').write_bytes(b'c')
+        os.utime(tree / 'sub' / 'b', (0, 0))
+        t, action = copy()
+        assert action._written_files == [out / 'tree' / 'sub' / 'b'], 'only the changed file is copied'
+        assert (out / 'tree' / 'sub' / 'b').bytes() == b'c'
+
+        # rollback only removes what we wrote
+        t.rollback()
+        assert not (out / 'tree' / 'sub' / 'b').exists() and (out / 'tree' / 'a').isfile()
+
+        t = Transaction(logging.root)
+        CopyAction(t, 'doesntmatter', data, 'package', None)
+        (out / 'big').remove()
+        for path in ((out / 'tree' / 'a'), out / 'tree' / 'sub', out / 'tree', out, out.dirname()):
+            path.isdir() and path.rmdir() or path.remove()
+        # end for each path to remove
+        assert t.apply().succeeded() and t.rollback()
+        assert not out.dirname().exists(), 'created directories are removed'
+
 
 # end class ActionTests
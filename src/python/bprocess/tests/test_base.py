@@ -17,15 +17,20 @@ if __name__ == '__main__':
 
 import sys
 import os
+import time
 import tempfile
 
 import bapp
 
-from butility.tests import TestCase
+from butility.tests import (TestCase,
+                            with_rw_directory)
 from bprocess import *
+from bprocess.delegates import SimpleProxyProcessControllerDelegate
 from bapp.tests import (preserve_application,
                         with_application)
 from butility import Path
+from butility.compat import asyncio
+from nose import SkipTest
 
 import subprocess
 
@@ -172,6 +177,51 @@ class TestProcessControl(TestCase):
         process.communicate()
         assert process.returncode == 0
 
+    @preserve_application
+    def test_execute_async(self):
+        if asyncio is None:
+            raise SkipTest("asyncio is not available")
+        # end handle python version
+        code = 'import sys; sys.stdout.write(sys.argv[1] + "\\n"); sys.stderr.write("err\\n"); sys.exit(int(sys.argv[1]))'
+        controllers = [TestProcessController(pseudo_executable('python'), ['-c', code, str(index)])
+                       for index in range(4)]
+        lines = list()
+        err_lines = list()
+
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            processes = loop.run_until_complete(execute_concurrently(controllers, 2,
+                                                                     lambda pctrl, line: lines.append((pctrl, line)),
+                                                                     lambda pctrl, line: err_lines.append(line)))
+            assert [process.returncode for process in processes] == list(range(4))
+            assert sorted((controllers.index(pctrl), line) for pctrl, line in lines) == \
+                [(index, ('%i\n' % index).encode()) for index in range(4)]
+            assert err_lines == [b'err\n'] * 4
+
+            # cancellation kills the program
+            pids = list()
+            pctrl = TestProcessController(pseudo_executable('python'),
+                                          ['-c', 'import os, sys, time; sys.stdout.write("%i\\n" % os.getpid()); '
+                                                 'sys.stdout.flush(); time.sleep(30)'])
+            future = pctrl.execute_async(stdout_handler=lambda line: (pids.append(int(line)), future.cancel()))
+            self.failUnlessRaises(asyncio.CancelledError, loop.run_until_complete, future)
+            assert len(pids) == 1
+            for _ in range(100):
+                loop.run_until_complete(asyncio.sleep(0.05))
+                try:
+                    os.kill(pids[0], 0)
+                except OSError:
+                    break
+                # end check if process is gone
+            else:
+                raise AssertionError("process wasn't killed")
+            # end wait for process to be killed
+        finally:
+            asyncio.set_event_loop(None)
+            loop.close()
+        # end assure loop is closed
+
     @preserve_application
     def test_delegate_finder(self):
         from .delegate import TestCommunicatorDelegate
@@ -208,6 +258,14 @@ class TestProcessControl(TestCase):
             # end
         # end for each path to test
 
+    @with_application(from_file=__file__)
+    def test_verify_paths(self):
+        dlg = ProcessControllerDelegate(bapp.main(), 'py-program')
+        existing = Path(__file__).dirname()
+        items = [('PATH', existing), ('PATH', existing / 'doesnt-exist'), ('PATH', Path('$FOO/bar'))]
+        assert dlg.verify_paths(items) == [existing, None, items[-1][1]], 'paths with variables pass'
+        assert dlg.verify_paths(list()) == list()
+
     @with_application(from_file=__file__)
     def test_proxy_delegate(self):
         pctrl = TestProcessController(pseudo_executable('proxied_app'), application=bapp.main())
@@ -222,6 +280,99 @@ class TestProcessControl(TestCase):
             assert pctrl.execute_in_current_context().returncode == 0
         # end for each program to test
 
+    @preserve_application
+    def test_propagate(self):
+        pctrl = TestProcessController(pseudo_executable('load-from-directories'))
+        assert pctrl.executable() and pctrl._propagate is None, 'everything is propagated by default'
+
+        program = 'propagating-program'
+        pctrl = TestProcessController(pseudo_executable(program))
+        assert pctrl.executable()
+        assert pctrl._propagate == ['process', 'packages.' + program, 'logging', 'plugin_load_command']
+        assert pctrl.execute_in_current_context().returncode == 0
+
+    @with_rw_directory
+    @preserve_application
+    def test_forkserver(self, rw_dir):
+        program = 'forkserver-program'
+        server_dir = rw_dir / 'servers'
+        os.environ[ForkServerClient.directory_evar] = server_dir
+        client = None
+        try:
+            pctrl = TestProcessController(pseudo_executable(program))
+            assert pctrl.delegate().launch_mode() == ProcessControllerDelegate.LAUNCH_MODE_FORKSERVER
+            assert pctrl.execute().returncode == 0
+            sockets = os.listdir(server_dir)
+            assert len(sockets) == 1, "a server was started on demand"
+            client = ForkServerClient(server_dir / sockets[0])
+            assert TestProcessController(pseudo_executable(program)).execute().returncode == 0
+            assert os.listdir(server_dir) == sockets, "the server is reused"
+
+            # compare against spawning a new interpreter each time
+            count = 5
+            for mode in (ProcessControllerDelegate.LAUNCH_MODE_CHILD,
+                         ProcessControllerDelegate.LAUNCH_MODE_FORKSERVER):
+                st = time.time()
+                for _ in range(count):
+                    pctrl = TestProcessController(pseudo_executable(program))
+                    pctrl.set_delegate(SimpleProxyProcessControllerDelegate(pctrl.delegate(), mode, None, None, None))
+                    assert pctrl.execute().returncode == 0
+                # end for each launch
+                elapsed = time.time() - st
+                print("Launched %s %i times in %.3fs (%.1f launches/s) using %s"
+                      % (program, count, elapsed, count / elapsed, mode), file=sys.stderr)
+            # end for each mode
+
+            assert client.shutdown()
+            for _ in range(100):
+                if not os.listdir(server_dir):
+                    break
+                time.sleep(0.05)
+            # end wait for server to remove its socket
+            assert not os.listdir(server_dir) and not client.shutdown()
+
+            # servers are only used in directories private to us
+            os.chmod(server_dir, 0o755)
+            self.failUnlessRaises(OSError, ForkServerClient.socket_path, ForkServerClient.fingerprint(program))
+            assert TestProcessController(pseudo_executable(program)).execute().returncode == 0
+            assert not os.listdir(server_dir), "programs are spawned instead"
+        finally:
+            if client is not None:
+                client.shutdown()
+            # end assure server is stopped
+            del os.environ[ForkServerClient.directory_evar]
+        # end assure environment is restored
+
+        # non-python programs are spawned
+        assert python_command(['/bin/ls', '-l']) is None
+        assert python_command(['/usr/bin/python2.7']) is None, 'interactive interpreters are unsupported'
+        assert python_command(['/usr/bin/python', '-c', 'pass', 'a']) == ('-c', 'pass', ['-c', 'a'])
+        assert python_command(['python3', '-m', 'json.tool', 'f']) == ('-m', 'json.tool', ['json.tool', 'f'])
+        assert python_command(['python', 'script.py', '-x']) == ('script', 'script.py', ['script.py', '-x'])
+
+    @preserve_application
+    def test_prepare_many(self):
+        program = pseudo_executable('load-from-directories')
+        specs = [(program, []), (program, []), (program, ['---foo=bar']), (pseudo_executable('py-program'), [])]
+        controllers = TestProcessController.prepare_many(specs)
+        assert len(controllers) == len(specs)
+
+        first, second, overridden, other = controllers
+        assert len(set(id(pctrl.application()) for pctrl in controllers)) == len(controllers)
+        assert first.application().context().stack()[0] is other.application().context().stack()[0], \
+            "base contexts are shared"
+        assert first._package_data_cache is second._package_data_cache, "package data is shared per program"
+        assert first._package_index is second._package_index
+        assert first._package_data_cache is not overridden._package_data_cache
+        assert first._package_data_cache is not other._package_data_cache
+        assert len(set(id(pctrl._stat_cache) for pctrl in controllers)) == 1
+
+        for pctrl in (first, second):
+            assert pctrl.executable() == TestProcessController(program).executable()
+            assert pctrl.execute_in_current_context().returncode == 0
+        # end for each controller to launch
+        assert overridden.application().settings().value('foo', None) == 'bar'
+
     @preserve_application
     def test_iteration(self):
         count = 0
@@ -236,6 +387,87 @@ class TestProcessControl(TestCase):
 
         self.failUnlessRaises(EnvironmentError, next, TestProcessController(executable, args).iter_packages('foobar'))
 
+    @with_rw_directory
+    @preserve_application
+    def test_launch_plan_cache(self, rw_dir):
+        evar = TestProcessController.launch_plan_cache_evar
+        os.environ[evar] = rw_dir
+        try:
+            replayed = list()
+
+            class PlanProcessController(TestProcessController):
+                __slots__ = ()
+
+                def _replay_launch_plan(self, program, plan):
+                    replayed.append(program)
+                    return super(PlanProcessController, self)._replay_launch_plan(program, plan)
+            # end class PlanProcessController
+
+            class CustomDelegate(ProcessControllerDelegate):
+                __slots__ = ()
+            # end class CustomDelegate
+
+            class CustomDelegateProcessController(PlanProcessController):
+                __slots__ = ()
+
+                def _find_delegate(self, root_package, alias_package):
+                    return CustomDelegate(self._app, root_package.name())
+            # end class CustomDelegateProcessController
+
+            def controller(*args, **kwargs):
+                num_replayed = len(replayed)
+                pctrl = kwargs.get('controller_type', PlanProcessController)(
+                    pseudo_executable('load-from-directories'), list(args))
+                pctrl.application()
+                return pctrl, len(replayed) == num_replayed
+            # end utility
+
+            pctrl, evaluated = controller()
+            assert evaluated and len(rw_dir.files()) == 1, "first launch computes and stores the plan"
+
+            cached, evaluated = controller()
+            assert not evaluated, "second launch replays the plan"
+            assert type(cached.delegate()) is type(pctrl.delegate())
+            for attr in ('_environ', '_args', '_cwd', '_executable_path', '_resolve_args'):
+                assert getattr(cached, attr) == getattr(pctrl, attr), attr
+            # end for each attribute
+            assert cached.execute_in_current_context().returncode == 0
+
+            # plugins may provide a delegate which would never have cached the plan
+            custom, evaluated = controller(controller_type=CustomDelegateProcessController)
+            assert evaluated and type(custom.delegate()) is CustomDelegate
+
+            _, evaluated = controller('---foo=bar')
+            assert evaluated and len(rw_dir.files()) == 2, "different arguments use a different plan"
+
+            # plans depend on the parent environment variables they use
+            plan_file = rw_dir.files()[0]
+            plan = LaunchPlanCache(rw_dir).get(plan_file.namebase())
+            assert plan is not None and plan['parent_environ']
+            name = list(plan['parent_environ'].keys())[0]
+            prev = os.environ.get(name)
+            os.environ[name] = (prev or '') + '-changed'
+            try:
+                assert LaunchPlanCache(rw_dir).get(plan_file.namebase()) is None
+            finally:
+                if prev is None:
+                    del os.environ[name]
+                else:
+                    os.environ[name] = prev
+                # end restore variable
+            # end assure environment is restored
+
+            # other data can be stored with the same checks
+            cache = LaunchPlanCache(rw_dir / 'payloads')
+            assert cache.put_payload('key', [1], {name: prev}, [(rw_dir, True)]).get_payload('key') == [1]
+            assert cache.get('key') is not None and cache.get_payload('missing') is None
+            assert LaunchPlanCache(rw_dir).get_payload(plan_file.namebase()) is None, "plans have no payload"
+            cache.put_payload('key', [1], {name: (prev or '') + '-changed'})
+            assert cache.get_payload('key') is None
+        finally:
+            del os.environ[evar]
+        # end assure cache is disabled
+
     @preserve_application
     def test_post_launch_info(self):
         info = ControlledProcessInformation()
@@ -11,11 +11,16 @@ __all__ = []
 
 import sys
 import os.path
+import time
+import socket
+import subprocess
 
 import bapp
 from bapp import preserve_application
-from butility.tests import TestCase
+from butility.tests import (TestCase,
+                            with_rw_directory)
 from butility import load_file
+from bprocess import ForkServerClient
 
 # Dynamic loading of wrapper code - its not in a package for good reason
 dirname = os.path.dirname
@@ -45,5 +50,75 @@ class TestBootstrap(TestCase):
             pass
         # end handle exception
 
+    @with_rw_directory
+    def test_daemon(self, rw_dir):
+        Bootstrapper = bootstrap.Bootstrapper
+        program = os.path.join(dirname(__file__), 'bin', 'load-from-directories')
+        daemon_dir = os.path.join(rw_dir, 'daemon')
+        env = dict(os.environ)
+        env[Bootstrapper.daemon_directory_evar] = str(daemon_dir)
+
+        def launch(count, use_daemon, args=()):
+            launch_env = dict(env)
+            if use_daemon:
+                launch_env[Bootstrapper.daemon_evar] = '1'
+            # end enable daemon
+            st = time.time()
+            for _ in range(count):
+                assert subprocess.call([sys.executable, program] + list(args), env=launch_env, cwd=rw_dir) == 0
+            # end for each launch
+            return time.time() - st
+        # end utility
+
+        def sockets():
+            return [name for name in os.listdir(daemon_dir) if name.endswith('.sock')]
+        # end utility
+
+        # daemons are only used in directories private to us, which are created on demand
+        bootstrapper = Bootstrapper()
+        private_dir = os.path.join(rw_dir, 'private')
+        assert bootstrapper._private_directory(private_dir) == private_dir
+        assert os.stat(private_dir).st_mode & 0o777 == 0o700
+        os.chmod(private_dir, 0o755)
+        assert bootstrapper._private_directory(private_dir) is None, "others must not have access"
+        os.symlink(rw_dir, os.path.join(rw_dir, 'link'))
+        assert bootstrapper._private_directory(os.path.join(rw_dir, 'link')) is None, "symlinks are not followed"
+
+        left, right = socket.socketpair()
+        try:
+            assert bootstrapper._peer_uid(left) in (None, os.getuid())
+        finally:
+            left.close()
+            right.close()
+        # end assure sockets are closed
+
+        # measure the overhead of the wrapper, without the program
+        count = 5
+        dry_run = ['---dry-run']
+        elapsed = launch(count, False, dry_run)
+        assert not os.path.exists(daemon_dir), "daemon is only used if enabled"
+
+        launch(1, True)
+        for _ in range(200):
+            if sockets():
+                break
+            time.sleep(0.05)
+        # end wait for daemon to start
+        assert len(sockets()) == 1, "the first launch starts the daemon"
+
+        try:
+            launch(1, True)
+            plans = [name for name in os.listdir(daemon_dir) if name.endswith('.plans')]
+            assert len(plans) == 1 and os.listdir(os.path.join(daemon_dir, plans[0])), "daemon caches launch plans"
+
+            elapsed_daemon = launch(count, True, dry_run)
+            for name, duration in (('without', elapsed), ('with', elapsed_daemon)):
+                sys.stderr.write("Wrapper overhead of %i launches %s bootstrap daemon: %.3fs (%.3fs per launch)\n"
+                                 % (count, name, duration, duration / count))
+            # end for each measurement
+        finally:
+            assert ForkServerClient(os.path.join(daemon_dir, sockets()[0])).shutdown()
+        # end assure daemon is stopped
+
 
 # end class TestWrapper
@@ -11,7 +11,8 @@ __all__ = []
 
 import bapp
 from butility import Path
-from butility.tests import TestCase
+from butility.tests import (TestCase,
+                            with_rw_directory)
 from bapp.tests import with_application
 from bprocess import (ProcessControlContextController,
                       ProcessConfigurationIncompatibleError)
@@ -53,5 +54,47 @@ class TestProcessControlContextController(TestCase):
         self.failUnlessRaises(
             ProcessConfigurationIncompatibleError, ctrl._check_process_compatibility, kv_a_changed_requires, kv_a, 'foo')
 
+    @with_rw_directory
+    @with_application(from_file=__file__)
+    def test_asset_context_cache(self, rw_dir):
+        """Switching back to a previous asset directory re-uses its contexts until its configuration changes"""
+        ctrl = TestProcessController(bapp.main().context())
+        ctrl.set_static_stack_len()
+        static_len = len(bapp.main().context())
+
+        assets = list()
+        for name in ('a', 'b'):
+            etc = rw_dir / name / 'etc'
+            etc.makedirs()
+            (etc / 'config.yaml').write_text('asset:\n  name: %s\n' % name)
+            assets.append(rw_dir / name / 'scene.ma')
+        # end for each asset directory
+
+        def asset_contexts():
+            return bapp.main().context().stack()[static_len:]
+
+        ctrl.change_asset_context(assets[0])
+        contexts_a = asset_contexts()
+        assert contexts_a, 'should have pushed contexts'
+        assert bapp.main().context().settings().value('asset.name', None) == 'a'
+
+        ctrl.change_asset_context(assets[1])
+        assert bapp.main().context().settings().value('asset.name', None) == 'b'
+        assert len(ctrl._asset_contexts) == 2
+
+        ctrl.change_asset_context(assets[0])
+        assert all(a is b for a, b in zip(asset_contexts(), contexts_a)), 'contexts should have been re-used'
+        assert bapp.main().context().settings().value('asset.name', None) == 'a'
+
+        # changing the configuration invalidates the cached contexts
+        (assets[0].dirname() / 'etc' / 'config.yaml').write_text('asset:\n  name: changed\n')
+        ctrl.change_asset_context(assets[0])
+        assert asset_contexts()[0] is not contexts_a[0], 'outdated contexts must not be used'
+        assert bapp.main().context().settings().value('asset.name', None) == 'changed'
+
+        # changing the static part of the stack clears the cache
+        ctrl.set_static_stack_len()
+        assert len(ctrl._asset_contexts) == 0
+
 
 # end class TestProcessControlContextController
@@ -14,7 +14,8 @@ import os
 import bapp
 from be import BeCommand
 from bapp.tests import with_application
-from butility.tests import TestCase
+from butility.tests import (TestCase,
+                            with_rw_directory)
 from butility import Path
 from .test_base import pseudo_executable
 from bprocess.controller import _ProcessControllerContext
@@ -51,5 +52,64 @@ class PluginsTestCase(TestCase):
             os.chdir(cwd)
         # end cwd handling
 
+    @with_rw_directory
+    @with_application(from_file=__file__)
+    def test_launcher_executable_index(self, rw_dir):
+        mod = 'bprocess.plugins.be_go'
+        mod = __import__(mod, globals(), locals(), [mod])
+
+        class CountingLauncher(mod.LauncherBeSubCommand):
+            __slots__ = ()
+            calls = 0
+
+            def _index_executables(self):
+                CountingLauncher.calls += 1
+                return super(CountingLauncher, self)._index_executables()
+        # end class CountingLauncher
+
+        go = CountingLauncher(application=bapp.main())
+        bapp.main().context().push(_ProcessControllerContext(go.name, pseudo_executable(go.name),
+                                                             'doesntmatter', []))
+        programs = go._executable_index()
+        assert programs, 'should have found executables'
+        assert CountingLauncher.calls == 1
+
+        evar = go.executable_index_evar
+        prev = os.environ.get(evar)
+        os.environ[evar] = rw_dir
+        try:
+            for count in range(2):
+                assert go._executable_index() == programs, 'cached index must match the computed one'
+            # end for each attempt
+            assert CountingLauncher.calls == 2, 'second query should have used the index'
+            assert len(os.listdir(rw_dir)) == 1, 'expected one index file'
+        finally:
+            if prev is None:
+                del os.environ[evar]
+            else:
+                os.environ[evar] = prev
+            # end restore environment
+        # end handle environment
+
+        assert go._is_executable('py-program')
+        assert not go._is_executable('foo'), 'unknown programs are not executable'
+
+    @with_application(from_file=__file__)
+    def test_packages(self):
+        mod = 'bprocess.plugins.be_packages'
+        mod = __import__(mod, globals(), locals(), [mod])
+
+        name = mod.PackagesBeSubCommand.name
+        cmd = BeCommand(application=bapp.main()).parse_and_execute
+        assert cmd([name, 'required-by', 'py-program']) == 0
+        assert cmd([name, 'requires', 'py-program', '--direct']) == 0
+        assert cmd([name, 'order', 'py-program']) == 0
+        assert cmd([name, 'requires', 'py-programm']) != 0, 'unknown packages are an error'
+
+        index = mod.PackagesBeSubCommand(application=bapp.main())._package_index()
+        dependents = index.required_by('py-program')
+        assert 'py-program-delegate-via-requires' not in dependents, 'only direct dependents'
+        assert 'py-program-delegate-via-requires' in index.required_by('py-program', transitive=True)
+
 
 # end class PluginsTestCase
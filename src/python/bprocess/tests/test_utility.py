@@ -9,11 +9,17 @@
 from __future__ import unicode_literals
 from __future__ import division
 
+import os
+import sys
+import time
+
 from butility.tests import (TestCase,
                             with_rw_directory)
 import bapp
 from bapp import preserve_application
 from butility import (wraps,
+                      OrderedDict,
+                      DictObject,
                       Path)
 from bkvstore import KeyValueStoreModifier
 from bapp.tests import with_application
@@ -89,3 +95,219 @@ class TestUtilities(TestCase):
 
         tracker._settings_path().remove()
         assert not tracker.package_data(previous=True), "if there is no package data, there is no data"
+
+    def test_package_dependency_index(self):
+        """verify closure, ignore handling, reverse lookups and cycle detection"""
+        graph = {'app': (['lib', 'py'], ['old']),
+                 'lib': (['py', 'old'], []),
+                 'py': ([], []),
+                 'old': (['base'], []),
+                 'base': ([], []),
+                 'tool': (['lib'], [])}
+        package_data = lambda name: DictObject(dict(requires=graph[name][0], ignore=graph[name][1]))
+
+        index = PackageDependencyIndex(package_data)
+        assert not index.names(), 'packages are indexed on demand'
+        closure = index.closure('app')
+        assert [name for name, depth in closure] == ['app', 'py', 'lib', 'old', 'base'], 'same order as _iter_()'
+        assert closure[-1][1] == 3, 'depth is tracked'
+        assert index.closure('app') is closure, 'closures are cached'
+
+        assert index.reachable('app') == ['app', 'py', 'lib', 'base'], 'ignored packages still bring requirements'
+        assert index.reachable('lib') == ['lib', 'old', 'py', 'base']
+        assert index.requires('app') == ['lib', 'py']
+        assert index.requires('app', transitive=True) == ['py', 'lib', 'old', 'base']
+
+        order = index.topological_order('app')
+        assert order[-1] == 'app' and order.index('py') < order.index('lib') and order.index('base') < order.index('old')
+
+        assert index.required_by('tool') == [], 'tool was not indexed yet'
+        index = PackageDependencyIndex(package_data, graph.keys())
+        assert len(index.names()) == len(graph)
+        assert sorted(index.required_by('lib')) == ['app', 'tool']
+        assert sorted(index.required_by('old', transitive=True)) == ['app', 'lib', 'tool']
+
+        graph['base'] = (['app'], [])
+        index = PackageDependencyIndex(package_data)
+        self.failUnlessRaises(PackageCycleError, index.topological_order, 'app')
+        assert len(index.closure('app')) == 5, 'closures are not affected by cycles'
+
+    def test_environment_builder(self):
+        """verify paths are deduplicated, values replaced and references resolved in order"""
+        sep = os.pathsep
+        base = dict(PATH=sep.join(('/bin', '/usr/bin')), HOME='/home/me')
+        env = EnvironmentBuilder(base)
+        assert env['PATH'] is base['PATH'] and len(env) == 2
+
+        assert env.append_path('PATH', '/opt/bin', 'a').append_path('PATH', '/bin', 'b') is env
+        assert env['PATH'] == sep.join(('/bin', '/usr/bin', '/opt/bin')), 'duplicates are dropped'
+        env.append_path('LD_LIBRARY_PATH', '$ROOT/lib', 'a')
+        assert env['LD_LIBRARY_PATH'] == '$ROOT/lib', 'new variables start empty'
+
+        env.set_value('ROOT', '${BASE}/root', 'a').set_value('BASE', '$HOME', 'b')
+        env.set_value('ROOT', '$BASE/root', 'c')
+        env.append_path('ROOT', '/other', 'd')
+        assert env['ROOT'] == sep.join(('$BASE/root', '/other')), 'values can be turned into paths'
+        assert base == dict(PATH=sep.join(('/bin', '/usr/bin')), HOME='/home/me'), 'base is not changed'
+
+        contributions = env.contributions()
+        assert len(contributions['PATH']) == 2, 'duplicates are recorded'
+        assert [package for value, package in contributions['ROOT']] == ['c', 'd'], 'set values replace history'
+
+        calls = list()
+
+        def resolve_value(value, environ):
+            calls.append(value)
+            return str(Path._expandvars(value, environ))
+        # end utility
+
+        resolved = env.resolved_environment(resolve_value)
+        assert resolved['LD_LIBRARY_PATH'] == '/home/me/root%s/other/lib' % sep
+        assert len(calls) == 3, 'each variable is resolved exactly once'
+        assert env['BASE'] == '$HOME', 'the builder itself is not changed'
+        assert env.environment()['ROOT'] == env['ROOT']
+
+    @with_rw_directory
+    def test_path_stat_cache(self, rw_dir):
+        """verify stats are cached, even if the file system changes"""
+        cache = PathStatCache()
+        files = [rw_dir / ('file%i' % i) for i in range(5)]
+        for path in files[:3]:
+            path.touch()
+        # end for each file to create
+
+        assert cache.prefetch(files + [rw_dir, files[0]]) is cache
+        assert [cache.isfile(path) for path in files] == [True] * 3 + [False] * 2
+        assert cache.isdir(rw_dir) and not cache.isfile(rw_dir) and cache.exists(rw_dir)
+
+        files[0].remove()
+        assert cache.exists(files[0]), 'results are cached'
+        assert not cache.isdir(rw_dir / 'new') and cache.stat(rw_dir / 'new') is None, 'cache misses are handled'
+
+    @preserve_application
+    @with_application
+    @with_rw_directory
+    def test_import_plan(self, rw_dir):
+        """verify unchanged modules and plugins are not executed again, but their plugins are registered"""
+        executions = rw_dir / 'executions'
+        source = ('import bapp\n'
+                  'open(%r, "a").write("%%s\\n" %% __name__)\n'
+                  'class %s(bapp.plugin_type()):\n'
+                  '    pass\n')
+        module = 'import_plan_module'
+        (rw_dir / (module + '.py')).write_text(source % (str(executions), 'ImportPlanModulePlugin'))
+        plugin_dir = rw_dir / 'plugins'
+        plugin_dir.mkdir()
+        (plugin_dir / 'import_plan_plugin.py').write_text(source % (str(executions), 'ImportPlanFilePlugin'))
+
+        store = KeyValueStoreModifier({'packages': {'foo': {'trees': [str(rw_dir)],
+                                                            'python': {'import': [module],
+                                                                       'plugin_paths': ['plugins']}}}})
+        iterator = PythonPackageIterator()
+        plan = iterator.import_plan(store, 'foo')
+        assert iterator.import_plan(store, 'foo') is plan, 'plans are computed once per store'
+        assert [kind for _, kind, _ in plan.steps()] == [ImportPlan.KIND_MODULE, ImportPlan.KIND_PLUGIN_PATH]
+
+        def plugin_types():
+            return [cls.__name__ for cls in bapp.main().context().types(bapp.plugin_type())
+                    if cls.__name__.startswith('ImportPlan')]
+        # end utility
+
+        sys.path.insert(0, str(rw_dir))
+        try:
+            assert iterator.import_modules(store, 'foo') == [module]
+            assert len(executions.lines()) == 2
+            assert sorted(plugin_types()) == ['ImportPlanFilePlugin', 'ImportPlanModulePlugin']
+            assert [target for target, _ in plan.timings()] != [], 'timings are recorded'
+
+            # New contexts receive the plugins without executing anything
+            bapp.main().context().push('asset')
+            assert iterator.import_modules(store, 'foo') == [module]
+            assert len(executions.lines()) == 2, 'unchanged modules are not executed again'
+            assert sorted(cls.__name__ for cls in bapp.main().context().stack()[-1].types(bapp.plugin_type())) == \
+                ['ImportPlanFilePlugin', 'ImportPlanModulePlugin']
+
+            # plugins are bound to their application, which is why they are executed for new ones
+            bapp.Application.new(settings_trees=Path(__file__).dirname() / 'etc',
+                                 settings_hierarchy=False,
+                                 user_settings=False)
+            assert not plugin_types()
+            assert iterator.import_plan(store, 'foo') is not plan, 'plans are cached per application'
+            iterator.import_modules(store, 'foo')
+            assert len(executions.lines()) == 4
+            assert module in ImportPlan._executed[bapp.main()]
+            assert sorted(plugin_types()) == ['ImportPlanFilePlugin', 'ImportPlanModulePlugin']
+
+            # changed sources are executed
+            time.sleep(0.01)
+            (plugin_dir / 'import_plan_plugin.py').write_text(source % (str(executions), 'ImportPlanChanged'))
+            iterator.import_modules(store, 'foo')
+            assert executions.lines()[-1].strip() == 'import_plan_plugin'
+            assert len(executions.lines()) == 5, 'only the changed file is executed'
+        finally:
+            sys.path.remove(str(rw_dir))
+            sys.modules.pop(module, None)
+        # end restore import path
+
+    @preserve_application
+    @with_application
+    @with_rw_directory
+    def test_process_information_storage(self, rw_dir):
+        """verify process information can be stored in the environment and in files"""
+        stack = bapp.main().context()
+        storage_evar = ControlledProcessInformation.storage_environment_variable
+        for storage_directory in (None, rw_dir / 'info'):
+            env = dict()
+            ControlledProcessInformation.store(env, stack, chunk_size=128, storage_directory=storage_directory)
+            if storage_directory:
+                assert env[storage_evar].startswith(ControlledProcessInformation.storage_file_prefix)
+                assert len(storage_directory.files()) == 1
+                ControlledProcessInformation.store(dict(), stack, storage_directory=storage_directory)
+                assert len(storage_directory.files()) == 1, 'files are content-addressed'
+            else:
+                assert len(env) > 4, 'data is chunked'
+            # end check storage
+
+            class Information(ControlledProcessInformation):
+                """Use a new singleton type"""
+            # end class Information
+
+            environ = dict(os.environ)
+            try:
+                os.environ.update(env)
+                assert Information().data() == stack.settings().data()
+                assert Information().config_hashmap() == ControlledProcessInformation.config_file_hash_map(stack)
+            finally:
+                os.environ.clear()
+                os.environ.update(environ)
+            # end restore environment
+        # end for each storage type
+
+        data = OrderedDict([('a', OrderedDict([('b', 1), ('c', OrderedDict([('d', 2)]))])), ('e', 3)])
+        subtrees = ControlledProcessInformation._subtrees
+        assert subtrees(data, ['a.c.d', 'e', 'f', 'e.g']) == dict(a=dict(c=dict(d=2)), e=3)
+        assert subtrees(data, ['a', 'a.c'])['a'] is data['a'], 'longer prefixes are covered by shorter ones'
+        assert subtrees(data, ['a.c', 'a'])['a'] is data['a']
+        assert subtrees(data, ['a.b', 'a.c']) == dict(a=dict(b=1, c=dict(d=2)))
+        assert data['a']['c'] == dict(d=2), 'data is not changed'
+
+        env = dict()
+        ControlledProcessInformation.store(env, stack, key_prefixes=['packages.nosetests'])
+        environ = dict(os.environ)
+        try:
+            os.environ.update(env)
+
+            class FilteredInformation(ControlledProcessInformation):
+                """Use a new singleton type"""
+            # end class FilteredInformation
+
+            assert list(FilteredInformation().data().keys()) == ['packages']
+            assert list(FilteredInformation().data()['packages'].keys()) == ['nosetests']
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+        # end restore environment
+
+        env = dict()
+        ControlledProcessInformation.store(env, stack, storage_directory=(rw_dir / 'info').files()[0] / 'invalid')
+        assert not env[storage_evar].startswith(ControlledProcessInformation.storage_file_prefix), 'falls back'
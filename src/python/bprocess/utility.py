@@ -12,10 +12,17 @@ from __future__ import division
 __all__ = ['PackageMetaDataChangeTracker', 'FlatteningPackageDataIteratorMixin', 'application_context',
            'ProcessControllerPackageSpecification', 'PackageDataIteratorMixin',
            'ExecutableContext', 'PythonPackageIterator', 'CommandlineOverridesContext',
-           'ControlledProcessContext', 'ControlledProcessInformation']
+           'ControlledProcessContext', 'ControlledProcessInformation', 'LaunchPlanCache',
+           'PackageDependencyIndex', 'PackageCycleError', 'EnvironmentBuilder', 'PathStatCache', 'ImportPlan']
 
 import sys
 import os
+import re
+import stat
+import socket
+import hashlib
+import time
+import weakref
 
 # This yaml import is save, as bkvstore will place it's own yaml module there just in case there is no
 # installed one
@@ -40,12 +47,19 @@ from butility import (OrderedDict,
                       DictObject,
                       Path,
                       load_files,
+                      find_loadable_files,
+                      startup_timing,
                       Singleton,
-                      LazyMixin)
+                      login_name,
+                      GraphIterator,
+                      parallel_map,
+                      LazyMixin,
+                      stat_fingerprint)
 
 from butility.compat import pickle
 
-from bcontext import Context
+from bcontext import (Context,
+                      redirect_registration)
 from bapp import (StackAwareHierarchicalContext,
                   ApplicationSettingsMixin)
 from .schema import (controller_schema,
@@ -135,17 +149,41 @@ class ControlledProcessInformation(IControlledProcessInformation, Singleton, Laz
         '_hash_map',
     )
 
+    # -------------------------
+    # @name Configuration
+    # @{
+
+    # separates the names of environment variables holding the chunks of our data
     key_sep = ','
 
+    # prefix of the value of the storage environment variable if the data is stored in a file.
+    # It can't clash with key names, which never contain it.
+    storage_file_prefix = 'file:'
+
+    # zlib compression level used when storing data in the environment, where size matters most
+    environment_compression_level = 9
+
+    # zlib compression level used when storing data in files, where speed matters most
+    file_compression_level = 1
+
+    # -- End Configuration -- @}
+
     def _set_cache_(self, name):
         if name == '_data':
             self._data = None
             if not self.has_data():
                 return
             # end handle not started that way
-            # just return it without regarding the order
-            keys = os.environ[self.storage_environment_variable].split(self.key_sep)
-            self._data = self._decode(''.join(os.environ[k] for k in keys).encode())
+            value = os.environ[self.storage_environment_variable]
+            if value.startswith(self.storage_file_prefix):
+                with open(value[len(self.storage_file_prefix):], 'rb') as fp:
+                    self._data = self._loads(fp.read())
+                # end assure file is closed
+            else:
+                # just return it without regarding the order
+                keys = value.split(self.key_sep)
+                self._data = self._decode(''.join(os.environ[k] for k in keys).encode())
+            # end handle storage type
         elif name == '_kvstore':
             data = self.data()
             self._kvstore = None
@@ -191,18 +229,83 @@ class ControlledProcessInformation(IControlledProcessInformation, Singleton, Laz
         env[evar] = yaml.dump(data)
 
     @classmethod
-    def _encode(cls, data):
-        """@return encoded version of data, suitable to be stored in the environment"""
+    def _dumps(cls, data, level):
+        """@return compressed bytes of the given data, using the given zlib compression level"""
         # make sure we pickle with protocol 2, to allow running python3 for bootstrap,
         # which launches python2
+        return zlib.compress(pickle.dumps(data, 2), level)
+
+    @classmethod
+    def _loads(cls, data_bytes):
+        """@return data previously compressed with _dumps()"""
+        kwargs = (sys.version_info[0] > 2) and dict(encoding='utf-8') or dict()
+        return pickle.loads(zlib.decompress(data_bytes), **kwargs)
+
+    @classmethod
+    def _encode(cls, data):
+        """@return encoded version of data, suitable to be stored in the environment"""
         # We also have to be sure it's a string object, in order to be working in an environment dict
-        return binascii.b2a_base64(zlib.compress(pickle.dumps(data, 2), 9)).decode()
+        return binascii.b2a_base64(cls._dumps(data, cls.environment_compression_level)).decode()
 
     @classmethod
     def _decode(cls, data_string):
         """@return decoded version of the previously encoded data_string"""
-        kwargs = (sys.version_info[0] > 2) and dict(encoding='utf-8') or dict()
-        return pickle.loads(zlib.decompress(binascii.a2b_base64(data_string)), **kwargs)
+        return cls._loads(binascii.a2b_base64(data_string))
+
+    @classmethod
+    def _subtrees(cls, data, key_prefixes):
+        """@return a new nested dict with only those values of the given nested data dict which are located at or
+        below the given key prefixes, like 'logging' or 'packages.foo'. Prefixes which don't exist are ignored"""
+        res = OrderedDict()
+        created = set([id(res)])    # ids of dicts we created, others are values of data
+        for prefix in key_prefixes:
+            keys = prefix.split('.')
+            src = data
+            for key in keys:
+                if not isinstance(src, dict) or key not in src:
+                    break
+                # end handle missing keys
+                src = src[key]
+            else:
+                dst = res
+                for key in keys[:-1]:
+                    if key not in dst:
+                        dst[key] = OrderedDict()
+                        created.add(id(dst[key]))
+                    elif id(dst[key]) not in created:
+                        break
+                    # end skip keys already covered by a shorter prefix
+                    dst = dst[key]
+                else:
+                    dst[keys[-1]] = src
+                # end handle covered keys
+            # end handle existing keys
+        # end for each prefix
+        return res
+
+    @classmethod
+    def _store_file(cls, directory, data):
+        """Store the given data in a file within the given directory, named after the hash of its contents.
+        Existing files are reused, which is common for nested launches with the same configuration.
+        @return path to the file"""
+        data_bytes = cls._dumps(data, cls.file_compression_level)
+        directory = Path(directory)
+        path = directory / ('%s.bpi' % hashlib.sha1(data_bytes).hexdigest())
+        if path.isfile():
+            return path
+        # end reuse existing file
+        if not directory.isdir():
+            directory.makedirs()
+        # end assure directory exists
+        tmp_path = '%s.%i.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as fp:
+            fp.write(data_bytes)
+        # end assure file is closed
+        if os.name == 'nt' and os.path.exists(path):
+            os.remove(path)
+        # end rename doesn't replace on windows
+        os.rename(tmp_path, path)
+        return path
 
     # -------------------------
     # @name Interface
@@ -236,13 +339,37 @@ class ControlledProcessInformation(IControlledProcessInformation, Singleton, Laz
         return self._kvstore
 
     @classmethod
-    def store(cls, env, context_stack, chunk_size=1024):
+    def store(cls, env, context_stack, chunk_size=1024, storage_directory=None, key_prefixes=None):
         """Store the data within the given application context within the environment dict for later retrieval
         @param env the environment dict to be used for the soon-to-be-started process
         @param context_stack a ContextStack instance from which to store all data
-        @param chunk_size the size of each chunk to be stored within the environment"""
-        source = cls._encode(context_stack.settings().data())
-
+        @param chunk_size the size of each chunk to be stored within the environment
+        @param storage_directory if not None, the data will be stored in a file in the given directory, and only 
+        its path is stored in the environment. If None, the directory is taken from the 
+        storage_directory_environment_variable in env or os.environ, if set.
+        If the file cannot be written, the data is stored in the environment
+        @param key_prefixes if not None, a list of prefixes of keys, like 'logging' or 'packages.foo', to store
+        the values of. All other values are not stored, which makes storing and reading them faster"""
+        data = context_stack.settings().data()
+        if key_prefixes is not None:
+            data = cls._subtrees(data, key_prefixes)
+        # end filter data
+        storage_directory = storage_directory or env.get(cls.storage_directory_environment_variable) or \
+            os.environ.get(cls.storage_directory_environment_variable)
+
+        stored = False
+        if storage_directory:
+            try:
+                path = cls._store_file(storage_directory, data)
+                env[cls.storage_environment_variable] = cls.storage_file_prefix + path
+                stored = True
+            except (IOError, OSError):
+                log.warn("Could not store process information in directory '%s' - using the environment instead",
+                         storage_directory, exc_info=True)
+            # end handle write errors
+        # end handle file storage
+
+        source = not stored and cls._encode(data)
         if source:
             sc = StringChunker()
 
@@ -255,16 +382,21 @@ class ControlledProcessInformation(IControlledProcessInformation, Singleton, Laz
                              context_stack.settings().value_by_schema(process_schema))
 
         # Store ConfigHierarchy hashmap for restoring it later
-        # merge and store
+        # Always store it, even if empty
+        env[cls.config_file_hash_map_environment_variable] = cls._encode(cls.config_file_hash_map(context_stack))
+
+    @classmethod
+    def config_file_hash_map(cls, context_stack):
+        """@return an OrderedDict with a mapping of md5 hashes to paths of all configuration files loaded by
+        StackAwareHierarchicalContexts on the given stack, in loading order
+        @param context_stack a ContextStack instance"""
         hash_map = OrderedDict()
         for einstance in context_stack.stack():
             if isinstance(einstance, StackAwareHierarchicalContext):
                 hash_map.update(einstance.hash_map())
             # end update hash_map
         # end for each env on stack
-
-        # Always store it, even if empty
-        env[cls.config_file_hash_map_environment_variable] = cls._encode(hash_map)
+        return hash_map
 
     @classmethod
     def store_commandline_overrides(cls, env, data):
@@ -290,6 +422,586 @@ class ControlledProcessInformation(IControlledProcessInformation, Singleton, Laz
 # end class ControlledProcessInformation
 
 
+class LaunchPlanCache(object):
+
+    """Stores the launch plans computed by a ProcessController in a directory, one file per key.
+
+    A launch plan is a dict with all information required to launch a program without evaluating the package
+    database again, like the environment, arguments and executable. Besides its key, each plan knows about
+    the parent environment variables and paths it depends on, which are verified when it is retrieved.
+    Other data which depends on the environment in the same way can be stored as payload, see put_payload().
+    """
+    __slots__ = ('_directory')
+
+    # -------------------------
+    # @name Configuration
+    # @{
+
+    # Version of our file format. Plans with a different version are ignored
+    version = 2
+
+    # Matches environment variables references, like $FOO or ${FOO}
+    re_environment_reference = re.compile(r'\$\{?([A-Za-z_][A-Za-z0-9_]*)')
+
+    # -- End Configuration -- @}
+
+    def __init__(self, directory):
+        """Initialize this instance
+        @param directory in which to keep launch plans. It will be created on first write if needed"""
+        self._directory = Path(directory)
+
+    # -------------------------
+    # @name Utilities
+    # @{
+
+    def _plan_path(self, key):
+        """@return path to the file containing the plan with the given key"""
+        return self._directory / ('%s.plan' % key)
+
+    # -- End Utilities -- @}
+
+    # -------------------------
+    # @name Interface
+    # @{
+
+    @classmethod
+    def key(cls, *args):
+        """@return a string key from the given arguments, which must have a stable representation"""
+        items = [sys.version, sys.executable, sys.platform, login_name(), socket.gethostname()]
+        items.extend('%r' % (arg,) for arg in args)
+        return hashlib.sha1('\0'.join(items).encode('utf-8')).hexdigest()
+
+    @classmethod
+    def environment_references(cls, values, env):
+        """@return a set of names of all environment variables referenced by the given values, following 
+        references in the values of referenced variables
+        @param values iterable of strings which may contain references like $FOO or ${FOO}
+        @param env dict with environment variables to look up referenced values, like os.environ"""
+        names = set()
+        values = list(values)
+        while values:
+            for name in cls.re_environment_reference.findall('%s' % values.pop()):
+                if name in names:
+                    continue
+                # end skip known names
+                names.add(name)
+                if name in env:
+                    values.append(env[name])
+                # end follow reference
+            # end for each referenced name
+        # end for each value
+        return names
+
+    @classmethod
+    def new_plan(cls, inherit, environ, args, cwd, executable, resolve_args, parent_environ, paths, propagate=None):
+        """@return a new launch plan
+        @param inherit if True, the program inherits the environment of its parent process
+        @param environ dict with environment variables the plan sets, on top of the parent environment if 
+        it is inherited
+        @param args list of arguments of the program to launch
+        @param cwd working directory of the program to launch
+        @param executable path to the executable to launch
+        @param resolve_args if True, environment variables in arguments are to be resolved
+        @param parent_environ dict of name: value pairs of all variables of the parent environment the plan depends 
+        on. The value is None if the variable wasn't set
+        @param paths list of (path, existed) tuples of all paths which where checked for existence while 
+        computing the plan
+        @param propagate list of prefixes of settings keys to pass on to the program, or None to pass all"""
+        return dict(version=cls.version, inherit=inherit, environ=dict(environ), args=list(args), cwd=cwd,
+                    executable=executable, resolve_args=resolve_args,
+                    parent_environ=dict(parent_environ), paths=list(paths), propagate=propagate)
+
+    @classmethod
+    def is_valid(cls, plan):
+        """@return True if the given plan is still valid, which is the case if all parent environment variables 
+        and paths it depends on are unchanged"""
+        for name, value in plan['parent_environ'].items():
+            if os.environ.get(name) != value:
+                log.debug("launch plan invalidated by change of environment variable '%s'", name)
+                return False
+            # end check variable
+        # end for each variable
+        for path, existed in plan['paths']:
+            if os.path.exists(path) != existed:
+                log.debug("launch plan invalidated by path '%s'", path)
+                return False
+            # end check path
+        # end for each path
+        return True
+
+    def get(self, key):
+        """@return the valid launch plan stored under the given key, or None if there is none"""
+        try:
+            with open(self._plan_path(key), 'rb') as fp:
+                plan = pickle.load(fp)
+            # end assure file is closed
+        except Exception:
+            return None
+        # end ignore missing or invalid plans
+        if not isinstance(plan, dict) or plan.get('version') != self.version or not self.is_valid(plan):
+            return None
+        # end check plan
+        return plan
+
+    def put(self, key, plan):
+        """Store the given plan under the given key, replacing the previous one atomically.
+        Failures are logged, but not raised.
+        @return self"""
+        path = self._plan_path(key)
+        tmp_path = '%s.%i.tmp' % (path, os.getpid())
+        try:
+            if not self._directory.isdir():
+                self._directory.makedirs()
+            # end assure directory exists
+            with open(tmp_path, 'wb') as fp:
+                pickle.dump(plan, fp, 2)
+            # end assure file is closed
+            if os.name == 'nt' and os.path.exists(path):
+                os.remove(path)
+            # end rename doesn't replace on windows
+            os.rename(tmp_path, path)
+        except (IOError, OSError, pickle.PicklingError):
+            log.warn("Could not write launch plan to '%s'", path, exc_info=True)
+        # end ignore write errors
+        return self
+
+    def get_payload(self, key):
+        """@return the valid payload stored under the given key by put_payload(), or None if there is none"""
+        entry = self.get(key)
+        if entry is None or 'payload' not in entry:
+            return None
+        # end handle launch plans and invalid entries
+        return entry['payload']
+
+    def put_payload(self, key, payload, parent_environ, paths=()):
+        """Store the given payload under the given key, like a launch plan which depends on the given 
+        environment variables and paths.
+        @param payload any picklable object
+        @param parent_environ dict of name: value pairs of all variables of the parent environment the payload
+        depends on. The value is None if the variable wasn't set
+        @param paths list of (path, existed) tuples of all paths the payload depends on
+        @return self"""
+        return self.put(key, dict(version=self.version, payload=payload,
+                                  parent_environ=dict(parent_environ), paths=list(paths)))
+
+    # -- End Interface -- @}
+
+# end class LaunchPlanCache
+
+
+class PackageCycleError(ValueError):
+
+    """Thrown if the requirements of a package form a cycle, and a topological order is requested"""
+    __slots__ = ()
+
+# end class PackageCycleError
+
+
+class PackageDependencyIndex(GraphIterator):
+
+    """An index of the dependency graph formed by the 'requires' field of packages.
+
+    Packages are indexed on first access, and everything derived from the graph, like the closure of a package,
+    is computed only once. Therefore the index must be recreated whenever the package database changes.
+    """
+    __slots__ = (
+        '_package_data',  # a function returning the package data for a given package name
+        '_requires',      # an ordered dict of package name: list of required package names
+        '_ignore',        # a dict of package name: list of names of packages it ignores
+        '_required_by',   # a dict of package name: list of names of packages requiring it, or None
+        '_closures'       # a dict of package name: list of (name, depth) tuples
+    )
+
+    def __init__(self, package_data, names=tuple()):
+        """Initialize this instance
+        @param package_data a function taking a package name, and returning its data. The latter needs the
+        'requires' and 'ignore' attributes. It should raise if the package doesn't exist.
+        @param names an iterable of package names to index right away, along with their requirements. This is 
+        required to make required_by() aware of packages which are not required by anyone"""
+        self._package_data = package_data
+        self._requires = OrderedDict()
+        self._ignore = dict()
+        self._required_by = None
+        self._closures = dict()
+        for name in names:
+            for item in self._iter_(name, self.upstream, self.breadth_first):
+                pass
+            # end index all requirements
+        # end for each name to index
+
+    # -------------------------
+    # @name GraphIterator Implementation
+    # @{
+
+    def _predecessors(self, name):
+        """@return names of all packages the given one requires"""
+        try:
+            return self._requires[name]
+        except KeyError:
+            pass
+        # end handle cache hit
+        data = self._package_data(name)
+        requires = list(data.requires)
+        self._requires[name] = requires
+        self._ignore[name] = list(data.ignore)
+        self._required_by = None
+        return requires
+
+    def _successors(self, name):
+        """@return names of all indexed packages requiring the given one"""
+        if self._required_by is None:
+            required_by = dict()
+            for package_name, requires in self._requires.items():
+                for required_name in requires:
+                    required_by.setdefault(required_name, list()).append(package_name)
+                # end for each required package
+            # end for each package
+            self._required_by = required_by
+        # end build reverse map on demand
+        return self._required_by.get(name, list())
+
+    # -- End GraphIterator Implementation -- @}
+
+    # -------------------------
+    # @name Interface
+    # @{
+
+    def names(self):
+        """@return a list of the names of all packages indexed so far"""
+        return list(self._requires.keys())
+
+    def closure(self, name):
+        """@return a list of (package_name, depth) tuples of the given package and all packages it requires,
+        directly or indirectly, in breadth-first order. Each package is listed only once"""
+        try:
+            return self._closures[name]
+        except KeyError:
+            pass
+        # end handle cache hit
+        closure = self._closures[name] = list(self._iter_(name, self.upstream, self.breadth_first))
+        return closure
+
+    def reachable(self, name):
+        """@return a list of names of all packages in the closure of the given one which are not ignored, 
+        in closure order.
+        A package is ignored if a package in front of it in the closure lists it in its 'ignore' field. 
+        Ignored packages still contribute their requirements, and are not able to ignore other packages"""
+        res = list()
+        exclude_packages = set()
+        for package_name, depth in self.closure(name):
+            if package_name in exclude_packages:
+                log.debug("Excluding %s", package_name)
+                continue
+            # end ignore excluded packages
+            ignore = self._ignore[package_name]
+            if ignore:
+                exclude_packages |= set(ignore)
+                log.debug('%s: added exclude packages %s', package_name, ', '.join(ignore))
+            # end handle ignore
+            res.append(package_name)
+        # end for each package in closure
+        return res
+
+    def topological_order(self, name):
+        """@return a list of names of the given package and all packages it requires, where each package comes 
+        after all packages it requires.
+        @throw PackageCycleError if the requirements form a cycle"""
+        order = list()
+        done = set()
+        path = [name]
+        stack = [(name, iter(self._predecessors(name)))]
+        while stack:
+            package_name, requires = stack[-1]
+            for required_name in requires:
+                if required_name in done:
+                    continue
+                # end skip handled packages
+                if required_name in path:
+                    cycle = path[path.index(required_name):] + [required_name]
+                    raise PackageCycleError("Package requirements form a cycle: %s" % ' -> '.join(cycle))
+                # end handle cycles
+                path.append(required_name)
+                stack.append((required_name, iter(self._predecessors(required_name))))
+                break
+            else:
+                stack.pop()
+                path.pop()
+                done.add(package_name)
+                order.append(package_name)
+            # end handle all requirements visited
+        # end while there are packages to visit
+        return order
+
+    def requires(self, name, transitive=False):
+        """@return a list of names of all packages the given one requires
+        @param name of the package
+        @param transitive if True, indirect requirements will be returned too, in breadth-first order"""
+        if not transitive:
+            return list(self._predecessors(name))
+        # end handle direct requirements
+        return [package_name for package_name, depth in self.closure(name)[1:]]
+
+    def required_by(self, name, transitive=False):
+        """@return a list of names of all indexed packages which require the given one
+        @param name of the package
+        @param transitive if True, packages requiring it indirectly will be returned too, in breadth-first order"""
+        if not transitive:
+            return list(self._successors(name))
+        # end handle direct dependents
+        return [package_name for package_name, depth in self._iter_(name, self.downstream, self.breadth_first)
+                if package_name != name]
+
+    # -- End Interface -- @}
+
+# end class PackageDependencyIndex
+
+
+class EnvironmentBuilder(object):
+
+    """A utility to efficiently build a process environment from the contributions of many packages.
+
+    Path variables are kept as ordered lists of unique entries, which are only joined into strings when needed.
+    Each contribution is recorded along with the package it came from, for debugging.
+
+    Instances behave like a read-only dict, which allows them to be used for resolving values
+    while the environment is still being built.
+    """
+    __slots__ = (
+        '_base',          # dict with the environment we started with
+        '_entries',       # dict of variable name: list of entries, for all changed variables
+        '_entry_sets',    # dict of variable name: set of entries, for all path variables, to detect duplicates
+        '_rendered',      # dict of variable name: string, caching rendered variables
+        '_sources'        # an ordered dict of variable name: list of (value, package_name) tuples
+    )
+
+    # -------------------------
+    # @name Configuration
+    # @{
+
+    # Matches environment variables references, like $FOO or ${FOO}
+    re_environment_reference = LaunchPlanCache.re_environment_reference
+
+    # -- End Configuration -- @}
+
+    def __init__(self, environ=dict()):
+        """Initialize this instance
+        @param environ a dict with the environment to build upon. It will not be changed"""
+        self._base = dict(environ)
+        self._entries = dict()
+        self._entry_sets = dict()
+        self._rendered = dict()
+        self._sources = OrderedDict()
+
+    # -------------------------
+    # @name Dict Interface
+    # @{
+
+    def __contains__(self, name):
+        return name in self._entries or name in self._base
+
+    def __getitem__(self, name):
+        try:
+            return self._rendered[name]
+        except KeyError:
+            pass
+        # end handle cache hit
+        if name not in self._entries:
+            return self._base[name]
+        # end handle unchanged variables
+        value = self._rendered[name] = str(os.pathsep.join(self._entries[name]))
+        return value
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def get(self, name, default=None):
+        if name not in self:
+            return default
+        # end handle missing variable
+        return self[name]
+
+    def keys(self):
+        names = set(self._base.keys())
+        names.update(self._entries.keys())
+        return list(names)
+
+    # -- End Dict Interface -- @}
+
+    # -------------------------
+    # @name Interface
+    # @{
+
+    def append_path(self, name, path, package_name=None):
+        """Append the given path to the path variable of the given name, unless it is already contained in it
+        @param name of the environment variable
+        @param path to append
+        @param package_name name of the package contributing the path, for debugging
+        @return self"""
+        path = str(path)
+        entries = self._entries.get(name)
+        if entries is None or name not in self._entry_sets:
+            curval = self.get(name)
+            # rule out empty strings, just like update_env_path()
+            entries = self._entries[name] = curval and curval.split(os.pathsep) or list()
+            self._entry_sets[name] = set(entries)
+        # end convert previous value into entries
+        self._sources.setdefault(name, list()).append((path, package_name))
+        if path in self._entry_sets[name]:
+            return self
+        # end skip duplicates
+        entries.append(path)
+        self._entry_sets[name].add(path)
+        self._rendered.pop(name, None)
+        return self
+
+    def set_value(self, name, value, package_name=None):
+        """Set the variable of the given name to the given value, replacing previous values
+        @param name of the environment variable
+        @param value to set
+        @param package_name name of the package contributing the value, for debugging
+        @return self"""
+        value = str(value)
+        self._entries[name] = [value]
+        self._entry_sets.pop(name, None)
+        self._rendered[name] = value
+        self._sources[name] = [(value, package_name)]
+        return self
+
+    def environment(self):
+        """@return a new dict with all variables, as strings"""
+        env = dict(self._base)
+        for name in self._entries:
+            env[name] = self[name]
+        # end for each changed variable
+        return env
+
+    def resolved_environment(self, resolve_value):
+        """@return a new dict with all variables, where references to other variables have been resolved.
+        Variables are resolved after all variables they reference, which allows to resolve each of them only once.
+        @param resolve_value a function(value, env) returning the resolved value, like 
+        ProcessControllerDelegate.resolve_value"""
+        env = self.environment()
+        pending = set(name for name, value in env.items() if '$' in value)
+        done = set()
+        for name in sorted(pending):
+            if name in done:
+                continue
+            # end skip resolved ones
+            # resolve depth-first, dependencies first. Cycles are resolved in the order they were encountered
+            path = [name]
+            stack = [(name, iter(self.re_environment_reference.findall(env[name])))]
+            while stack:
+                var, references = stack[-1]
+                for reference in references:
+                    if reference in pending and reference not in done and reference not in path:
+                        path.append(reference)
+                        stack.append((reference, iter(self.re_environment_reference.findall(env[reference]))))
+                        break
+                    # end handle unresolved reference
+                else:
+                    stack.pop()
+                    path.pop()
+                    done.add(var)
+                    env[var] = resolve_value(env[var], env)
+                # end handle all references resolved
+            # end while there are variables to resolve
+        # end for each variable to resolve
+        return env
+
+    def contributions(self):
+        """@return an ordered dict of variable name: list of (value, package_name) tuples of all values 
+        set or appended, in order, even if they were duplicates"""
+        return OrderedDict((name, list(sources)) for name, sources in self._sources.items())
+
+    # -- End Interface -- @}
+
+# end class EnvironmentBuilder
+
+
+class PathStatCache(object):
+
+    """Caches the results of os.stat() calls, allowing to obtain many of them at once using multiple threads.
+
+    This is useful to make file system queries fast, even on high-latency network file systems.
+    It is expected to be short-lived, as changes to the file system are not detected.
+    """
+    __slots__ = ('_stats')
+
+    # -------------------------
+    # @name Configuration
+    # @{
+
+    # Maximum amount of threads to use when prefetching
+    max_workers = 8
+
+    # -- End Configuration -- @}
+
+    def __init__(self):
+        """Initialize this instance"""
+        self._stats = dict()
+
+    # -------------------------
+    # @name Utilities
+    # @{
+
+    @classmethod
+    def _stat(cls, path):
+        """@return os.stat() result for the given path, or None if it is inaccessible"""
+        try:
+            return os.stat(path)
+        except OSError:
+            return None
+        # end handle inaccessible paths
+
+    # -- End Utilities -- @}
+
+    # -------------------------
+    # @name Interface
+    # @{
+
+    def prefetch(self, paths):
+        """Obtain the stat information of all given paths which are not yet cached, concurrently
+        @param paths iterable of paths
+        @return self"""
+        paths = [str(path) for path in paths if str(path) not in self._stats]
+        paths = list(OrderedDict.fromkeys(paths))
+        for path, st in zip(paths, parallel_map(self._stat, paths, max_workers=self.max_workers)):
+            self._stats[path] = st
+        # end for each result
+        return self
+
+    def stat(self, path):
+        """@return os.stat() result for the given path, or None if it is inaccessible"""
+        path = str(path)
+        try:
+            return self._stats[path]
+        except KeyError:
+            st = self._stats[path] = self._stat(path)
+            return st
+        # end handle cache miss
+
+    def exists(self, path):
+        """@return True if the given path exists"""
+        return self.stat(path) is not None
+
+    def isfile(self, path):
+        """@return True if the given path is an existing file"""
+        st = self.stat(path)
+        return st is not None and stat.S_ISREG(st.st_mode)
+
+    def isdir(self, path):
+        """@return True if the given path is an existing directory"""
+        st = self.stat(path)
+        return st is not None and stat.S_ISDIR(st.st_mode)
+
+    # -- End Interface -- @}
+
+# end class PathStatCache
+
+
 class PackageDataIteratorMixin(object):
 
     """A mixin to provide functionality to iterate the process controller's package database.
@@ -596,11 +1308,14 @@ class ProcessControllerPackageSpecification(LazyMixin):
         # end handle root path
         return self.root_path() / path
 
-    def executable(self, env):
+    def executable(self, env, stat_cache=None):
         """@return butility.Path to executable - its not verified to be existing
+        @param env dict with environment variables to resolve the executable path with
+        @param stat_cache if not None, a PathStatCache instance to use when checking for existing files
         @note for now this is uncached, but its okay for our use
         @note we always resolve environment variables
         """
+        isfile = stat_cache is None and os.path.isfile or stat_cache.isfile
         executables = self.data().executable
         if not executables:
             raise ValueError("no executable set for package '%s'" % self.name())
@@ -633,7 +1348,7 @@ class ProcessControllerPackageSpecification(LazyMixin):
 
             # If we have variables in the path, we can't assume anything (nor resolve) as it might be too early
             # for that. In that case, we assume the best. Otherwise, the executable must exist
-            if not executable_path.containsvars() and not executable_path.isfile():
+            if not executable_path.containsvars() and not isfile(executable_path):
                 continue
             # end
 
@@ -648,6 +1363,198 @@ class ProcessControllerPackageSpecification(LazyMixin):
 # end class ProcessControllerPackageSpecification
 
 
+class _PluginRecorder(object):
+
+    """Registers plugins with the stack of their type, as if there was no redirection, and remembers them"""
+    __slots__ = ('plugins')
+
+    def __init__(self):
+        self.plugins = list()
+
+    @classmethod
+    def register_with_stack(cls, plugin):
+        """Register the given plugin type or instance with the stack of its type
+        @return plugin"""
+        plugin_type = isinstance(plugin, type) and plugin or type(plugin)
+        return plugin_type._stack().register(plugin)
+
+    def register(self, plugin):
+        self.plugins.append(plugin)
+        return self.register_with_stack(plugin)
+
+# end class _PluginRecorder
+
+
+class ImportPlan(object):
+
+    """The modules and plugin paths to import for a package and all packages it requires, in order.
+
+    Modules and plugin files are executed only if they were not executed for the current Application before, or 
+    if their source changed since. Otherwise, the plugins they registered when they were executed are registered 
+    again, with the context that is current now, which is what would happen if they were executed.
+    A new Application always executes them again, as plugin types are bound to the Application they were
+    created in.
+    The time it took to execute each module or plugin path is recorded, to make slow ones easy to find.
+    """
+    __slots__ = (
+        '_steps',   # list of (package_name, kind, target) tuples
+        '_timings'  # OrderedDict of target: seconds it took to execute it the last time
+    )
+
+    # -------------------------
+    # @name Constants
+    # @{
+
+    KIND_MODULE = 'module'
+    KIND_PLUGIN_PATH = 'plugin_path'
+    KIND_ERROR = 'error'
+
+    # -- End Constants -- @}
+
+    # Application: dict of module name or plugin path: (fingerprints, module, plugins) of everything we executed
+    # for the Application, shared by all plans. Records go away with their Application
+    _executed = weakref.WeakKeyDictionary()
+
+    # dict of plugin path: (fingerprint, list of loadable files)
+    _listings = dict()
+
+    def __init__(self, steps):
+        """Initialize this instance
+        @param steps list of (package_name, kind, target) tuples, where kind is one of our KIND_* constants, and 
+        target is a module name, an absolute plugin path or an error message respectively"""
+        self._steps = steps
+        self._timings = OrderedDict()
+
+    # -------------------------
+    # @name Utilities
+    # @{
+
+    @classmethod
+    def _module_source(cls, module):
+        """@return path to the source file of the given module object, or None if there is none"""
+        path = getattr(module, '__file__', None)
+        if path and path[-4:] in ('.pyc', '.pyo') and os.path.isfile(path[:-1]):
+            path = path[:-1]
+        # end prefer source over byte code
+        return path
+
+    def _loadable_files(self, plugin_path):
+        """@return list of files load_files() would load for the given plugin path, which is only listed again
+        if it changed"""
+        fingerprint = stat_fingerprint(plugin_path)
+        listing = self._listings.get(plugin_path)
+        if listing is None or listing[0] != fingerprint:
+            listing = (fingerprint, find_loadable_files(plugin_path))
+            self._listings[plugin_path] = listing
+        # end list changed paths
+        return listing[1]
+
+    def _record(self, target, fingerprints, module, plugins):
+        """Remember that the given target was executed for the current Application"""
+        self._executed.setdefault(bapp.main(), dict())[target] = (fingerprints, module, plugins)
+
+    def _replay(self, target, fingerprints, module):
+        """Register the plugins recorded for the given target again, if its fingerprints are unchanged
+        @param module the module the target was executed in, or None for plugin paths
+        @return True if the target doesn't need to be executed"""
+        record = self._executed.get(bapp.main(), dict()).get(target)
+        if record is None or record[0] != fingerprints or record[1] is not module:
+            return False
+        # end handle changes
+        for plugin in record[2]:
+            _PluginRecorder.register_with_stack(plugin)
+        # end for each plugin to register again
+        return True
+
+    def _import_module(self, module):
+        """@return True if the given module was imported, or was imported before and didn't change"""
+        loaded = sys.modules.get(module)
+        if loaded is not None:
+            source = self._module_source(loaded)
+            if self._replay(module, [(source, source and stat_fingerprint(source))], loaded):
+                return True
+            # end handle unchanged module
+        # end handle loaded module
+
+        recorder = _PluginRecorder()
+        with redirect_registration(recorder):
+            if not PythonPackageIterator.import_module(module, force_reimport=True):
+                return False
+            # end handle failure
+        # end with recording
+        loaded = sys.modules.get(module)
+        source = self._module_source(loaded)
+        self._record(module, [(source, source and stat_fingerprint(source))], loaded, recorder.plugins)
+        return True
+
+    def _load_plugin_path(self, plugin_path):
+        """Load all plugin files at the given path, unless we loaded them already and none of them changed"""
+        files = self._loadable_files(plugin_path)
+        fingerprints = [(path, stat_fingerprint(path)) for path in files]
+        if self._replay(plugin_path, fingerprints, None):
+            return
+        # end handle unchanged files
+
+        recorder = _PluginRecorder()
+        with redirect_registration(recorder):
+            load_files(files)
+        # end with recording
+        self._record(plugin_path, fingerprints, None, recorder.plugins)
+
+    # -- End Utilities -- @}
+
+    # -------------------------
+    # @name Interface
+    # @{
+
+    def steps(self):
+        """@return list of (package_name, kind, target) tuples, in order of execution"""
+        return self._steps
+
+    def timings(self):
+        """@return list of (target, seconds) tuples of all modules and plugin paths executed by the last call
+        to execute(), slowest first"""
+        return sorted(self._timings.items(), key=lambda item: item[1], reverse=True)
+
+    def execute(self):
+        """Import all modules and load all plugin paths of our plan, in order
+        @return a list of import-paths to modules that were loaded successfully
+        @note import errors will be logged, but ignored"""
+        imported_modules = list()
+        self._timings.clear()
+        for package_name, kind, target in self._steps:
+            if kind == self.KIND_ERROR:
+                # plugin's shouldn't be essential, and make a program fail to startup (at least until
+                # we make it a configuration flag)
+                log.error(target)
+                continue
+            # end handle errors found when computing the plan
+
+            st = time.time()
+            with startup_timing.phase('import %s' % target):
+                if kind == self.KIND_MODULE:
+                    if self._import_module(target):
+                        log.info("Imported module '%s' for package '%s'", target, package_name)
+                        imported_modules.append(target)
+                    # end ignore exceptions
+                else:
+                    try:
+                        self._load_plugin_path(target)
+                    except Exception as err:
+                        log.error("Failed to load plugin(s) at '%s' with error: %s", target, err)
+                    # end don't quit on failures to load plugins
+                # end handle kind
+            # end record timing
+            self._timings[target] = time.time() - st
+            log.debug("Executed %s '%s' in %.2fms", kind, target, self._timings[target] * 1000.0)
+        # end for each step
+        return imported_modules
+
+    # -- End Interface -- @}
+
+# end class ImportPlan
+
+
 class PythonPackageIterator(ApplicationSettingsMixin, PackageDataIteratorMixin):
 
     """A utility type allowing to deal with additional python information
@@ -664,6 +1571,10 @@ class PythonPackageIterator(ApplicationSettingsMixin, PackageDataIteratorMixin):
 
     # -- End Configuration -- @}
 
+    # Application: dict of package name: (store, ImportPlan) of the plan computed last for the package.
+    # Plans go away with their Application
+    _import_plans = weakref.WeakKeyDictionary()
+
     # -------------------------
     # @name Interface
     # @{
@@ -701,7 +1612,8 @@ class PythonPackageIterator(ApplicationSettingsMixin, PackageDataIteratorMixin):
         If set, we need a package_name as well
         @param package_name needs to be set if a store is given. Useful if no wrapper is involved
         @return a list of import-paths to modules that were loaded successfully.
-        @note import errors will be logged, but ignored. We do not reload !
+        @note import errors will be logged, but ignored. Modules are only executed again if their source changed,
+        see ImportPlan
         @note only works if this process is wrapped
         @note this is a way to load plug-ins"""
         if not (store and package_name):
@@ -711,18 +1623,27 @@ class PythonPackageIterator(ApplicationSettingsMixin, PackageDataIteratorMixin):
             package_name = info.process_data().id
         # end get information
 
-        imported_modules = list()
         if store is None:
-            return imported_modules
+            return list()
         # end handle no wrapped process
-
+        return self.import_plan(store, package_name).execute()
+
+    def import_plan(self, store, package_name):
+        """@return an ImportPlan with all modules and plugin paths configured for the given package and the ones 
+        it requires. It is computed only once per package, store and Application, which is why the store must not 
+        be changed afterwards
+        @param store a kvstore with package settings
+        @param package_name name of the package to start at"""
+        plans = self._import_plans.setdefault(bapp.main(), dict())
+        cached = plans.get(package_name)
+        if cached is not None and cached[0] is store:
+            return cached[1]
+        # end handle cache hit
+
+        steps = list()
         for pdata, pname in self._iter_package_data_by_schema(store, package_name, python_package_schema):
             for module in getattr(pdata.python, 'import'):
-                imp_module = self.import_module(module, force_reimport=True)
-                if imp_module:
-                    log.info("Imported module '%s' for package '%s'", module, pname)
-                    imported_modules.append(module)
-                # end ignore exceptions
+                steps.append((pname, ImportPlan.KIND_MODULE, module))
             # end for each module to laod
             plugin_paths = pdata.python.plugin_paths
             if plugin_paths:
@@ -732,16 +1653,17 @@ class PythonPackageIterator(ApplicationSettingsMixin, PackageDataIteratorMixin):
                         if not plugin_path.isabs():
                             plugin_path = package.to_abs_path(plugin_path)
                         # end make plugin path absolute
-                        load_files(plugin_path.expand_or_raise())
+                        steps.append((pname, ImportPlan.KIND_PLUGIN_PATH, plugin_path.expand_or_raise()))
                     except Exception as err:
-                        # plugin's shouldn't be essential, and make a program fail to startup (at least until
-                        # we make it a configuration flag)
-                        log.error("Failed to load plugin(s) at '%s' with error: %s", plugin_path, err)
+                        steps.append((pname, ImportPlan.KIND_ERROR,
+                                      "Failed to load plugin(s) at '%s' with error: %s" % (plugin_path, err)))
                     # end don't quit on failures to load plugins
                 # end for each plugin path
             # end handle plugin paths
         # end for each package
-        return imported_modules
+        plan = ImportPlan(steps)
+        plans[package_name] = (store, plan)
+        return plan
 
     # -- End Interface -- @}
 
@@ -847,7 +1769,4 @@ class CommandlineOverridesContext(Context):
             self._kvstore = KeyValueStoreModifier(overrides)
         # end handle overrides
 
-        # finally, import modules based on a rather complete configuration
-        iterator.import_modules()
-
 # end class CommandlineOverridesContext
@@ -14,9 +14,12 @@ __all__ = ['QualityCheckCategory', 'NoCategory', 'QualityCheck', 'QualityCheckRu
 import sys
 import traceback
 import logging
+import threading
+from collections import deque
 
 from butility import (abstractmethod,
                       Interface,
+                      Thread,
                       wraps)
 
 from .interfaces import (IQualityCheck,
@@ -120,6 +123,15 @@ class QualityCheck(IQualityCheck):
 
     result_constants = (success, failure, no_result)
 
+    # run() only reads, and may run concurrently with other checks, but not while something is fixed
+    read_only = 'read_only'
+    # run() may run concurrently with other checks, and while something is fixed
+    thread_safe = 'thread_safe'
+    # run() must run while no other check runs
+    exclusive = 'exclusive'
+
+    concurrency_constants = (read_only, thread_safe, exclusive)
+
     # -- Constants -- @}
 
     # -------------------------
@@ -136,6 +148,8 @@ class QualityCheck(IQualityCheck):
     _category = no_category
     # see `can_fix()`
     _can_fix = False
+    # see `concurrency()`
+    _concurrency = exclusive
 
     # -- Subclass Configuration -- @}
 
@@ -225,6 +239,19 @@ class QualityCheck(IQualityCheck):
         Can be the special constant `QualityCheck.no_category`, which is the default.
         """
 
+    @classmethod
+    def concurrency(cls):
+        """@returns one of our concurrency constants, indicating whether `run()` may run concurrently with other
+        checks if the `QualityCheckRunner` runs checks in parallel.
+        - **read_only**
+          + run() only reads, and may run concurrently with other checks, but not while another check is fixed
+        - **thread_safe**
+          + run() may run concurrently with anything, including fixes
+        - **exclusive**
+          + run() must run while no other check runs. This is the default
+        """
+        return cls._concurrency
+
     # -- Information -- @}
 # end class QualityCheck
 
@@ -236,9 +263,15 @@ class QualityCheckRunner(IQualityCheckRunner):
 
     For this, it uses a delegate which will receive respective calls. The client can implement one, but even 
     without a default delegate is used which does nothing
+
+    If max_workers is larger than 1, `run_all()` runs checks concurrently, as far as their `concurrency()` allows.
+    Fixes are applied one at a time. Checks are still started, fixed and reported in order, and the delegate is
+    only called from the thread calling `run_all()`. However, the delegate's `pre_run()` may be called for
+    checks following the one it gets to see in `post_run()` next.
     """
     __slots__ = (
-        '_delegate'
+        '_delegate',
+        '_max_workers'
     )
 
     # -------------------------
@@ -265,31 +298,28 @@ class QualityCheckRunner(IQualityCheckRunner):
 
     # -- End Configuration -- @}
 
-    def __init__(self, quality_checks, delegate=None):
+    def __init__(self, quality_checks, delegate=None, max_workers=1):
+        """@param max_workers the maximum amount of checks to run concurrently in `run_all()`. If smaller than 2,
+        all checks run one after another"""
         super(IQualityCheckRunner, self).__init__(quality_checks)
         if delegate is None:
             self._delegate = self.DefaultDelegateType()
         else:
             self._delegate = delegate
         # end handle delegate initialization
+        self._max_workers = max_workers
 
-    def run_one(self, quality_check, auto_fix=False):
-        assert isinstance(quality_check, QualityCheck)
-        # PRE RUN
-        #########
-        dres = self._delegate.pre_run(quality_check)
-        if dres is self.skip_check:
-            return quality_check
-        # end handle skip checks
-        if dres is self.stop_run:
-            raise StopIteration()
-        # end handle stop iteration
+    # -------------------------
+    # @name Utilities
+    # @{
 
-        # RUN
-        #######
+    def _run_and_fix(self, quality_check, auto_fix, run):
+        """Call run() to run the given check, and fix it if it failed, informing our delegate
+        @param run a function to run the check. It may raise"""
         fix_threw_exception = False
         try:
-            res = quality_check.reset_result().run().result()
+            run()
+            res = quality_check.result()
             if res == quality_check.no_result:
                 msg = "Quality check %s should have set the result of the run" % type(quality_check).__name__
                 raise AssertionError(msg)
@@ -315,6 +345,142 @@ class QualityCheckRunner(IQualityCheckRunner):
             # end prevent duplicate error handling
         # end handle qc exception
 
+    def _run_all_concurrently(self, auto_fix):
+        """Run all our checks with up to max_workers threads, see our class documentation"""
+        checks = list(self)
+        condition = threading.Condition()
+        # index -> concurrency of each running check
+        running = dict()
+        # index -> exception or None of each check that ran, but wasn't yet handled
+        finished = dict()
+        # indices of all started checks which were not yet handled, in order
+        started = deque()
+        next_index = 0
+        stopping = False
+
+        def can_start(concurrency):
+            """@return True if a check of the given concurrency can start now
+            @note to be called while condition is locked"""
+            if len(running) >= self._max_workers:
+                return False
+            # end handle worker count
+            if concurrency == QualityCheck.exclusive:
+                return not running
+            # end handle exclusive checks
+            return QualityCheck.exclusive not in running.values()
+
+        def worker(index, quality_check):
+            error = None
+            try:
+                quality_check.reset_result().run()
+            except BaseException as exc:
+                # SystemExit and KeyboardInterrupt are raised in the caller's thread as well
+                error = exc
+            finally:
+                with condition:
+                    del running[index]
+                    finished[index] = error
+                    condition.notify_all()
+                # end with lock
+            # end keep exception for the caller's thread
+
+        def reraise(error):
+            if error is not None:
+                raise error
+            # end handle error
+
+        try:
+            while True:
+                # HANDLE FINISHED CHECKS
+                ########################
+                # in order, fixing them while only thread-safe checks are running
+                while started:
+                    index = started[0]
+                    quality_check = checks[index]
+                    with condition:
+                        if index not in finished:
+                            break
+                        # end wait for checks in order
+                        error = finished.pop(index)
+                        if (auto_fix and error is None and quality_check.result() == quality_check.failure and
+                                quality_check.can_fix()):
+                            while any(concurrency != QualityCheck.thread_safe for concurrency in running.values()):
+                                condition.wait()
+                            # end wait for fix to be possible
+                        # end handle fixes
+                    # end with lock
+                    started.popleft()
+                    self._run_and_fix(quality_check, auto_fix, lambda: reraise(error))
+                    if self._delegate.post_run(quality_check) is self.stop_run:
+                        stopping = True
+                    # end handle stop run
+                # end while there are finished checks
+
+                # START CHECKS
+                ##############
+                while not stopping and next_index < len(checks):
+                    quality_check = checks[next_index]
+                    assert isinstance(quality_check, QualityCheck)
+                    with condition:
+                        if not can_start(quality_check.concurrency()):
+                            break
+                        # end start checks in order
+                    # end with lock
+                    index = next_index
+                    next_index += 1
+                    dres = self._delegate.pre_run(quality_check)
+                    if dres is self.skip_check:
+                        continue
+                    # end handle skip checks
+                    if dres is self.stop_run:
+                        stopping = True
+                        break
+                    # end handle stop run
+                    with condition:
+                        running[index] = quality_check.concurrency()
+                    # end with lock
+                    started.append(index)
+                    thread = Thread(target=worker, args=(index, quality_check))
+                    thread.daemon = True
+                    thread.start()
+                # end while there are checks to start
+
+                if not started and (stopping or next_index == len(checks)):
+                    break
+                # end handle done
+                with condition:
+                    if started and started[0] not in finished:
+                        condition.wait()
+                    # end wait for the next check in order
+                # end with lock
+            # end while there is work
+        finally:
+            # don't leave checks running, even if our delegate raised
+            with condition:
+                while running:
+                    condition.wait()
+                # end while checks are running
+            # end with lock
+        # end assure all checks are done
+
+    # -- End Utilities -- @}
+
+    def run_one(self, quality_check, auto_fix=False):
+        assert isinstance(quality_check, QualityCheck)
+        # PRE RUN
+        #########
+        dres = self._delegate.pre_run(quality_check)
+        if dres is self.skip_check:
+            return quality_check
+        # end handle skip checks
+        if dres is self.stop_run:
+            raise StopIteration()
+        # end handle stop iteration
+
+        # RUN
+        #######
+        self._run_and_fix(quality_check, auto_fix, quality_check.reset_result().run)
+
         # POST RUN
         ##########
         dres = self._delegate.post_run(quality_check)
@@ -324,6 +490,11 @@ class QualityCheckRunner(IQualityCheckRunner):
         return quality_check
 
     def run_all(self, auto_fix=False):
+        if self._max_workers > 1:
+            self._run_all_concurrently(auto_fix)
+            return self
+        # end handle concurrent runs
+
         for qci in self:
             try:
                 self.run_one(qci, auto_fix=auto_fix)
@@ -336,6 +507,10 @@ class QualityCheckRunner(IQualityCheckRunner):
     def delegate(self):
         return self._delegate
 
+    def max_workers(self):
+        """@return the maximum amount of checks we run concurrently"""
+        return self._max_workers
+
 # end class QualityCheckRunner
 
 # ==============================================================================
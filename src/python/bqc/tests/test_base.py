@@ -9,6 +9,9 @@
 from __future__ import unicode_literals
 __all__ = []
 
+import time
+import threading
+
 import bapp
 from butility.tests import TestCase
 from bqc import *
@@ -140,6 +143,65 @@ class QualityCheckRunnerDelegateMockup(QualityCheckRunnerDelegate, bapp.plugin_t
 
 # end class QualityCheckRunnerDelegateMockup
 
+
+class ConcurrentQualityCheckMockup(QualityCheckMockup):
+
+    """Records when it runs, and how many checks ran at the same time"""
+    __slots__ = ()
+
+    # list of ('start'|'end', check) tuples
+    events = list()
+    lock = threading.Lock()
+
+    def run(self):
+        with self.lock:
+            self.events.append(('start', self))
+        # end with lock
+        time.sleep(0.02)
+        with self.lock:
+            self.events.append(('end', self))
+        # end with lock
+        return super(ConcurrentQualityCheckMockup, self).run()
+
+# end class ConcurrentQualityCheckMockup
+
+
+class ReadOnlyQualityCheckMockup(ConcurrentQualityCheckMockup):
+    __slots__ = ()
+    _concurrency = QualityCheck.read_only
+
+
+class ThreadSafeQualityCheckMockup(ConcurrentQualityCheckMockup):
+    __slots__ = ()
+    _concurrency = QualityCheck.thread_safe
+
+
+class RecordingDelegate(QualityCheckRunnerDelegateMockup):
+
+    """Records the delegate calls it receives"""
+    __slots__ = ('calls', 'threads')
+
+    def __init__(self):
+        super(RecordingDelegate, self).__init__()
+        self.calls = list()
+        self.threads = set()
+
+    def pre_run(self, quality_check):
+        self.threads.add(threading.current_thread())
+        self.calls.append(('pre_run', quality_check))
+        return super(RecordingDelegate, self).pre_run(quality_check)
+
+    def post_run(self, quality_check):
+        self.threads.add(threading.current_thread())
+        self.calls.append(('post_run', quality_check))
+        return super(RecordingDelegate, self).post_run(quality_check)
+
+    def pre_fix(self, quality_check):
+        ConcurrentQualityCheckMockup.events.append(('fix', quality_check))
+        return super(RecordingDelegate, self).pre_fix(quality_check)
+
+# end class RecordingDelegate
+
 # -- End Testing Mockups -- @}
 
 
@@ -241,4 +303,69 @@ class TestQualityCheckFramework(TestCase):
         self.failUnless(dlg.output.getvalue())
         assert dlg.error.getvalue()
 
+    def test_concurrent_runner(self):
+        """Verify checks run concurrently as far as they allow it"""
+        events = ConcurrentQualityCheckMockup.events
+        ro, ro2, ts, ex, ro3 = [cls() for cls in (ReadOnlyQualityCheckMockup, ReadOnlyQualityCheckMockup,
+                                                  ThreadSafeQualityCheckMockup, ConcurrentQualityCheckMockup,
+                                                  ReadOnlyQualityCheckMockup)]
+        assert ex.concurrency() is QualityCheck.exclusive, "checks are exclusive by default"
+        assert ts.concurrency() is QualityCheck.thread_safe
+        dlg = RecordingDelegate()
+        qcr = QualityCheckRunner((ro, ro2, ts, ex, ro3), delegate=dlg, max_workers=4)
+        assert qcr.max_workers() == 4
+
+        assert qcr.run_all() is qcr
+        assert all(qc.result() is QualityCheck.failure for qc in qcr)
+        index = lambda event, qc: events.index((event, qc))
+        assert index('start', ro2) < index('end', ro) and index('start', ts) < index('end', ro), "ran concurrently"
+        assert index('start', ex) > max(index('end', qc) for qc in (ro, ro2, ts)), "exclusive checks run alone"
+        assert index('start', ro3) > index('end', ex)
+        assert [qc for call, qc in dlg.calls if call == 'post_run'] == list(qcr), "post_run is called in order"
+        assert [qc for call, qc in dlg.calls if call == 'pre_run'] == list(qcr), "pre_run is called in order"
+        assert dlg.threads == set([threading.current_thread()]), "delegates are called from our thread only"
+
+        # fixes happen while only thread-safe checks run
+        del events[:]
+        del dlg.calls[:]
+        ro.set_unfixed()
+        qcr.run_all(auto_fix=True)
+        assert ro.result() is QualityCheck.success and dlg.fix_attempted
+        assert index('fix', ro) > max(index('end', qc) for qc in (ro, ro2)), "fixes don't run alongside readers"
+
+        # skip and stop
+        del dlg.calls[:]
+        dlg.pre_run_result = qcr.skip_check
+        qcr.run_all()
+        assert not [call for call, qc in dlg.calls if call == 'post_run'], "skipped checks don't run"
+        dlg.pre_run_result = qcr.stop_run
+        del dlg.calls[:]
+        qcr.run_all()
+        assert dlg.calls == [('pre_run', ro)]
+        dlg.pre_run_result = None
+        dlg.post_run_result = qcr.stop_run
+        del dlg.calls[:]
+        qcr.run_all()
+        assert ('pre_run', ex) not in dlg.calls, "no check starts after a stop"
+        assert ([qc for call, qc in dlg.calls if call == 'post_run'] ==
+                [qc for call, qc in dlg.calls if call == 'pre_run']), "checks started before the stop are reported"
+        dlg.post_run_result = None
+
+        # errors are handled in our thread
+        dlg.reset()
+        ro2.set_raises(True)
+        qcr.run_all()
+        assert dlg.exception_encountered
+        ro2.set_raises(False)
+
+        # exceptions which aren't handled by the delegate are raised in our thread
+        class ExitingQualityCheck(ReadOnlyQualityCheckMockup):
+            __slots__ = ()
+
+            def run(self):
+                raise SystemExit(1)
+        # end class ExitingQualityCheck
+        qcr = QualityCheckRunner((ro, ExitingQualityCheck(), ro2), delegate=dlg, max_workers=4)
+        self.failUnlessRaises(SystemExit, qcr.run_all)
+
 # end class TestQualityCheck
@@ -14,3 +14,4 @@ from butility import Version
 __version__ = Version("0.1.0")
 
 from .base import *
+from .journal import *
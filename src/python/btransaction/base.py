@@ -12,8 +12,9 @@ order.
 """
 from __future__ import unicode_literals
 
-__all__ = ['Transaction', 'Operation', 'StoringProgressIndicator']
+__all__ = ['Transaction', 'Operation', 'StoringProgressIndicator', 'TransactionFuture', 'WaitTimeout']
 
+import os
 import weakref
 import logging
 import threading
@@ -24,6 +25,9 @@ from butility import (Path,
                       ProgressIndicator,
                       abstractmethod,
                       Error)
+from butility.compat import asyncio
+
+from .journal import Journal
 
 
 #{ Exceptions
@@ -37,6 +41,11 @@ class LockError(Error):
 
     """Indicate that a lock could not be obtained"""
 
+
+class WaitTimeout(Error):
+
+    """Indicate that a transaction was not done within the time we waited for it"""
+
 #} END exceptions
 
 
@@ -116,6 +125,16 @@ class Transaction(IOperation):
 
     A Transaction can be in dry-run mode, in which case no operation will really do anything.
     However, operations will simulate the operation as good as possible,  and fail if preconditions are not met.
+
+    If max_workers is larger than 1, operations which don't depend on each other are applied concurrently, see
+    Operation.resource_keys(). Operations are started in order, as soon as all operations they depend on are done.
+    While running concurrently, the progress() of the transaction counts the operations which are done, whereas
+    each operation reports to a progress of its own. If no operation could run alongside another one, they are
+    applied in order, without threads, and report to the progress() of the transaction as usual.
+
+    If a journal path is given, each operation records its state there before it is applied, see
+    Operation.journal_state(). Should the process die while applying, recover() uses the journal to undo what
+    was done. The journal is removed once apply() is done.
     """
     # NOTE: Can't really use slots as to not constrain subtypes too much.
     # Slots are good, but it's also too annoying to deal with this multi-inheritance issue that arises from them
@@ -128,7 +147,12 @@ class Transaction(IOperation):
                  "_progress",
                  "_dry_run"
                  "_lock",
-                 "_is_rolling_back")
+                 "_is_rolling_back",
+                 "_max_workers",
+                 "_local",
+                 "_journal_path",
+                 "_journal",
+                 "_committed")
 
     #{ Configruation
 
@@ -138,24 +162,39 @@ class Transaction(IOperation):
 
     # END configuration
 
-    def __init__(self, log=None, progress=None, dry_run=False):
+    def __init__(self, log=None, progress=None, dry_run=False, max_workers=1, journal=None):
+        """Initialize this instance
+        @param max_workers the maximum amount of operations to apply concurrently. If smaller than 2, all
+        operations are applied one after another, in order
+        @param journal if not None, path to a file to journal the operations to while applying them. It must
+        not exist"""
         self.log = log or logging.getLogger(self.name)
         self._progress_prototype = progress and progress or StoringProgressIndicator()
         self._exception = None
         self._dry_run = dry_run
         self._lock = threading.Lock()
+        self._max_workers = max_workers
+        self._local = threading.local()
+        self._journal_path = journal
+        self._journal = None
         self.clear()
 
     def _reset_state(self):
         self._performed_operation = False
+        self._committed = False
         self._is_rolling_back = False
         self._progress = None
         self._abort_transaction = False
 
-    def _perform_rollback(self, last_op_index):
+    def _perform_rollback(self, last_op_index, operations=None):
         """undo the previous operation, return self
         @param last_op_index index of the last operation which was fully or partly
-                performed. This will be the first operation to be undone"""
+                performed. This will be the first operation to be undone
+        @param operations if not None, a list of operations to undo in the given order, instead of the ones
+        up to last_op_index"""
+        if operations is None:
+            operations = [self._operations[op_index] for op_index in range(last_op_index, -1, -1)]
+        # end obtain operations
         # we never actually rollback in dry-run mode
         # we may fail if the rollback fails as well ... this would be calle bug then
         if not self._dry_run:
@@ -166,8 +205,7 @@ class Transaction(IOperation):
                 self._progress.begin()
                 self._is_rolling_back = True
                 try:
-                    for op_index in range(last_op_index, -1, -1):
-                        op = self._operations[op_index]
+                    for op in operations:
                         self.log.debug("%s->%s: %s commencing rollback ... ", self.name, op.name, op.description)
                         op.rollback()
                         self.log.debug("%s->%s: %s rollback done", self.name, op.name, op.description)
@@ -186,6 +224,125 @@ class Transaction(IOperation):
         self._reset_state()  # we are all good now
         return self
 
+    def _dependencies(self):
+        """@return a list with a set of indices of the operations each of our operations depends on"""
+        keys = list()
+        dependencies = list()
+        for op_index, op in enumerate(self._operations):
+            op_keys = op.resource_keys()
+            op_keys = op_keys is not None and frozenset(op_keys) or None
+            dependencies.append(set(index for index, other_keys in enumerate(keys)
+                                    if op_keys is None or other_keys is None or op_keys & other_keys))
+            keys.append(op_keys)
+        # end for each operation
+        return dependencies
+
+    def _concurrent_dependencies(self):
+        """@return the dependencies of our operations as returned by _dependencies(), or None if they should not
+        be applied concurrently. This is the case if we have a single worker, or if each operation depends on the
+        one before it, which makes it depend on all operations before it"""
+        if self._max_workers < 2 or len(self._operations) < 2:
+            return None
+        # end handle serial configuration
+        dependencies = self._dependencies()
+        if all(op_index - 1 in dependencies[op_index] for op_index in range(1, len(dependencies))):
+            return None
+        # end handle operations which can't run concurrently
+        return dependencies
+
+    def _apply_concurrently(self, dependencies):
+        """Apply all operations on up to max_workers threads, starting each one once all operations it depends
+        on are done. No operation is started once one failed, or if we should abort.
+        @param dependencies as returned by _concurrent_dependencies()
+        @return tuple(started_indices, failure), with the indices of all operations which were started, in order,
+        and a tuple(op_index, exception) of the first operation that failed, or None"""
+        pending = list(range(len(self._operations)))
+        started = list()
+        done = set()
+        failures = list()
+        condition = threading.Condition()
+        progress = self._progress
+        progress.set_range(0, len(pending))
+
+        def next_operation():
+            """@return index of the next operation to apply, or None if there is nothing left to do for us
+            @note to be called while condition is locked"""
+            while pending and not failures:
+                for op_index in pending:
+                    if dependencies[op_index] <= done:
+                        pending.remove(op_index)
+                        started.append(op_index)
+                        return op_index
+                    # end found ready operation
+                # end for each pending operation
+                condition.wait()
+            # end while there is work
+            return None
+
+        def worker():
+            self._local.progress = StoringProgressIndicator()
+            for listener in progress.listeners():
+                self._local.progress.add_listener(listener)
+            # end for each listener to inform about operation progress
+            while True:
+                with condition:
+                    op_index = next_operation()
+                # end with lock
+                if op_index is None:
+                    return
+                # end bail out
+
+                op = self._operations[op_index]
+                try:
+                    self._abort_point()
+                    self.log.debug("%s->%s: %s starting ... " % (self.name, op.name, op.description))
+                    self._journal_intent(op_index, op)
+                    op.apply()
+                    self._journal_done(op_index)
+                    self.log.debug("%s->%s: done" % (self.name, op.name))
+                    self._abort_point()
+                except BaseException as exc:
+                    # Record any failure, or other workers would wait for this operation forever
+                    self.log.debug("%s->%s: failed", self.name, op.name, exc_info=True)
+                    with condition:
+                        failures.append((op_index, exc))
+                        condition.notify_all()
+                    # end with lock
+                    return
+                # end handle failure
+                with condition:
+                    done.add(op_index)
+                    progress.set(len(done), message="%s: %s" % (op.name, op.description))
+                    condition.notify_all()
+                # end with lock
+            # end while there is work
+        # end worker
+
+        workers = list()
+        for _ in range(min(self._max_workers, len(pending))):
+            thread = threading.Thread(target=worker)
+            thread.daemon = True
+            thread.start()
+            workers.append(thread)
+        # end for each worker to start
+        for thread in workers:
+            thread.join()
+        # end for each worker to wait for
+        return started, failures and failures[0] or None
+
+    def _journal_intent(self, op_index, op):
+        """Durably record that the given operation is about to be applied, if we keep a journal"""
+        if self._journal is not None:
+            self._journal.record((Journal.INTENT, op_index, type(op), op.journal_state()))
+        # end handle journal
+
+    def _journal_done(self, op_index):
+        """Record that the operation at the given index was applied, if we keep a journal. The record is written
+        along with the next durable one, as losing it only means the operation is undone during recovery"""
+        if self._journal is not None:
+            self._journal.record((Journal.DONE, op_index), durable=False)
+        # end handle journal
+
     def __iter__(self):
         """@return an iterator on our operations. For inspection only !"""
         return iter(self._operations)
@@ -209,6 +366,12 @@ class Transaction(IOperation):
         """@return true if the operation should abort"""
         return self._abort_transaction
 
+    def _journal_update(self, operation):
+        """Called by Operations to durably record their changed state, if we keep a journal"""
+        if self._journal is not None:
+            self._journal.record((Journal.UPDATE, self._operations.index(operation), operation.journal_state()))
+        # end handle journal
+
     #} END operations interface
 
     #{ Interface
@@ -278,15 +441,19 @@ class Transaction(IOperation):
 
     def progress(self):
         """@return an ProgressIndicator instance that can be used to obtain progress information
-        or None if is_running() is False"""
+        or None if is_running() is False. Operations applied concurrently obtain a progress of their own"""
         if not self.is_running():
             return None
-        return self._progress
+        return getattr(self._local, 'progress', None) or self._progress
 
     def is_dry_run(self):
         """@return True if the transaction is in dry-run mode, and will thus not really do anything"""
         return self._dry_run
 
+    def max_workers(self):
+        """@return the maximum amount of operations we apply concurrently"""
+        return self._max_workers
+
     def clear(self):
         """Remove all operations and reset the state. This allows the instance to be reused
         @note may block if an apply operation is in progress"""
@@ -305,24 +472,58 @@ class Transaction(IOperation):
     def apply(self):
         """Apply all operations stored so far but roll them back if one fails
         This method is thread-safe."""
+        return self._apply()
+
+    def _apply(self, listener=None, future=None):
+        """Implements apply()
+        @param listener if not None, a progress listener to inform while we hold the lock, see apply_async()
+        @param future if not None, the TransactionFuture to mark finished before we release the lock"""
         self._lock.acquire()
         try:
+            if listener is not None:
+                self._progress_prototype.add_listener(listener)
+            # end handle listener
             if self._performed_operation:
                 return self
             # END prevent duplicate execution
+            rollback_operations = None
+            if self._journal_path is not None and not self._dry_run:
+                if os.path.exists(self._journal_path):
+                    raise EnvironmentError("Journal at %s exists - call recover() before applying again"
+                                           % self._journal_path)
+                # end refuse to overwrite journals
+                self._journal = Journal(self._journal_path)
+                self._journal.record((Journal.BEGIN, self.name, len(self._operations)), durable=False)
+            # end handle journal
             try:
                 self._exception = None
                 self._progress = self._progress_prototype
                 self._progress.begin()
                 try:
                     self.log.debug("'%s' transaction starting ..." % self.name)
-                    for op_index, op in enumerate(self._operations):
-                        self._abort_point()
-                        self.log.debug("%s->%s: %s starting ... " % (self.name, op.name, op.description))
-                        op.apply()
-                        self.log.debug("%s->%s: done" % (self.name, op.name))
-                        self._abort_point()
-                    # END for each op
+                    dependencies = self._concurrent_dependencies()
+                    if dependencies is not None:
+                        op = op_index = None
+                        rollback_operations = list()
+                        started, failure = self._apply_concurrently(dependencies)
+                        if failure is not None:
+                            op_index, exc = failure
+                            op = self._operations[op_index]
+                            # Operations depend on previous ones only, so reverse order is safe for rollback
+                            rollback_operations = [self._operations[index] for index in sorted(started, reverse=True)]
+                            raise exc
+                        # end handle failure
+                    else:
+                        for op_index, op in enumerate(self._operations):
+                            self._abort_point()
+                            self.log.debug("%s->%s: %s starting ... " % (self.name, op.name, op.description))
+                            self._journal_intent(op_index, op)
+                            op.apply()
+                            self._journal_done(op_index)
+                            self.log.debug("%s->%s: done" % (self.name, op.name))
+                            self._abort_point()
+                        # END for each op
+                    # end handle execution mode
                 finally:
                     self._progress.end()
                 # END assure to reset progress
@@ -337,22 +538,65 @@ class Transaction(IOperation):
                 else:
                     self.log.error("%s->%s: An unhandled exception occurred", self.name, op.name, exc_info=True)
                 # END handle logging
-                self._perform_rollback(op_index)
+                self._perform_rollback(op_index, rollback_operations)
+                self._close_journal()
 
                 # set us failed AFTER the rollback was performed
                 self._exception = e
                 return self
             # END handle errors
+            self._close_journal()
             self._performed_operation = True
         finally:
+            # if the journal is still open, the rollback failed, and recover() is needed
+            if self._journal is not None:
+                self._journal.flush().close()
+                self._journal = None
+            # end keep journal
+            if listener is not None:
+                self._progress_prototype.remove_listener(listener)
+            # end remove listener
+            if future is not None:
+                future._set_finished()
+            # end handle future
             self._lock.release()
         # END assure lock release
 
         return self
 
+    def _close_journal(self):
+        """Remove our journal, if there is one, as all operations are done or were undone"""
+        if self._journal is not None:
+            self._journal.close(remove=True)
+            self._journal = None
+        # end handle journal
+
+    def apply_async(self, listener=None):
+        """Apply all operations on a thread of its own, see apply().
+        @param listener if not None, a f(progress, message) function to be informed about all progress made
+        while applying, see ProgressIndicator.add_listener(). It is called from the thread applying operations,
+        and removed once we are done
+        @return a TransactionFuture to wait for the result or to cancel the transaction
+        @note to observe progress of all applications, add listeners to the progress this instance was
+        initialized with"""
+        future = TransactionFuture(self)
+
+        def run():
+            try:
+                self._apply(listener, future)
+            finally:
+                future._set_done()
+            # end assure future is done
+        # end run
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return future
+
     def rollback(self):
-        """The previous operation, will only do something if it was successful"""
-        if not self._performed_operation:
+        """The previous operation, will only do something if it was successful and wasn't committed"""
+        if not self._performed_operation or self._committed:
             return self
 
         self._lock.acquire()
@@ -363,8 +607,243 @@ class Transaction(IOperation):
 
         # END assure lock release
 
+    def commit(self):
+        """Make the changes of a successful apply() final, which allows operations to release whatever they kept
+        to be able to roll back, see Operation.commit(). From now on, rollback() does nothing.
+        Does nothing if apply() wasn't successful or if we were committed already
+        @return self"""
+        self._lock.acquire()
+        try:
+            if not self._performed_operation or self._committed:
+                return self
+            # end handle nothing to commit
+            for op in self._operations:
+                op.commit()
+            # end for each operation
+            self._committed = True
+        finally:
+            self._lock.release()
+        # END assure lock release
+        return self
+
+    def is_committed(self):
+        """@return True if commit() was called after a successful apply()"""
+        return self._committed
+
     #}END interface implementation
 
+    #{ Recovery
+
+    @classmethod
+    def recover(cls, journal_path, log=None):
+        """Recover the transaction which was applied with the given journal when its process died.
+        If all of its operations were applied, they are kept. Otherwise, all operations which were started are
+        restored from the journal and undone, in reverse order, see Operation.recover().
+        The journal is removed once the recovery succeeded.
+        @param journal_path path to a journal as written by a transaction initialized with it
+        @param log the logger to use, or None to use the default one
+        @return a transaction with all recovered operations
+        @throw Exception any exception raised by an operation while recovering. The journal is kept in that case,
+        allowing to try again"""
+        transaction = cls(log)
+        records = Journal.read(journal_path)
+        if not records:
+            os.remove(journal_path)
+            return transaction
+        # end handle empty journal
+        _, name, operation_count = records[0]
+
+        states = dict()
+        done = set()
+        for record in records[1:]:
+            if record[0] == Journal.INTENT:
+                states[record[1]] = (record[2], record[3])
+            elif record[0] == Journal.UPDATE:
+                states[record[1]] = (states[record[1]][0], record[2])
+            elif record[0] == Journal.DONE:
+                done.add(record[1])
+            # end handle record kind
+        # end for each record
+
+        if len(done) == operation_count:
+            transaction.log.info("%s: all %i operations of '%s' were applied - keeping them",
+                                 transaction.name, operation_count, name)
+            os.remove(journal_path)
+            return transaction
+        # end roll forward
+
+        operations = list()
+        for op_index in sorted(states):
+            op_type, state = states[op_index]
+            if state is None:
+                transaction.log.error("%s: operation %i of '%s' of type %s doesn't support recovery, and may have left "
+                                      "changes behind", transaction.name, op_index, name, op_type.__name__)
+                continue
+            # end handle operations without journal support
+            operations.append((op_index, op_type.from_journal(transaction, state)))
+        # end for each started operation
+
+        transaction._lock.acquire()
+        try:
+            transaction._progress = transaction._progress_prototype
+            transaction._progress.begin()
+            transaction._is_rolling_back = True
+            for op_index, op in reversed(operations):
+                transaction.log.info("%s->%s: recovering operation %i of '%s'", transaction.name, op.name, op_index, name)
+                op.recover(op_index in done)
+            # end for each operation
+        finally:
+            transaction._is_rolling_back = False
+            transaction._progress.end()
+            transaction._progress = None
+            transaction._lock.release()
+        # end assure lock is released
+        os.remove(journal_path)
+        return transaction
+
+    #} END recovery
+
+
+class TransactionFuture(object):
+
+    """A handle to a transaction applied asynchronously, as returned by Transaction.apply_async().
+
+    It allows to wait for the transaction to be done without polling it, to be called back once that is the case,
+    and to cancel it, which makes its operations abort at their next abort point.
+    Its interface resembles the one of concurrent.futures.Future, and it can be awaited in asyncio coroutines.
+    """
+    __slots__ = ('_transaction',
+                 '_done',
+                 '_finished',
+                 '_callbacks',
+                 '_lock')
+
+    def __init__(self, transaction):
+        """Initialize this instance with the transaction being applied"""
+        self._transaction = transaction
+        self._done = threading.Event()
+        self._finished = False
+        self._callbacks = list()
+        self._lock = threading.Lock()
+
+    def _set_finished(self):
+        """Called while the transaction is still locked once it is applied, to make cancel() a no-op from now on.
+        A cancellation which came too late to abort the transaction doesn't affect its next application."""
+        with self._lock:
+            self._finished = True
+            if self._transaction.is_aborting():
+                self._transaction.abort(False)
+            # end handle late cancellation
+        # end with lock
+
+    def _set_done(self):
+        """Mark us done and call all callbacks"""
+        with self._lock:
+            self._done.set()
+            callbacks, self._callbacks = self._callbacks, list()
+        # end with lock
+        for callback in callbacks:
+            self._call(callback)
+        # end for each callback
+
+    def _call(self, callback):
+        """Call the given callback, logging errors instead of raising them"""
+        try:
+            callback(self)
+        except Exception:
+            self._transaction.log.error("%s: done callback failed", self._transaction.name, exc_info=True)
+        # end handle errors
+
+    #{ Interface
+
+    def transaction(self):
+        """@return the transaction we represent"""
+        return self._transaction
+
+    def cancel(self):
+        """Ask the transaction to abort as soon as possible, which will roll it back.
+        @return True if the transaction may still be aborted, False if it is done already"""
+        with self._lock:
+            if self._finished:
+                return False
+            # end handle done transactions
+            self._transaction.abort(True)
+        # end with lock
+        return True
+
+    def cancelled(self):
+        """@return True if the transaction is done and was aborted"""
+        return self.done() and self._transaction.aborted()
+
+    def running(self):
+        """@return True if the transaction is not yet done"""
+        return not self.done()
+
+    def done(self):
+        """@return True if the transaction was applied, successfully or not"""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """Block until the transaction is done, or until the timeout expired
+        @param timeout seconds to wait at most, or None to wait as long as it takes
+        @return True if the transaction is done"""
+        self._done.wait(timeout)
+        return self.done()
+
+    def result(self, timeout=None):
+        """@return our transaction once it is done. Use its succeeded() method to learn if it was successful
+        @param timeout see wait()
+        @throw WaitTimeout if the transaction wasn't done in time"""
+        if not self.wait(timeout):
+            raise WaitTimeout("Transaction '%s' wasn't done within %ss" % (self._transaction.name, timeout))
+        # end handle timeout
+        return self._transaction
+
+    def exception(self, timeout=None):
+        """@return the exception which made the transaction fail, or None if it succeeded
+        @param timeout see wait()
+        @throw WaitTimeout if the transaction wasn't done in time"""
+        return self.result(timeout).exception()
+
+    def add_done_callback(self, callback):
+        """Call the given callback once the transaction is done, or right away if it is done already
+        @param callback f(future) called with this instance, usually from the thread which applied the transaction
+        @return self"""
+        with self._lock:
+            if not self._done.is_set():
+                self._callbacks.append(callback)
+                return self
+            # end handle pending transactions
+        # end with lock
+        self._call(callback)
+        return self
+
+    def asyncio_future(self, loop=None):
+        """@return an asyncio.Future which is resolved with our transaction once it is done
+        @param loop the event loop to use, or None to use the current one
+        @throw EnvironmentError if asyncio is not available"""
+        if asyncio is None:
+            raise EnvironmentError("asyncio is not available in this version of python")
+        # end handle python 2
+        loop = loop or asyncio.get_event_loop()
+        future = loop.create_future()
+
+        def resolve():
+            if not future.done():
+                future.set_result(self._transaction)
+            # end handle cancelled futures
+        # end resolve
+
+        self.add_done_callback(lambda _: loop.call_soon_threadsafe(resolve))
+        return future
+
+    def __await__(self):
+        return self.asyncio_future().__await__()
+
+    #} END interface
+
+# end class TransactionFuture
+
 
 class Operation(IOperation):
 
@@ -400,6 +879,16 @@ class Operation(IOperation):
     # A description of the operation
     description = "performs something"
 
+    # Keys of the resources this operation uses, like paths it reads or writes. Operations whose keys don't
+    # intersect don't depend on each other, and may be applied concurrently.
+    # If None, the operation depends on all previous ones, and all following ones depend on it
+    resources = None
+
+    # Names of the attributes which allow to undo the operation, even if the process died while applying it.
+    # They are recorded in the journal of the transaction, see journal_state().
+    # If None, the operation can't be recovered
+    journal_attributes = None
+
     #} END configuration
 
     def __init__(self, transaction, log=None):
@@ -427,4 +916,52 @@ class Operation(IOperation):
     def _dry_run(self):
         return self._transaction().is_dry_run()
 
+    def _update_journal(self):
+        """Durably record our current journal_state() in the journal of our transaction, if it keeps one.
+        Call it during apply() before doing something that can only be undone with the changed state"""
+        self._transaction()._journal_update(self)
+
     #}END subclass interface
+
+    #{ Interface
+
+    def resource_keys(self):
+        """@return an iterable of hashable keys of the resources we use, or None if we depend on all operations
+        that come before us. See the resources configuration variable
+        @note the base implementation returns our resources"""
+        return self.resources
+
+    def journal_state(self):
+        """@return a picklable dict of attribute names and values which allow to undo this operation, or None if
+        it can't be recovered. It is called right before apply() and whenever _update_journal() is called,
+        and must describe whatever apply() may do until the next call.
+        @note the base implementation returns the values of our journal_attributes"""
+        if self.journal_attributes is None:
+            return None
+        # end handle unsupported operations
+        return dict((name, getattr(self, name)) for name in self.journal_attributes)
+
+    @classmethod
+    def from_journal(cls, transaction, state):
+        """@return a new instance of our type, as part of the given transaction, whose state is restored from
+        the given journal_state(). Our __init__() is not called"""
+        op = cls.__new__(cls)
+        Operation.__init__(op, transaction)
+        for name, value in state.items():
+            setattr(op, name, value)
+        # end for each attribute
+        return op
+
+    def commit(self):
+        """Called once the transaction was committed after all operations were applied, which means we will not be
+        rolled back anymore. Use it to release whatever was kept to be able to roll back.
+        @note the base implementation does nothing"""
+
+    def recover(self, applied):
+        """Undo what this operation did, after it was restored from a journal with from_journal().
+        @param applied if True, apply() finished. Otherwise the process died while applying us, and we may
+        have done only parts of it
+        @note the base implementation calls rollback()"""
+        self.rollback()
+
+    #}END interface
@@ -0,0 +1,145 @@
+#-*-coding:utf-8-*-
+"""
+@package btransaction.journal
+@brief A write-ahead journal allowing to recover transactions after the process applying them died
+
+@author Sebastian Thiel
+@copyright [GNU Lesser General Public License](https://www.gnu.org/licenses/lgpl.html)
+"""
+from __future__ import unicode_literals
+__all__ = ['Journal']
+
+import os
+import struct
+import zlib
+import threading
+
+from butility.compat import pickle
+
+
+class Journal(object):
+
+    """An append-only file of records, each of which is a picklable tuple whose first item is its kind.
+
+    Records are written in order. Durable records are written and synced to disk right away, along with all
+    records written before them, whereas all others are kept in memory until the next durable record is written.
+    This allows to record many things with few syncs, as long as it is fine to lose the latest non-durable records
+    when the process dies.
+
+    A record which was only partially written, as the process died while writing it, is ignored when reading
+    the journal.
+    """
+    __slots__ = ('_path',
+                 '_fp',
+                 '_pending',
+                 '_lock')
+
+    # -------------------------
+    # @name Constants
+    # @{
+
+    # The record starting the journal of a transaction: (BEGIN, transaction_name, operation_count)
+    BEGIN = 'begin'
+    # The intent to apply an operation: (INTENT, op_index, op_type, state)
+    INTENT = 'intent'
+    # The changed state of an operation which is being applied: (UPDATE, op_index, state)
+    UPDATE = 'update'
+    # An operation was applied: (DONE, op_index)
+    DONE = 'done'
+
+    # size and checksum of each record
+    _header = struct.Struct(b'>II')
+
+    # -- End Constants -- @}
+
+    def __init__(self, path):
+        """Initialize this instance to append to the journal at the given path, which is created if it doesn't exist.
+        @param path path to the journal file. Its directory must exist"""
+        self._path = path
+        self._fp = open(path, 'ab')
+        self._pending = list()
+        self._lock = threading.Lock()
+
+    # -------------------------
+    # @name Interface
+    # @{
+
+    def path(self):
+        """@return path to our journal file"""
+        return self._path
+
+    def record(self, record, durable=True):
+        """Append the given record
+        @param record a picklable tuple, see our constants
+        @param durable if True, the record and all previous ones are on disk when this method returns. Otherwise,
+        the record will be written along with the next durable one
+        @return self"""
+        data = pickle.dumps(record, 2)
+        with self._lock:
+            self._pending.append(self._header.pack(len(data), zlib.crc32(data) & 0xffffffff))
+            self._pending.append(data)
+            if durable:
+                self._sync()
+            # end handle durable records
+        # end with lock
+        return self
+
+    def flush(self):
+        """Write all records to disk
+        @return self"""
+        with self._lock:
+            self._sync()
+        # end with lock
+        return self
+
+    def close(self, remove=False):
+        """Close the journal file, without writing pending records
+        @param remove if True, the journal file will be deleted as it isn't needed anymore"""
+        self._fp.close()
+        if remove:
+            os.remove(self._path)
+        # end handle removal
+
+    @classmethod
+    def read(cls, path):
+        """@return a list of all records in the journal at the given path, in order. A partially written record
+        at the end of the journal is ignored
+        @throw ValueError if a record in the middle of the journal is corrupt"""
+        with open(path, 'rb') as fp:
+            data = fp.read()
+        # end assure file is closed
+
+        records = list()
+        offset = 0
+        while offset < len(data):
+            end = offset + cls._header.size
+            if end > len(data):
+                break
+            # end handle partial header
+            size, checksum = cls._header.unpack(data[offset:end])
+            record = data[end:end + size]
+            if len(record) < size or zlib.crc32(record) & 0xffffffff != checksum:
+                if end + size < len(data):
+                    raise ValueError("Journal at %s has a corrupt record at offset %i" % (path, offset))
+                # end handle corruption
+                break
+            # end handle partial record
+            records.append(pickle.loads(record))
+            offset = end + size
+        # end while there are records
+        return records
+
+    # -- End Interface -- @}
+
+    def _sync(self):
+        """Write all pending records and sync them to disk
+        @note to be called while locked"""
+        if not self._pending:
+            return
+        # end handle nothing to do
+        self._fp.write(b''.join(self._pending))
+        del self._pending[:]
+        self._fp.flush()
+        os.fsync(self._fp.fileno())
+
+# end class Journal
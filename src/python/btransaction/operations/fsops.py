@@ -8,11 +8,185 @@
 """
 from __future__ import unicode_literals
 from __future__ import division
-__all__ = ['DeleteOperation', 'CreateFSItemOperation', 'MoveFSItemOperation', ]
+__all__ = ['DeleteOperation', 'CreateFSItemOperation', 'MoveFSItemOperation', 'TrashReaper', 'trash_reaper']
 
 from ..base import Operation
-from butility import Path
+from butility import (Path,
+                      Thread)
 import os
+import time
+import uuid
+import logging
+import threading
+
+
+class TrashReaper(object):
+
+    """Deletes files and directory trees on a background thread, without removing more than a given amount of
+    items per second. This keeps reclaiming large trees from starving other users of the filesystem.
+
+    The thread is started when there is something to delete, and stops once everything is deleted.
+    As it is a daemon thread, items which are not yet deleted when the process ends are left behind. Items which
+    were marked as reapable, like those of committed DeleteOperations, are picked up by reap_directory() later.
+    """
+    __slots__ = ('log',
+                 '_max_removals_per_second',
+                 '_pending',
+                 '_condition',
+                 '_thread',
+                 '_directories')
+
+    # -------------------------
+    # @name Configuration
+    # @{
+
+    # Suffix of items in a trash directory which can be deleted, as nobody is going to restore them
+    reapable_suffix = '.reap'
+
+    # -- End Configuration -- @}
+
+    def __init__(self, max_removals_per_second=1000, log=None):
+        """Initialize this instance
+        @param max_removals_per_second the maximum amount of files and directories to remove per second, or 0 to
+        remove them as fast as possible
+        @param log the logger to use, or None to use the default one"""
+        self.log = log or logging.getLogger('btransaction.operations.fsops.TrashReaper')
+        self._max_removals_per_second = max_removals_per_second
+        self._pending = list()
+        self._condition = threading.Condition()
+        self._thread = None
+        self._directories = set()
+
+    def _run(self):
+        """Delete pending items until there are none left"""
+        while True:
+            with self._condition:
+                if not self._pending:
+                    self._thread = None
+                    self._condition.notify_all()
+                    return
+                # end stop once there is nothing to do
+                path = self._pending[0]
+            # end with lock
+            try:
+                self._delete(path)
+            except OSError:
+                self.log.error("Failed to reclaim %s", path, exc_info=True)
+            # end handle errors
+            with self._condition:
+                self._pending.pop(0)
+            # end with lock
+        # end while there is work
+
+    def _delete(self, path):
+        """Delete the given file or directory tree, deepest items first, at no more than the configured rate"""
+        self.log.info("Reclaiming %s", path)
+        start = time.time()
+        removals = 0
+        if os.path.isdir(path) and not os.path.islink(path):
+            items = list()
+            for root, dirs, files in os.walk(path, topdown=False):
+                items.extend((os.path.join(root, name), False) for name in files)
+                items.extend((os.path.join(root, name), not os.path.islink(os.path.join(root, name))) for name in dirs)
+            # end for each directory
+            items.append((path, True))
+        else:
+            items = [(path, False)]
+        # end handle item type
+
+        for item, is_directory in items:
+            if is_directory:
+                os.rmdir(item)
+            else:
+                os.remove(item)
+            # end handle item type
+            removals += 1
+            if self._max_removals_per_second > 0:
+                delay = removals / self._max_removals_per_second - (time.time() - start)
+                if delay > 0:
+                    time.sleep(delay)
+                # end throttle
+            # end handle rate limit
+        # end for each item to remove
+
+    # -------------------------
+    # @name Interface
+    # @{
+
+    def reap(self, path):
+        """Delete the given file or directory tree in the background
+        @return self"""
+        with self._condition:
+            self._pending.append(path)
+            if self._thread is None:
+                self._thread = Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+            # end start thread on demand
+        # end with lock
+        return self
+
+    def reap_directory(self, directory, once=False):
+        """Delete all items in the given trash directory which are marked as reapable, as they were left behind
+        by a process which ended before it could delete them.
+        @param directory the trash directory to clean up. It is fine if it doesn't exist
+        @param once if True, the directory is only handled if we didn't do so before
+        @return a list of paths of all items which are going to be deleted"""
+        directory = os.path.abspath(directory)
+        with self._condition:
+            if once and directory in self._directories:
+                return list()
+            # end handle known directories
+            self._directories.add(directory)
+            pending = set(self._pending)
+        # end with lock
+        try:
+            names = os.listdir(directory)
+        except OSError:
+            return list()
+        # end handle missing directories
+        paths = [os.path.join(directory, name) for name in sorted(names) if name.endswith(self.reapable_suffix)]
+        paths = [path for path in paths if path not in pending]
+        for path in paths:
+            self.reap(path)
+        # end for each path to reap
+        return paths
+
+    def pending(self):
+        """@return a list of all paths which are not yet deleted, the one being deleted right now first"""
+        with self._condition:
+            return list(self._pending)
+        # end with lock
+
+    def wait(self, timeout=None):
+        """Block until all pending items were deleted
+        @param timeout seconds to wait at most, or None to wait as long as it takes
+        @return True if there is nothing left to delete"""
+        deadline = None
+        if timeout is not None:
+            deadline = time.time() + timeout
+        # end handle timeout
+        with self._condition:
+            while self._thread is not None:
+                remaining = None
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    # end handle timeout
+                # end handle deadline
+                self._condition.wait(remaining)
+            # end while there is work
+            return not self._pending
+        # end with lock
+
+    # -- End Interface -- @}
+
+# end class TrashReaper
+
+
+# The reaper to delete trashed items with, unless a DeleteOperation is configured to use another one
+trash_reaper = TrashReaper()
 
 
 class FSOperationBase(Operation):
@@ -66,6 +240,7 @@ class CreateFSItemOperation(FSOperationBase):
     __slots__ = ("_path", "_content", "_mode", "_uid", "_gid")
 
     name = "CreateFSItem"
+    journal_attributes = ("_path", "_content", "_mode", "_uid", "_gid")
 
     def __init__(self, transaction, path, initial_file_content=None, mode=None, uid=None, gid=None):
         """Initialize the operation with a path to create. If initial_file_content is set, 
@@ -111,6 +286,12 @@ class CreateFSItemOperation(FSOperationBase):
 
         self.set_user_group(self._path, self._gid, self._uid)
 
+    def journal_state(self):
+        state = super(CreateFSItemOperation, self).journal_state()
+        # if the item doesn't exist yet, it's ours once it does
+        state['_operation_performed'] = self._operation_performed or not self._path.exists()
+        return state
+
     def rollback(self):
         try:
             if not self._operation_performed or not self._path.exists():
@@ -133,6 +314,7 @@ class MoveFSItemOperation(FSOperationBase):
     __slots__ = ("_source_path", "_destination_path", "_actual_destination_path")
 
     name = "FSItemMove"
+    journal_attributes = ("_source_path", "_destination_path", "_actual_destination_path")
 
     def __init__(self, transaction, source_path, destination_path):
         super(MoveFSItemOperation, self).__init__(transaction)
@@ -172,6 +354,12 @@ class MoveFSItemOperation(FSOperationBase):
             self._reset_state()
         # END assure state reset
 
+    def journal_state(self):
+        state = super(MoveFSItemOperation, self).journal_state()
+        # we refuse to move onto existing items, so an existing destination was moved by us
+        state['_operation_performed'] = self._operation_performed or not self._actual_destination_path.exists()
+        return state
+
     #{ Interface
 
     def actual_destination(self):
@@ -184,20 +372,44 @@ class MoveFSItemOperation(FSOperationBase):
 class DeleteOperation(Operation):
 
     """Delete a file or a directory. Please note that, for obvious reasons, failures
-    cannot be undone. This operation will stop at the first encountered error"""
+    cannot be undone. This operation will stop at the first encountered error
+
+    If a trash directory is given, the item is renamed into it instead, which takes no time and can be rolled back.
+    Once the transaction is committed, the item is marked as reapable and deleted in the background by our reaper.
+    Reapable items which were left behind by other processes are deleted once we first use their trash directory.
+    @note callers must call Transaction.commit() after a successful apply(), or trashed items are never deleted"""
 
-    __slots__ = "_path"     # the path to delete
+    __slots__ = ("_path",               # the path to delete
+                 "_trash_path")         # the path to move it to in the trash directory, or None
     name = "DeleteOperation"
+    journal_attributes = ("_path", "_trash_path")
 
-    def __init__(self, transaction, path):
+    # The TrashReaper to delete trashed items with. If None, the module's trash_reaper is used
+    reaper = None
+
+    def __init__(self, transaction, path, trash_directory=None):
+        """Initialize the operation with the path to delete
+        @param trash_directory if not None, path to a directory on the same filesystem as path to move the item to.
+        It will be created if it doesn't exist"""
         super(DeleteOperation, self).__init__(transaction)
         self._path = Path(path)
+        self._trash_path = None
+        if trash_directory is not None:
+            self._trash_path = Path(trash_directory) / ('%s-%s' % (uuid.uuid4().hex, self._path.normpath().basename()))
+        # end handle trash
 
     def apply(self):
         if self._dry_run():
             return
 
-        if self._path.isdir():
+        if self._trash_path is not None:
+            if not self._trash_path.dirname().isdir():
+                self._trash_path.dirname().makedirs()
+            # end handle missing trash directory
+            self._reaper().reap_directory(self._trash_path.dirname(), once=True)
+            self.log.info("Moving %s to trash at %s", self._path, self._trash_path)
+            os.rename(self._path, self._trash_path)
+        elif self._path.isdir():
             self.log.info("Deleting directory %s", self._path)
             self._path.rmtree()
         else:
@@ -206,4 +418,32 @@ class DeleteOperation(Operation):
         # END perform actual removal
 
     def rollback(self):
-        self.log.info("Deletion of filesystem items cannot be rolled back")
+        if self._trash_path is None:
+            self.log.info("Deletion of filesystem items cannot be rolled back")
+            return
+        # end handle deletion
+        if os.path.lexists(self._trash_path) and not os.path.lexists(self._path):
+            self.log.info("Restoring %s from trash at %s", self._path, self._trash_path)
+            os.rename(self._trash_path, self._path)
+        # end handle trashed item
+
+    def _reaper(self):
+        """@return the TrashReaper to use"""
+        return self.reaper or trash_reaper
+
+    def commit(self):
+        if self._trash_path is not None and os.path.lexists(self._trash_path):
+            # mark it, so it's deleted by whoever uses the trash next, should we not be done before the process ends
+            reapable_path = self._trash_path + self._reaper().reapable_suffix
+            os.rename(self._trash_path, reapable_path)
+            self._reaper().reap(reapable_path)
+        # end handle trashed item
+
+    def recover(self, applied):
+        """Restore the trashed item, or complete an interrupted deletion, as it can't be undone"""
+        if self._trash_path is not None:
+            self.rollback()
+        elif not applied and os.path.lexists(self._path):
+            self.log.info("Completing interrupted deletion of %s", self._path)
+            self.apply()
+        # end handle partial deletion
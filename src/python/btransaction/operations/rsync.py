@@ -48,7 +48,8 @@ class RsyncOperation(Operation):
                  "_process",
                  "_destination_existed",
                  "_actual_destination_existed",
-                 "_max_bandwidth_kb"
+                 "_max_bandwidth_kb",
+                 "_removing_source"
                  )
 
     # -------------------------
@@ -73,6 +74,10 @@ class RsyncOperation(Operation):
     rsync_path = "/usr/bin/rsync"
     rm_path = "/bin/rm"
 
+    journal_attributes = ("_source_path", "_destination_path", "_actual_destination_path", "_move_mode",
+                          "_destination_existed", "_actual_destination_existed", "_max_bandwidth_kb",
+                          "_removing_source")
+
     # -- End Configuration -- @}
 
     def __init__(self, transaction, source, destination, move=False, max_bandwidth_kb=0):
@@ -104,6 +109,7 @@ class RsyncOperation(Operation):
         self._actual_destination_existed = self._actual_destination_path.exists()
         self._move_mode = move
         self._max_bandwidth_kb = max_bandwidth_kb
+        self._removing_source = False
 
         self._current_path = None
         self._total_num_files_transferred = 0
@@ -379,6 +385,9 @@ class RsyncOperation(Operation):
             handle_process()
 
             if self._move_mode and not self._dry_run():
+                # from now on, only the destination is complete, which rollback must know
+                self._removing_source = True
+                self._update_journal()
                 self._force_removal(self._source_path)
             # END handle movemode
 
@@ -399,7 +408,7 @@ class RsyncOperation(Operation):
             return
 
         # have to reproduce source from destination ?
-        if not self._source_path.exists():
+        if self._removing_source or not self._source_path.exists():
             if self._destination_existed:
                 self.log.warn("Destination at %s existed - rollback might copy more data than expected" %
                               self._destination_path)
@@ -414,6 +423,7 @@ class RsyncOperation(Operation):
                 raise IOError(
                     "Expected copy operation to succeed - rollback failed, destination data exists at %s" % self._destination_path)
             # END apply sub-transaction
+            t.commit()
         # END source doesn't exist
 
         # finally remove destination if possible
@@ -426,6 +436,7 @@ class RsyncOperation(Operation):
             # END sanity check
             self._force_removal(destination)
         # END for each pair of possible paths
+        self._removing_source = False
 
     # -- End Interface Implementation -- @}
 
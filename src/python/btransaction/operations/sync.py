@@ -0,0 +1,430 @@
+#-*-coding:utf-8-*-
+"""
+@package btransaction.operations.sync
+@brief An operation to copy or move data in-process, without the help of external programs
+
+@author Sebastian Thiel
+@copyright [GNU Lesser General Public License](https://www.gnu.org/licenses/lgpl.html)
+"""
+from __future__ import unicode_literals
+from __future__ import division
+from butility.future import str
+__all__ = ['SyncOperation']
+
+import os
+import stat
+import time
+import threading
+
+from ..base import Operation
+
+from butility import (Path,
+                      parallel_map,
+                      copy_file)
+
+
+# ==============================================================================
+# @name Utilities
+# ------------------------------------------------------------------------------
+# @{
+
+def _scandir(directory):
+    """@return a sorted list of (name, lstat) tuples for all entries in the given directory.
+    Uses os.scandir() if available, as it needs less system calls on most platforms"""
+    scandir = getattr(os, 'scandir', None)
+    if scandir is None:
+        return [(name, os.lstat(os.path.join(directory, name))) for name in sorted(os.listdir(directory))]
+    # end handle old python versions
+    entries = list(scandir(directory))
+    entries.sort(key=lambda entry: entry.name)
+    return [(entry.name, entry.stat(follow_symlinks=False)) for entry in entries]
+
+# -- End Utilities -- @}
+
+
+class SyncOperation(Operation):
+
+    """An operation which copies a source file or directory to a destination file or directory, similar to
+    what `rsync -a` would do, and the RsyncOperation implements.
+
+    The source is walked once to determine the files that need to be transferred - those whose destination is
+    missing or differs in size or modification time. After verifying there is enough free space at the
+    destination, files are copied concurrently, with progress being reported in bytes.
+    All files and directories to be written are recorded before writing them, which allows rollback to remove
+    them, and to restore the source in move mode. Files which existed at the destination before are left alone.
+    The records are part of the transaction's journal, so the operation can be recovered if the process dies.
+
+    Like rsync, a source directory is copied into the destination directory, unless its path ends with a slash,
+    in which case only its contents are copied.
+    """
+
+    __slots__ = ("_source_path",
+                 "_destination_path",
+                 "_actual_destination_path",
+                 "_move_mode",
+                 "_max_bandwidth_kb",
+                 "_max_workers",
+                 # list of (destination, existed) tuples of all files we write, existed being True if we
+                 # overwrite a file
+                 "_written_files",
+                 # list of paths to all directories we create, parents first
+                 "_created_directories",
+                 # list of (source, destination) tuples of all source files we remove in move mode
+                 "_removed_files",
+                 # list of source directories we remove in move mode, deepest first
+                 "_removed_directories",
+                 "_total_num_files",
+                 "_num_files_transferred",
+                 "_total_bytes",
+                 "_transferred_bytes",
+                 "_start_time",
+                 "_progress_indicator",
+                 "_lock")
+
+    # -------------------------
+    # @name Configuration
+    # @{
+
+    name = "sync"
+    description = "Synchronize directory structures or copy files"
+
+    # The amount of bytes to copy at once. It will be smaller when the bandwidth is limited
+    chunk_size = 1024 * 1024
+
+    journal_attributes = ("_source_path", "_destination_path", "_actual_destination_path", "_written_files",
+                          "_created_directories", "_removed_files", "_removed_directories")
+
+    # -- End Configuration -- @}
+
+    def __init__(self, transaction, source, destination, move=False, max_bandwidth_kb=0, max_workers=4):
+        """Initialize the operation with a source and destination path.
+        @param move if True, the source will be deleted after all files were copied successfully
+        @param max_bandwidth_kb if greater 0, all files together are copied with no more than the given bandwidth
+        in kilobytes per second
+        @param max_workers the maximum amount of files to copy concurrently"""
+        super(SyncOperation, self).__init__(transaction)
+
+        self._source_path = Path(source).expandvars()
+        self._destination_path = self._actual_destination_path = Path(destination).expandvars()
+
+        source_is_contents = self._source_path.endswith('/') or self._source_path.endswith(os.sep)
+        if ((self._source_path.isdir() and not source_is_contents) or
+                (self._source_path.isfile() and self._destination_path.isdir())):
+            self._actual_destination_path = self._destination_path / self._source_path.normpath().basename()
+        # end handle destination
+        self._move_mode = move
+        self._max_bandwidth_kb = max_bandwidth_kb
+        self._max_workers = max_workers
+        self._lock = threading.Lock()
+
+        self._written_files = list()
+        self._created_directories = list()
+        self._removed_files = list()
+        self._removed_directories = list()
+        self._progress_indicator = None
+        self._reset_current_state()
+
+    def _reset_current_state(self):
+        """Reset the values that will be counted during the following invocation"""
+        self._total_num_files = 0
+        self._num_files_transferred = 0
+        self._total_bytes = 0
+        self._transferred_bytes = 0
+        self._start_time = 0
+
+    # -------------------------
+    # @name Utilities
+    # @{
+
+    @classmethod
+    def _needs_transfer(cls, source_stat, destination):
+        """@return True if the destination file is missing, or if its size or modification time differ from the
+        one of the source"""
+        try:
+            destination_stat = os.lstat(destination)
+        except OSError:
+            return True
+        # end handle missing destination
+        return (not stat.S_ISREG(destination_stat.st_mode) or
+                source_stat.st_size != destination_stat.st_size or
+                int(source_stat.st_mtime) != int(destination_stat.st_mtime))
+
+    def _transfer_set(self):
+        """Walk the source once and determine what needs to be done
+        @return tuple(directories, files, links, unchanged) of
+        - directories: a list of (source, destination) tuples of directories, parents first
+        - files: a list of (source, destination, size) tuples of files to copy
+        - links: a list of (source, destination) tuples of symbolic links to copy
+        - unchanged: a list of (source, destination) tuples of files which are up-to-date
+        @throw OSError if the source doesn't exist"""
+        directories, files, links, unchanged = list(), list(), list(), list()
+        source = self._source_path.normpath().abspath()
+        destination = self._actual_destination_path.normpath().abspath()
+
+        source_stat = os.lstat(source)
+        if stat.S_ISLNK(source_stat.st_mode) and os.path.isdir(source):
+            source_stat = os.stat(source)
+        # end follow links to the source directory
+        if not stat.S_ISDIR(source_stat.st_mode):
+            source_stat = os.stat(source)
+            if self._needs_transfer(source_stat, destination):
+                files.append((source, destination, source_stat.st_size))
+            else:
+                unchanged.append((source, destination))
+            # end handle file
+            return [(None, destination.dirname())], files, links, unchanged
+        # end handle single file
+
+        stack = [(source, destination)]
+        while stack:
+            source, destination = stack.pop()
+            directories.append((source, destination))
+            subdirectories = list()
+            for name, entry_stat in _scandir(source):
+                source_entry, destination_entry = source / name, destination / name
+                if stat.S_ISDIR(entry_stat.st_mode):
+                    subdirectories.append((source_entry, destination_entry))
+                elif stat.S_ISLNK(entry_stat.st_mode):
+                    links.append((source_entry, destination_entry))
+                elif stat.S_ISREG(entry_stat.st_mode):
+                    if self._needs_transfer(entry_stat, destination_entry):
+                        files.append((source_entry, destination_entry, entry_stat.st_size))
+                    else:
+                        unchanged.append((source_entry, destination_entry))
+                    # end handle file
+                else:
+                    self.log.warn("Skipping special file at %s", source_entry)
+                # end handle entry type
+            # end for each entry
+            stack.extend(reversed(subdirectories))
+        # end while there are directories to walk
+        return directories, files, links, unchanged
+
+    def _check_free_space(self):
+        """@throw OSError if there is not enough free space at the destination to hold our total amount of bytes.
+        @note files to be overwritten are counted as well, which is what rsync does too"""
+        item = self._actual_destination_path
+        while not item.exists():
+            parent = item.dirname()
+            if parent == item or not parent:
+                return
+            # end give up if we reached the root
+            item = parent
+        # end find the first existing path
+
+        fs_info = os.statvfs(item)
+        free_bytes_at_destination = fs_info.f_bsize * fs_info.f_bavail
+        if self._total_bytes >= free_bytes_at_destination:
+            msg = "Insufficient disk space available at %s to copy %s - require %iMB, have %iMB" % (
+                item, self._source_path, self._total_bytes / 1024 ** 2, free_bytes_at_destination / 1024 ** 2)
+            raise OSError(msg)
+        # end check free space
+
+    @classmethod
+    def _missing_directories(cls, directories):
+        """@return a list of all given directories and their parents which don't exist, parents first"""
+        missing = list()
+        seen = set()
+        for directory in directories:
+            chain = list()
+            while directory not in seen and not directory.isdir():
+                seen.add(directory)
+                chain.append(directory)
+                directory = directory.dirname()
+            # end while directory is missing
+            missing.extend(reversed(chain))
+        # end for each directory
+        return missing
+
+    @classmethod
+    def _link_needs_update(cls, source, destination):
+        """@return True if the symbolic link at destination doesn't point to what the source points to
+        @throw OSError if something else than a link is in the way"""
+        if os.path.islink(destination):
+            return os.readlink(destination) != os.readlink(source)
+        elif os.path.lexists(destination):
+            raise OSError("Cannot create symbolic link at %s as a different item is in the way" % destination)
+        # end handle existing destination
+        return True
+
+    def _copy_link(self, item):
+        """Create the symbolic link at destination to point to what the source points to.
+        Links are not tracked by our progress, which is in bytes"""
+        source, destination = item
+        if os.path.lexists(destination):
+            os.remove(destination)
+        # end remove outdated link
+        os.symlink(os.readlink(source), destination)
+
+    def _on_bytes_copied(self, count):
+        """Called by each worker after it copied the given amount of bytes. Updates our progress and
+        limits the bandwidth if required"""
+        self._abort_point()
+        with self._lock:
+            self._transferred_bytes += count
+            transferred_bytes = self._transferred_bytes
+            elapsed = max(0.001, time.time() - self._start_time)
+            self._progress_indicator.set(transferred_bytes, message=self._progress_message(elapsed))
+        # end with lock
+
+        if self._max_bandwidth_kb > 0:
+            delay = transferred_bytes / (self._max_bandwidth_kb * 1024) - elapsed
+            if delay > 0:
+                time.sleep(delay)
+            # end wait until we are within our bandwidth
+        # end handle bandwidth limit
+
+    def _progress_message(self, elapsed):
+        """@return a message informing about our current progress"""
+        bytes_per_second = self._transferred_bytes / elapsed
+        time_left_s = (self._total_bytes - self._transferred_bytes) / max(1, bytes_per_second)
+        return "Transferring %s at %.2fMB/s - %i files left, done in about %i seconds" % (
+            self._source_path, bytes_per_second / 1024 ** 2,
+            self._total_num_files - self._num_files_transferred, int(time_left_s))
+
+    def _copy_file(self, item):
+        """Copy the (source, destination, size) tuple"""
+        source, destination, _ = item
+        self._abort_point()
+        copy_file(source, destination, self._copy_chunk_size(), callback=self._on_bytes_copied)
+        with self._lock:
+            self._num_files_transferred += 1
+        # end with lock
+
+    def _copy_chunk_size(self):
+        """@return amount of bytes to copy at once, which is small enough to be able to limit the bandwidth"""
+        if self._max_bandwidth_kb > 0:
+            return max(4096, min(self.chunk_size, int(self._max_bandwidth_kb * 1024 / 10)))
+        # end handle bandwidth limit
+        return self.chunk_size
+
+    def _remove_sources(self, directories, files):
+        """Remove all given source files, and all source directories if they are empty then, deepest first"""
+        self._removed_files.extend(files)
+        self._removed_directories.extend(source for source, _ in reversed(directories) if source is not None)
+        self._update_journal()
+
+        for source, _ in files:
+            self._abort_point()
+            os.remove(source)
+        # end for each file
+        for source in self._removed_directories:
+            try:
+                source.rmdir()
+            except OSError:
+                self.log.warn("Couldn't remove source directory at %s as it is not empty", source)
+            # end handle non-empty directories
+        # end for each directory
+
+    # -- End Utilities -- @}
+
+    # -------------------------
+    # @name Interface Implementation
+    # @{
+
+    def resource_keys(self):
+        """@return our source and destination, which we read and write"""
+        return [self._source_path.normpath().abspath(), self._destination_path.normpath().abspath()]
+
+    def apply(self):
+        self._reset_current_state()
+        self._progress_indicator = self._progress()
+
+        self.log.info("Calculating cost of operation ... ")
+        directories, files, links, unchanged = self._transfer_set()
+        self._total_num_files = len(files)
+        self._total_bytes = sum(size for _, _, size in files)
+
+        if files:
+            self._check_free_space()
+        else:
+            self.log.info("Wouldn't copy any file - skipping transfer")
+        # end check free space
+
+        self.log.info("Copying %i files with %iMB from %s to %s", self._total_num_files,
+                      self._total_bytes / 1024 ** 2, self._source_path, self._actual_destination_path)
+        if self._dry_run():
+            return
+        # end handle dry-run
+
+        # record everything we are about to write at once, before writing it
+        links = [link for link in links if self._link_needs_update(*link)]
+        self._created_directories.extend(self._missing_directories(directory for _, directory in directories))
+        self._written_files.extend((destination, os.path.lexists(destination))
+                                   for destination in [link[1] for link in links] + [item[1] for item in files])
+        self._update_journal()
+
+        self._progress_indicator.setup(range=(0, max(1, self._total_bytes)), relative=True)
+        for directory in self._created_directories:
+            directory.mkdir()
+        # end for each directory
+        for link in links:
+            self._copy_link(link)
+        # end for each link
+
+        self._start_time = time.time()
+        parallel_map(self._copy_file, files, max_workers=self._max_workers)
+
+        if self._move_mode:
+            self._remove_sources(directories,
+                                 [(source, destination) for source, destination, _ in files] + links + unchanged)
+        # end handle move mode
+
+    def rollback(self):
+        # restore all sources we removed, before the destination goes away.
+        # Our records may contain items we didn't get to, or which were restored before
+        for directory in reversed(self._removed_directories):
+            if not directory.isdir():
+                directory.mkdir()
+            # end handle existing directory
+        # end for each directory to restore
+        for source, destination in reversed(self._removed_files):
+            if os.path.lexists(source) or not os.path.lexists(destination):
+                continue
+            # end skip files which weren't removed
+            if os.path.islink(destination):
+                os.symlink(os.readlink(destination), source)
+            else:
+                copy_file(destination, source, self.chunk_size)
+            # end handle links
+        # end for each removed file
+        del self._removed_files[:]
+        del self._removed_directories[:]
+
+        for destination, existed in reversed(self._written_files):
+            if existed:
+                self.log.warn("Refusing deletion of %s during rollback as it existed before the operation", destination)
+                continue
+            # end sanity check
+            if os.path.lexists(destination):
+                self.log.info("Removing previously copied destination file: %s", destination)
+                os.remove(destination)
+            # end handle destination
+        # end for each written file
+        del self._written_files[:]
+
+        for directory in reversed(self._created_directories):
+            if not directory.isdir():
+                continue
+            # end skip directories we didn't get to create
+            try:
+                directory.rmdir()
+            except OSError:
+                self.log.warn("Couldn't remove directory at %s during rollback as it is not empty", directory)
+            # end handle non-empty directories
+        # end for each created directory
+        del self._created_directories[:]
+
+    # -- End Interface Implementation -- @}
+
+    # -------------------------
+    # @name Interface
+    # @{
+
+    def actual_destination(self):
+        """@return the destination that will actually receive the copy"""
+        return self._actual_destination_path
+
+    # -- End Interface -- @}
+
+# end class SyncOperation
@@ -27,9 +27,12 @@ from butility import (ConcurrentRun,
                       Path)
 
 from btransaction import (Transaction,
+                          Operation,
+                          Journal,
                           StoringProgressIndicator)
 
 from btransaction.operations.rsync import *
+from btransaction.operations.sync import *
 from btransaction.operations.fsops import *
 
 log = logging.getLogger('btransaction.tests.test_operations')
@@ -51,6 +54,28 @@ class TestCreateFSItemOperation(CreateFSItemOperation):
 # end class TestCreateFSItemOperation
 
 
+class ProcessDied(BaseException):
+
+    """Simulates the death of the process, which transactions can't handle"""
+# end class ProcessDied
+
+
+class DieOperation(Operation):
+
+    """Dies when applied"""
+    __slots__ = ()
+
+    name = "Die"
+    journal_attributes = ()
+
+    def apply(self):
+        raise ProcessDied()
+
+    def rollback(self):
+        pass
+# end class DieOperation
+
+
 class TestOperations(TestCase):
 
     def _assert_rsync_state(self, ro):
@@ -111,6 +136,66 @@ class TestOperations(TestCase):
             assert not t.succeeded()
         # END for each target style - one exists, the other doesn't
 
+    @with_rw_directory
+    def test_sync(self, rw_dir):
+        source = (rw_dir / "source").mkdir()
+        (source / "sub").mkdir()
+        sizes = {"file": 100, "big": 5000, "sub/nested": 10}
+        for name, size in sizes.items():
+            with open(source / name, 'wb') as fp:
+                fp.write(b"x" * size)
+            # end write file
+        # end for each file
+        os.symlink("file", source / "link")
+        destination = rw_dir / "destination"
+
+        for dry_run in reversed(list(range(2))):
+            p = StoringProgressIndicator()
+            t = Transaction(log, dry_run=dry_run, progress=p)
+            so = SyncOperation(t, source, destination)
+            assert so.actual_destination() == destination / "source", "directories go into the destination"
+            assert t.apply().succeeded()
+            assert so._total_num_files == 3 and so._total_bytes == sum(sizes.values())
+            assert so.actual_destination().isdir() != dry_run
+        # end for each dry run mode
+        assert p.value() == so._total_bytes, "progress is reported in bytes"
+        assert os.readlink(so.actual_destination() / "link") == "file"
+        for name, size in sizes.items():
+            assert (so.actual_destination() / name).stat().st_size == size
+        # end for each file
+
+        # Only changed files are transferred, and rollback leaves files alone which existed before
+        with open(source / "file", 'wb') as fp:
+            fp.write(b"y" * 50)
+        # end change file
+        (source / "new").touch()
+        t = Transaction(log)
+        so = SyncOperation(t, source + "/", destination / "source", max_bandwidth_kb=1000, max_workers=1)
+        assert so.actual_destination() == destination / "source", "trailing slashes copy the contents"
+        assert t.apply().succeeded()
+        assert so._total_num_files == 2 and so._total_bytes == 50
+        assert (destination / "source" / "file").stat().st_size == 50
+        assert not t.rollback().succeeded()
+        assert (destination / "source" / "file").isfile() and not (destination / "source" / "new").exists()
+
+        # Move mode removes the source, and rollback brings it back
+        destination = rw_dir / "moved"
+        t = Transaction(log)
+        so = SyncOperation(t, source, destination, move=True)
+        assert t.apply().succeeded()
+        assert not source.exists() and (destination / "source" / "sub" / "nested").isfile()
+        assert not t.rollback().succeeded()
+        assert not destination.exists()
+        assert (source / "sub" / "nested").stat().st_size == sizes["sub/nested"]
+        assert os.readlink(source / "link") == "file"
+
+        # Aborting removes everything we copied so far
+        t = Transaction(log)
+        so = SyncOperation(t, source, destination)
+        t.abort(True)
+        assert not t.apply().succeeded()
+        assert not destination.exists()
+
     @with_rw_directory
     def test_delete_op(self, rw_dir):
         # CHANGE OWNERSHIP
@@ -129,6 +214,54 @@ class TestOperations(TestCase):
             # end for each item to delete
         # END for each dryrun mode
 
+    @with_rw_directory
+    def test_trash_delete_op(self, rw_dir):
+        trash = rw_dir / "trash"
+        tree = (rw_dir / "tree").mkdir()
+        for index in range(10):
+            ((tree / ("dir%i" % index)).mkdir() / "file").touch()
+        # end for each directory
+        os.symlink(tree / "dir0", tree / "link")
+
+        t = Transaction(log)
+        op = DeleteOperation(t, tree, trash_directory=trash)
+        op.reaper = TrashReaper(max_removals_per_second=100)
+        assert t.apply().succeeded()
+        assert not tree.exists() and len(trash.listdir()) == 1, "deletion is a rename into the trash"
+        assert not t.rollback().succeeded()
+        assert (tree / "dir9" / "file").isfile() and not trash.listdir(), "rollback restores the item"
+
+        assert t.apply().succeeded()
+        st = time.time()
+        assert t.commit().is_committed()
+        assert op.reaper.pending() and not op.reaper.wait(0.01), "reclamation happens in the background"
+        assert op.reaper.wait(5) and not op.reaper.pending()
+        assert time.time() - st > 0.2, "removals are throttled"
+        assert not trash.listdir() and not tree.exists()
+        assert t.rollback().is_committed() and t.succeeded(), "committed transactions can't be rolled back"
+
+        # the reaper deals with files and dangling links as well
+        reaper = TrashReaper(max_removals_per_second=0)
+        os.symlink("doesnt_exist", rw_dir / "dangling")
+        reaper.reap(rw_dir / "dangling").reap((rw_dir / "file").touch())
+        assert reaper.wait(5)
+        assert not os.path.lexists(rw_dir / "dangling") and not (rw_dir / "file").exists()
+
+        # items left behind by a committed transaction are reaped once the trash is used again
+        ((trash / ("left" + TrashReaper.reapable_suffix)).mkdir() / "file").touch()
+        (trash / "uncommitted").touch()
+
+        reaper = TrashReaper(max_removals_per_second=0)
+        t = Transaction(log)
+        op = DeleteOperation(t, (rw_dir / "other").touch(), trash_directory=trash)
+        op.reaper = reaper
+        assert t.apply().succeeded()
+        assert reaper.wait(5)
+        assert set(trash.listdir()) == set((trash / "uncommitted", op._trash_path)), "only reapable items are deleted"
+        assert reaper.reap_directory(trash, once=True) == [], "directories are swept only once"
+        assert t.commit().is_committed() and reaper.wait(5)
+        assert trash.listdir() == [trash / "uncommitted"], "uncommitted items can still be restored"
+
     @with_rw_directory
     def test_move_fs_op(self, base_dir):
         for dry_run in range(2):
@@ -197,3 +330,55 @@ class TestOperations(TestCase):
                 # END for each mode
             # END for each content mode
         # END for each dryrun mode
+
+    @with_rw_directory
+    def test_journal(self, base_dir):
+        journal = base_dir / "journal"
+        source = (base_dir / "source").mkdir()
+        (source / "file").write_bytes(b"content")
+        (base_dir / "to_move").touch()
+        to_delete = (base_dir / "to_delete").touch()
+        existing = (base_dir / "existing").mkdir()
+
+        t = Transaction(log, journal=journal)
+        TestCreateFSItemOperation(t, base_dir / "created")
+        TestCreateFSItemOperation(t, existing)
+        MoveFSItemOperation(t, base_dir / "to_move", base_dir / "moved")
+        SyncOperation(t, source, base_dir / "synced", move=True)
+        DeleteOperation(t, to_delete)
+        assert t.apply().succeeded()
+        assert not journal.exists(), "journal is removed once the transaction is done"
+        assert t.rollback() and (base_dir / "to_move").isfile() and (source / "file").isfile()
+
+        to_delete.touch()
+        DieOperation(t)
+        self.failUnlessRaises(ProcessDied, t.apply)
+        assert journal.isfile(), "journal is kept if the process dies"
+        assert not source.exists() and (base_dir / "synced" / "source" / "file").isfile()
+        self.failUnlessRaises(EnvironmentError, t.apply)
+
+        records = Journal.read(journal)
+        assert records[0] == (Journal.BEGIN, t.name, 6)
+        assert [r[1] for r in records if r[0] == Journal.DONE] == list(range(5))
+        with open(journal, 'ab') as fp:
+            fp.write(b"partially written record")
+        # end simulate partial write
+        assert Journal.read(journal) == records, "partially written records are ignored"
+
+        rt = Transaction.recover(journal)
+        assert len(list(rt)) == 6
+        assert not journal.exists()
+        assert not (base_dir / "created").exists() and existing.isdir(), "only items we created are removed"
+        assert (base_dir / "to_move").isfile() and not (base_dir / "moved").exists()
+        assert (source / "file").bytes() == b"content" and not (base_dir / "synced").exists()
+        assert not to_delete.exists(), "deletions can't be undone"
+
+        # a transaction whose operations were all applied is kept
+        t = Transaction(log, journal=journal)
+        TestCreateFSItemOperation(t, base_dir / "created")
+        Journal(journal).record((Journal.BEGIN, t.name, 1), durable=False) \
+                        .record((Journal.INTENT, 0, TestCreateFSItemOperation, t._operations[0].journal_state())) \
+                        .record((Journal.DONE, 0)).close()
+        (base_dir / "created").mkdir()
+        assert not list(Transaction.recover(journal))
+        assert (base_dir / "created").isdir() and not journal.exists()
@@ -77,6 +77,47 @@ class LongRunningOp(TestOp):
             self._value -= 1
         # END rollback explicitly
 
+class ResourceOp(SuccessOp):
+    name = "ResourceOp"
+    description = "Op using resources, recording the order of operations"
+
+    def __init__(self, transaction, resources, record, fail=False):
+        super(ResourceOp, self).__init__(transaction)
+        self.resources = resources
+        self._record = record
+        self._fail = fail
+
+    def apply(self):
+        self._record.append(('progress', self._progress()))
+        self._record.append(('start', self))
+        time.sleep(0.01)
+        self._value += 2
+        self._record.append(('end', self))
+        if self._fail:
+            raise Exception("Failed on operation")
+        # end handle failure
+
+    def rollback(self):
+        self._record.append(('rollback', self))
+        super(ResourceOp, self).rollback()
+
+
+class ExitOp(ResourceOp):
+    name = "ExitOp"
+    description = "Op exiting the program"
+
+    def apply(self):
+        raise SystemExit(3)
+
+
+class ProgressOp(SuccessOp):
+    name = "ProgressOp"
+    description = "Op that reports progress"
+
+    def apply(self):
+        self._progress().set(1, message="working")
+        super(ProgressOp, self).apply()
+
 #}END utilities
 
 
@@ -150,3 +191,115 @@ class TestTransaction(TestCase):
         assert lo._value == 0, "Rollback should have occurred"
         assert not t.succeeded(), "op shold not have been successful after abort"
         assert not t.is_rolling_back(), "Shouldn't be rolling back once we are done with it"
+
+    def test_concurrent(self):
+        record = list()
+        progress = StoringProgressIndicator()
+        t = Transaction(log, progress=progress, max_workers=4)
+        assert t.max_workers() == 4
+        a = ResourceOp(t, ['a'], record)
+        b = ResourceOp(t, ['b'], record)
+        ab = ResourceOp(t, ['a', 'b'], record)
+        c = ResourceOp(t, ['c'], record)
+
+        assert t.apply().succeeded()
+        assert all(op._value == 2 for op in (a, b, ab, c))
+        index = lambda event, op: record.index((event, op))
+        assert index('start', b) < index('end', a), 'independent operations run concurrently'
+        assert index('start', c) < index('end', a)
+        assert index('start', ab) > max(index('end', a), index('end', b)), 'dependencies are respected'
+        assert progress.value() == 4 and progress.range() == (0, 4), 'progress counts done operations'
+        assert all(op_progress is not progress for event, op_progress in record if event == 'progress'), \
+            "concurrent ops have their own progress"
+
+        del record[:]
+        t.rollback()
+        assert [event for event, op in record] == ['rollback'] * 4
+        assert [op for event, op in record] == [c, ab, b, a], 'rollback happens in reverse order'
+
+        # Operations without resources depend on everything
+        t = Transaction(log, max_workers=4)
+        del record[:]
+        a = ResourceOp(t, ['a'], record)
+        barrier = ResourceOp(t, None, record)
+        b = ResourceOp(t, ['b'], record)
+        assert t.apply().succeeded()
+        assert [event for event, op in record] == ['progress', 'start', 'end'] * 3
+        assert all(op_progress is t._progress_prototype for event, op_progress in record if event == 'progress'), \
+            "operations which can't run concurrently are applied in place, and report to our progress"
+
+        # Only started operations are rolled back after failures
+        t = Transaction(log, max_workers=2)
+        del record[:]
+        a = ResourceOp(t, ['a'], record, fail=True)
+        a2 = ResourceOp(t, ['a'], record)
+        b = ResourceOp(t, ['b'], record)
+        assert not t.apply().succeeded()
+        assert str(t.exception()) == "Failed on operation"
+        assert a2._value == 0 and ('start', a2) not in record, 'dependents of failed operations are not started'
+        assert a._value == 0 and b._value == 0, 'started operations are rolled back'
+        assert not t.is_running() and t.progress() is None
+
+        # Any failure stops the other workers
+        t = Transaction(log, max_workers=2)
+        ExitOp(t, ['a'], record)
+        ResourceOp(t, ['a'], record)
+        ResourceOp(t, ['b'], record)
+        self.failUnlessRaises(SystemExit, t.apply)
+        assert not t.is_running()
+
+    def test_apply_async(self):
+        t = Transaction(log)
+        op = ProgressOp(t)
+        events = list()
+        future = t.apply_async(listener=lambda progress, message: events.append(message))
+        assert future.result(timeout=5) is t and t.succeeded() and future.exception() is None
+        assert future.done() and not future.running() and not future.cancelled()
+        assert events == ["working"], "progress is pushed to listeners"
+        assert not t._progress_prototype.listeners(), "listener is removed once done"
+        assert not future.cancel(), "done transactions can't be cancelled"
+
+        called = list()
+        assert future.add_done_callback(called.append) is future
+        assert called == [future], "callbacks are called right away if done"
+
+        # operations applied concurrently report to listeners as well
+        progress = StoringProgressIndicator()
+        progress.add_listener(lambda progress, message: events.append(message))
+        t = Transaction(log, progress=progress, max_workers=2)
+        ProgressOp(t).resources = ['a']
+        ProgressOp(t).resources = ['b']
+        del events[:]
+        assert t.apply_async().result(timeout=5).succeeded()
+        assert events.count("working") == 2
+
+        # cancellation aborts at the next abort point, and rolls back
+        t = Transaction(log)
+        op = LongRunningOp(t)
+        future = t.apply_async()
+        future.add_done_callback(called.append)
+        self.assertRaises(WaitTimeout, future.result, 0.01)
+        assert future.cancel()
+        assert future.wait(5) and future.cancelled()
+        assert t.aborted() and op._value == 0
+        assert called[-1] is future
+
+        # listeners only receive events of the application they were passed to
+        t = Transaction(log)
+        op = LongRunningOp(t)
+        first = t.apply_async()
+        while not t.is_running():
+            time.sleep(0.001)
+        # end wait for first application
+        second = t.apply_async(listener=lambda progress, message: events.append(message))
+        time.sleep(0.01)
+        assert not t._progress_prototype.listeners(), "listeners are added once the transaction is locked"
+        assert first.cancel() and first.wait(5)
+        assert second.cancel() and second.wait(5) and second.cancelled()
+        assert not t._progress_prototype.listeners()
+
+        # cancelling too late doesn't abort the next application
+        future = TransactionFuture(t)
+        t.abort(True)
+        future._set_finished()
+        assert not t.is_aborting() and not future.cancel() and not t.is_aborting()
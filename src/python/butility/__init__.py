@@ -15,5 +15,6 @@ from .base import *
 from .path import *
 from .system import *
 from .types import *
+from .timing import *
 
 __version__ = Version('0.1.0')
@@ -10,13 +10,14 @@ from __future__ import unicode_literals
 from __future__ import division
 
 from butility.future import (with_metaclass,
+                             string_types,
                              PY2)
 __all__ = ['Error', 'Interface', 'Meta', 'abstractmethod',
            'NonInstantiatable', 'is_mutable', 'smart_deepcopy', 'wraps', 'GraphIterator',
            'Singleton', 'LazyMixin', 'capitalize', 'equals_eps', 'tagged_file_paths', 'TRACE',
            'set_log_level', 'partial', 'parse_key_value_string', 'parse_string_value', 'size_to_int',
            'frequncy_to_seconds', 'int_to_size_string', 'load_package', 'load_files', 'load_file',
-           'ProxyMeta']
+           'find_loadable_files', 'ProxyMeta', 'BYTECODE_CACHE_DIR_ENVIRONMENT_VARIABLE']
 
 from functools import (wraps,
                        partial)
@@ -24,6 +25,10 @@ import logging
 import os
 import sys
 import imp
+import time
+import marshal
+import hashlib
+import threading
 
 from abc import (abstractmethod,
                  ABCMeta)
@@ -34,6 +39,8 @@ from collections import deque
 from inspect import isroutine
 
 from .path import Path
+from .system import parallel_map
+from .timing import startup_timing
 
 log = logging.getLogger('butility.base')
 
@@ -48,6 +55,13 @@ container_types = (list, set, tuple)
 # The TRACE log level, between DEBUG and INFO
 TRACE = int((logging.INFO + logging.DEBUG) / 2)
 
+# If set, the environment variable is expected to point to a writable directory to keep compiled plugin code in.
+# If unset, plugin code is compiled from source each time it is loaded
+BYTECODE_CACHE_DIR_ENVIRONMENT_VARIABLE = 'BUTILITY_BYTECODE_CACHE_DIR'
+
+# The default amount of threads to use when reading and compiling plugin files concurrently
+LOAD_FILES_MAX_WORKERS = 8
+
 # -- End Constants -- @}
 
 
@@ -251,60 +265,177 @@ def load_package(package_directory, module_name):
     return sys.modules[module_name]
 
 
-def _load_files(path, files, on_error):
-    """load all python \a files from \a path
-    @return list of loaded files as full paths"""
-    res = list()
-
+def _plugin_files(path, files):
+    """@return list of full paths to all python files in \a files which may be loaded as plugins, sorted by name
+    to obtain a deterministic loading order"""
     def py_filter(f):
         return f.endswith('.py') and not \
             f.startswith('__')
     # end filter
+    return [os.sep.join([path, filename]) for filename in sorted(filter(py_filter, files))]
+
+
+def _bytecode_cache_dir():
+    """@return directory into which compiled plugin code may be written, or None if there is no such directory"""
+    cache_dir = os.environ.get(BYTECODE_CACHE_DIR_ENVIRONMENT_VARIABLE)
+    if not cache_dir:
+        return None
+    # end handle unset
+    if not os.path.isdir(cache_dir):
+        try:
+            os.makedirs(cache_dir)
+        except OSError:
+            log.warn("Bytecode cache directory at '%s' could not be created - plugins will be compiled", cache_dir)
+            return None
+        # end ignore failures, we can work without cache
+    # end create cache dir
+    return cache_dir
+
+
+def _read_code(python_file, cache_dir):
+    """Read the source of the given python file and obtain its code object, either from the bytecode cache
+    or by compiling it. Designed to be called concurrently
+    @param python_file path to the file to read
+    @param cache_dir directory with cached code objects, or None
+    @return tuple(code, exception, elapsed_seconds), where either code or exception is None"""
+    st = time.time()
+    try:
+        with open(python_file, 'rb') as fp:
+            source = fp.read()
+        # end assure file is closed
+
+        cache_file = None
+        if cache_dir:
+            # The path is part of the key as code objects know their filename, which is used in tracebacks
+            key = hashlib.sha1(imp.get_magic() + source + ('%s' % python_file).encode('utf-8'))
+            cache_file = os.path.join(cache_dir, key.hexdigest() + '.pyc')
+            try:
+                with open(cache_file, 'rb') as fp:
+                    return marshal.load(fp), None, time.time() - st
+                # end assure file is closed
+            except (IOError, OSError, EOFError, ValueError, TypeError):
+                pass
+            # end ignore cache misses and invalid cache files
+        # end handle cache
 
-    for filename in filter(py_filter, files):
-        py_file = os.sep.join([path, filename])
+        code = compile(source, str(python_file), 'exec', 0, True)
+        if cache_file:
+            tmp_file = '%s.%i.%s.tmp' % (cache_file, os.getpid(), threading.current_thread().ident)
+            try:
+                with open(tmp_file, 'wb') as fp:
+                    marshal.dump(code, fp)
+                # end assure file is closed
+                os.rename(tmp_file, cache_file)
+            except (IOError, OSError):
+                log.debug("Could not write bytecode cache file at '%s'", cache_file, exc_info=True)
+            # end ignore write errors
+        # end write cache
+        return code, None, time.time() - st
+    except Exception as exc:
+        return None, exc, time.time() - st
+    # end handle exceptions
+
+
+def _exec_code(code, python_file, module_name):
+    """Execute the given code object in a module of the given name, which will be reused if it already exists
+    @return the module"""
+    module = sys.modules.get(module_name)
+    is_new = module is None
+    if is_new:
+        module = imp.new_module(PY2 and module_name.encode('utf-8') or module_name)
+        sys.modules[module_name] = module
+    # end create module
+    module.__file__ = str(python_file)
+    try:
+        exec(code, module.__dict__)
+    except Exception:
+        if is_new:
+            del sys.modules[module_name]
+        # end don't leave half-initialized modules behind
+        raise
+    # end handle exceptions
+    return module
+
+
+def _load_files(py_files, on_error, max_workers):
+    """load all given python files, in order
+    @return list of loaded files as full paths"""
+    res = list()
+    cache_dir = _bytecode_cache_dir()
+    # Read and compile concurrently, as it's mostly IO bound
+    codes = parallel_map(lambda f: _read_code(f, cache_dir), py_files, max_workers=max_workers)
+
+    # Execute serially, in order, as modules will register plugins, whose order matters
+    for py_file, (code, exc, read_elapsed) in zip(py_files, codes):
         (mod_name, _) = os.path.splitext(os.path.basename(py_file))
+        st = time.time()
         try:
-            load_file(py_file, mod_name)
+            if exc is not None:
+                raise exc
+            # end re-raise read or compile error
+            _exec_code(code, py_file, mod_name)
         except Exception:
             log.error("Failed to load %s from %s", mod_name, py_file, exc_info=True)
             on_error(py_file, mod_name)
         else:
-            log.info("loaded %s into module %s", py_file, mod_name)
+            log.info("loaded %s into module %s in %.2fms (read and compile: %.2fms)",
+                     py_file, mod_name, (read_elapsed + time.time() - st) * 1000.0, read_elapsed * 1000.0)
             res.append(py_file)
         # end handle result
     # end for eahc file to load
+    startup_timing.count('plugin files loaded', len(res))
     return res
 
 
-def load_files(path, recurse=False, on_error=lambda f, m: None):
-    """Load all .py files found in the given directory, or load the file it points to
-    @param path either path to directory, or path to py file.
-    @param recurse if True, path will be searched for usable files recursively
-    @param on_error f(py_file, module_name) => None to perform an action when importing a module 
-    fails. It may raise to abort the entire operation. Note that an exception is set when called.
-    @return a list of files loaded successfully"""
+def find_loadable_files(path, recurse=False):
+    """@return a list of all python files which would be loaded by load_files() for the given path, in order
+    @param path either path to directory, or path to py file, or an iterable of such paths.
+    @param recurse if True, path will be searched for usable files recursively"""
+    if isinstance(path, string_types):
+        paths = [path]
+    else:
+        paths = path
+    # end handle multiple paths
+
     # if we should recurse, we just use the standard dirwalk.
     # we use topdown so top directories should be loaded before their
     # subdirectories and we follow symlinks, since it seems likely that's
     # what people will expect
-    res = list()
-    path = Path(path)
-    if path.isfile():
-        res += _load_files(path.dirname(), [path.basename()], on_error)
-    else:
-        seen = None
-        for seen, (path, dirs, files) in enumerate(os.walk(path, topdown=True, followlinks=True)):
-            res += _load_files(path, files, on_error)
-            if not recurse:
-                break
-            # end handle recursion
-        # end for each directory to walk
-        if seen is None:
-            log.log(logging.TRACE, "Didn't find any plugin files at '%s'", path)
-        # end
-    # end handle file or directory
-    return res
+    py_files = list()
+    for path in paths:
+        path = Path(path)
+        if path.isfile():
+            py_files += _plugin_files(path.dirname(), [path.basename()])
+        else:
+            seen = None
+            for seen, (path, dirs, files) in enumerate(os.walk(path, topdown=True, followlinks=True)):
+                dirs.sort()
+                py_files += _plugin_files(path, files)
+                if not recurse:
+                    break
+                # end handle recursion
+            # end for each directory to walk
+            if seen is None:
+                log.log(logging.TRACE, "Didn't find any plugin files at '%s'", path)
+            # end
+        # end handle file or directory
+    # end for each path
+    return py_files
+
+
+def load_files(path, recurse=False, on_error=lambda f, m: None, max_workers=LOAD_FILES_MAX_WORKERS):
+    """Load all .py files found in the given directory, or load the file it points to
+    @param path either path to directory, or path to py file, or an iterable of such paths. All files
+    will be gathered first, which allows them to be read and compiled concurrently. Execution happens 
+    in order of the given paths, and in order of the file names within each directory.
+    @param recurse if True, path will be searched for usable files recursively
+    @param on_error f(py_file, module_name) => None to perform an action when importing a module 
+    fails. It may raise to abort the entire operation. Note that an exception is set when called.
+    @param max_workers the maximum amount of threads to use to read and compile files
+    @return a list of files loaded successfully
+    @note if the BUTILITY_BYTECODE_CACHE_DIR environment variable points to a writable directory, compiled 
+    code is kept there and reused as long as the file's source doesn't change"""
+    return _load_files(find_loadable_files(path, recurse), on_error, max_workers)
 
 
 def load_file(python_file, module_name):
@@ -312,8 +443,13 @@ def load_file(python_file, module_name):
     If the module is already loaded, it will be reloaded
     @return the loaded module object
     @throws Exception any exception raised when trying to load the module"""
-    imp.load_source(module_name, str(python_file))
-    return sys.modules[module_name]
+    code, exc, _ = _read_code(python_file, _bytecode_cache_dir())
+    if exc is not None:
+        raise exc
+    # end re-raise read or compile errors
+    module = _exec_code(code, python_file, module_name)
+    startup_timing.count('plugin files loaded')
+    return module
 
 # -- End Filesystem Utilities -- @}
 
@@ -27,10 +27,13 @@ if sys.version_info[0] < 3:
         from StringIO import StringIO as PyStringIO
     # end string io special handling
     import cProfile as profile
+    # not available - users have to handle this
+    asyncio = None
 else:
     # for Py3
     import pickle
     from io import StringIO
     PyStringIO = StringIO
     import profile
+    import asyncio
 # end
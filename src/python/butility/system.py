@@ -10,10 +10,13 @@ from __future__ import unicode_literals
 from butility.future import str
 __all__ = ['init_ipython_terminal', 'dylib_extension', 'login_name', 'uname', 'int_bits',
            'system_user_id', 'update_env_path', 'Thread', 'ConcurrentRun', 'daemonize',
-           'TerminatableThread', 'octal', 'DEFAULT_ENCODING']
+           'TerminatableThread', 'octal', 'DEFAULT_ENCODING', 'parallel_map', 'copy_file',
+           'stat_fingerprint']
 
 import sys
 import os
+import errno
+import shutil
 import threading
 import platform
 import getpass
@@ -114,6 +117,17 @@ def system_user_id():
     return "%s@%s" % (username, platform.node())
 
 
+def stat_fingerprint(path):
+    """@return a tuple of (size, modification time) of the given path, or None if it doesn't exist.
+    It changes whenever the file is written, and is much cheaper to obtain than a checksum"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    # end handle missing paths
+    return (st.st_size, st.st_mtime)
+
+
 def update_env_path(variable_name, path, append=False, environment=os.environ):
     """Set the given variable_name to the given path, but append or prepend the existing path
     to it using the platforms path separator.
@@ -230,6 +244,133 @@ def daemonize(pid_file):
     os.dup2(fd, 1)           # standard output (1)
     os.dup2(fd, 2)           # standard error (2)
 
+
+def parallel_map(fun, items, max_workers=8):
+    """Call fun(item) for each of the given items, using up to max_workers threads, and return the results.
+    This is useful for IO bound operations, like reading or stat'ing many files on a network file system.
+    @param fun f(item) => result, called concurrently
+    @param items an iterable of items to pass to fun
+    @param max_workers the maximum amount of threads to use. If smaller than 2, no thread will be used
+    @return a list of results, in order of the given items
+    @throws Exception the first exception, in order of items, raised by fun. All items will have been 
+    handled by then"""
+    items = list(items)
+    if max_workers < 2 or len(items) < 2:
+        return [fun(item) for item in items]
+    # end handle serial case
+
+    results = [None] * len(items)
+    errors = [None] * len(items)
+    lock = threading.Lock()
+    queue = iter(enumerate(items))
+
+    def worker():
+        while True:
+            lock.acquire()
+            try:
+                index, item = next(queue)
+            except StopIteration:
+                return
+            finally:
+                lock.release()
+            # end obtain next item
+            try:
+                results[index] = fun(item)
+            except Exception as exc:
+                errors[index] = exc
+            # end keep exceptions for later
+        # end while there is work
+    # end worker
+
+    workers = list()
+    for _ in range(min(max_workers, len(items))):
+        thread = Thread(target=worker)
+        thread.daemon = True
+        workers.append(thread.start())
+    # end for each worker to start
+    for thread in workers:
+        thread.join()
+    # end for each thread to wait for
+
+    for exc in errors:
+        if exc is not None:
+            raise exc
+        # end re-raise
+    # end for each possible error
+    return results
+
+
+# Errors indicating that the kernel can't copy between the given files, which makes us fall back to reading and
+# writing them ourselves
+_unsupported_copy_errors = set(getattr(errno, name) for name in ('ENOSYS', 'EXDEV', 'EINVAL', 'ENOTSUP',
+                                                                 'EOPNOTSUPP', 'ENODEV', 'EBADF')
+                               if hasattr(errno, name))
+
+
+def _copy_in_kernel(source_fd, destination_fd, size, chunk_size, callback=None):
+    """Copy size bytes from the given source to the destination file descriptor, without reading them into
+    user space, using os.copy_file_range() or os.sendfile(), if available.
+    @param callback if not None, f(count) called with the amount of bytes copied after each chunk
+    @return amount of bytes copied, which is smaller than size if the kernel can't copy (all of) them"""
+    copy_file_range = getattr(os, 'copy_file_range', None)
+    sendfile = getattr(os, 'sendfile', None)
+    offset = 0
+    for function in (copy_file_range, sendfile):
+        if function is None:
+            continue
+        # end skip unavailable functions
+        try:
+            while offset < size:
+                count = min(chunk_size, size - offset)
+                if function is copy_file_range:
+                    copied = function(source_fd, destination_fd, count, offset, offset)
+                else:
+                    copied = function(destination_fd, source_fd, offset, count)
+                # end handle function signature
+                if not copied:
+                    break
+                # end handle end of file
+                offset += copied
+                if callback is not None:
+                    callback(copied)
+                # end report progress
+            # end while there is something to copy
+            return offset
+        except OSError as err:
+            if offset or err.errno not in _unsupported_copy_errors:
+                raise
+            # end re-raise actual errors
+        # end try next function
+    # end for each function
+    return offset
+
+
+def copy_file(source, destination, chunk_size=1024 * 1024, callback=None):
+    """Copy the contents of the given source file to the destination, along with its permission bits and
+    modification time. The kernel copies the data if it supports it, otherwise it is copied in chunks.
+    @param source path to existing file
+    @param destination path to file to create or overwrite
+    @param chunk_size the amount of bytes to copy at once
+    @param callback if not None, f(count) called with the amount of bytes copied after each chunk. It may
+    raise to abort the copy, leaving a partial destination file behind"""
+    with open(source, 'rb') as source_fp:
+        with open(destination, 'wb') as destination_fp:
+            size = os.fstat(source_fp.fileno()).st_size
+            copied = _copy_in_kernel(source_fp.fileno(), destination_fp.fileno(), size, chunk_size, callback)
+            if copied < size:
+                source_fp.seek(copied)
+                destination_fp.seek(copied)
+                for chunk in iter(lambda: source_fp.read(chunk_size), b''):
+                    destination_fp.write(chunk)
+                    if callback is not None:
+                        callback(len(chunk))
+                    # end report progress
+                # end for each chunk
+            # end copy the rest ourselves
+        # end assure destination is closed
+    # end assure source is closed
+    shutil.copystat(source, destination)
+
 # -- End System Related Functions -- @}
 
 
@@ -14,12 +14,15 @@ from butility.future import with_metaclass
 
 __all__ = []
 
-from .base import TestCase
+from .base import (TestCase,
+                   with_rw_directory)
 import sys
 import os
+import json
 
 # test from * import
 from butility import *
+from butility.compat import StringIO
 
 
 # ==============================================================================
@@ -44,6 +47,8 @@ class TestUtility(TestCase):
         assert isinstance(int_bits(), int)
         assert isinstance(dylib_extension(), str)
         assert '@' in system_user_id()
+        assert stat_fingerprint(__file__)[0] == os.path.getsize(__file__)
+        assert stat_fingerprint('/doesnt/exist') is None
 
     def test_non_instantiatble(self):
         """check non-instantiation base class"""
@@ -206,6 +211,118 @@ class TestUtility(TestCase):
         del sys.modules[mod_name]
         del sys.modules['submodule']
 
+        # multiple paths are loaded in order
+        res = load_files([self.fixture_path('sub-directory'), self.fixture_path('module.py')])
+        assert len(res) == 2
+        assert res[0].endswith('submodule.py')
+        assert res[1].endswith('module.py')
+        del sys.modules['module']
+        del sys.modules['submodule']
+
+    @with_rw_directory
+    def test_python_file_loader_bytecode_cache(self, rw_dir):
+        cache_dir = rw_dir / 'cache'
+        plugin_dir = rw_dir / 'plugins'
+        plugin_dir.mkdir()
+        for index in range(3):
+            (plugin_dir / ('plugin_%i.py' % index)).write_text('value = %i\n' % index)
+        # end for each plugin
+        (plugin_dir / 'broken.py').write_text('this is no python\n')
+
+        failed = list()
+        os.environ[BYTECODE_CACHE_DIR_ENVIRONMENT_VARIABLE] = str(cache_dir)
+        try:
+            for iteration in range(2):
+                res = load_files(plugin_dir, on_error=lambda f, m: failed.append(m))
+                assert len(res) == 3
+                assert len(cache_dir.files()) == 3, "broken files are not cached"
+                assert sys.modules['plugin_2'].value == 2
+            # end load twice, second time from cache
+            assert failed == ['broken', 'broken']
+            assert 'broken' not in sys.modules
+
+            # changing the source changes the key
+            (plugin_dir / 'plugin_2.py').write_text('value = 42\n')
+            mod = load_file(plugin_dir / 'plugin_2.py', 'plugin_2')
+            assert mod.value == 42
+            assert len(cache_dir.files()) == 4
+        finally:
+            del os.environ[BYTECODE_CACHE_DIR_ENVIRONMENT_VARIABLE]
+            for index in range(3):
+                del sys.modules['plugin_%i' % index]
+            # end for each module to remove
+        # end assure environment is restored
+
+    def test_parallel_map(self):
+        items = list(range(50))
+        assert parallel_map(lambda x: x * 2, items, max_workers=4) == [x * 2 for x in items]
+        assert parallel_map(lambda x: x * 2, items, max_workers=1) == [x * 2 for x in items]
+        assert parallel_map(lambda x: x, [], max_workers=4) == []
+
+        def fail_on_odd(x):
+            if x % 2:
+                raise ValueError(x)
+            return x
+        # end fail on odd numbers
+        try:
+            parallel_map(fail_on_odd, items, max_workers=4)
+        except ValueError as err:
+            assert err.args[0] == 1, "first error in order of items is raised"
+        else:
+            raise AssertionError("should have raised")
+        # end handle exception
+
+    def test_timing_tree(self):
+        timing = TimingTree('test')
+        with timing.phase('disabled') as phase:
+            assert phase is None
+        # end nothing happens while disabled
+        assert not timing.root().children and not timing.count('foo').counters()
+
+        timing.enable()
+        with timing.phase('first'):
+            timing.count('files').count('files', 2)
+            with timing.phase('nested'):
+                timing.count('bytes', 10)
+            # end nested phase
+        # end first phase
+        with timing.phase('second') as phase:
+            assert phase.end is None
+        # end second phase
+        assert phase.end is not None and phase.elapsed() >= 0
+
+        data = timing.to_dict()
+        assert data['name'] == 'test'
+        assert [child['name'] for child in data['children']] == ['first', 'second']
+        assert data['children'][0]['counters'] == dict(files=3)
+        assert data['children'][0]['children'][0]['counters'] == dict(bytes=10)
+        assert timing.counters() == dict(files=3, bytes=10)
+
+        events = timing.to_chrome_trace()['traceEvents']
+        assert [event['name'] for event in events] == ['test', 'first', 'nested', 'second']
+
+        for fmt in TimingTree.formats:
+            stream = StringIO()
+            timing.write(stream, fmt)
+            assert json.loads(stream.getvalue())
+        # end for each format
+        self.failUnlessRaises(ValueError, timing.write, StringIO(), 'foo')
+
+        assert not timing.reset().root().children
+
+        # memory is bounded in programs which never stop recording
+        timing = TimingTree('test', enabled=True, max_phases=2)
+        for _ in range(5):
+            with timing.phase('repeated') as phase:
+                assert phase is not None
+            # end timed phase
+        # end for each phase
+        assert len(timing.root().children) == 2 and timing.counters()['phases dropped'] == 3
+        with timing.reset().phase('after reset'):
+            pass
+        # end phases are recorded again after a reset
+        assert len(timing.root().children) == 1
+
     def test_octal(self):
         """test octal conversion"""
         assert octal('0777') == 511
@@ -0,0 +1,323 @@
+#-*-coding:utf-8-*-
+"""
+@package butility.timing
+@brief Utilities to record where time is spent as a tree of named phases
+
+@author Sebastian Thiel
+@copyright [GNU Lesser General Public License](https://www.gnu.org/licenses/lgpl.html)
+"""
+from __future__ import unicode_literals
+from __future__ import division
+from butility.future import str
+__all__ = ['TimingPhase', 'TimingTree', 'startup_timing']
+
+import os
+import json
+import time
+import threading
+
+
+# ==============================================================================
+# @name Types
+# ------------------------------------------------------------------------------
+# @{
+
+class TimingPhase(object):
+
+    """A named phase with a start and end time, counters and child phases"""
+    __slots__ = (
+        'name',         # name of the phase
+        'start',        # time.time() at which the phase started
+        'end',          # time.time() at which the phase ended, or None if it is still running
+        'counters',     # dict of name: amount pairs
+        'children',     # list of child phases, in order of creation
+        'thread_id'     # id of the thread the phase was recorded in
+    )
+
+    def __init__(self, name):
+        self.name = name
+        self.start = time.time()
+        self.end = None
+        self.counters = dict()
+        self.children = list()
+        self.thread_id = threading.current_thread().ident
+
+    def __repr__(self):
+        return "%s('%s', %.3fs)" % (type(self).__name__, self.name, self.elapsed())
+
+    # -------------------------
+    # @name Interface
+    # @{
+
+    def elapsed(self):
+        """@return amount of seconds spent in this phase so far"""
+        return (self.end or time.time()) - self.start
+
+    def to_dict(self, origin):
+        """@return a dict with all our data, including our children, suitable for serialization
+        @param origin time.time() which is used as point of reference for all start times"""
+        return dict(name=self.name,
+                    start_ms=(self.start - origin) * 1000.0,
+                    elapsed_ms=self.elapsed() * 1000.0,
+                    counters=dict(self.counters),
+                    children=[child.to_dict(origin) for child in self.children])
+
+    # -- End Interface -- @}
+
+# end class TimingPhase
+
+
+class _PhaseContext(object):
+
+    """A context manager to record a phase in a TimingTree"""
+    __slots__ = ('_tree', '_name', '_phase')
+
+    def __init__(self, tree, name):
+        self._tree = tree
+        self._name = name
+        self._phase = None
+
+    def __enter__(self):
+        self._phase = self._tree._push(self._name)
+        return self._phase
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._tree._pop(self._phase)
+        return False
+
+# end class _PhaseContext
+
+
+class _NullPhaseContext(object):
+
+    """A context manager which does nothing, used while a TimingTree is disabled"""
+    __slots__ = ()
+
+    def __enter__(self):
+        return None
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+# end class _NullPhaseContext
+
+
+class TimingTree(object):
+
+    """Records nested, named phases along with counters, which can be exported as JSON or in the
+    [Chrome trace event format](https://github.com/catapult-project/catapult/wiki/Trace-Event-Format).
+
+    Phases are recorded per thread, and nest naturally:
+
+        with timing.phase('config discovery'):
+            with timing.phase('file parse'):
+                timing.count('files read')
+
+    While disabled, phase() and count() do nothing, and cost no more than a function call.
+    Once max_phases were recorded, further phases are still timed, but not kept, to bound the memory used by
+    long-running programs which never disable recording.
+    """
+    __slots__ = (
+        '_root',        # root phase
+        '_local',       # thread-local storage to keep the stack of running phases
+        '_lock',        # lock to serialize access to children and counters of shared phases
+        '_enabled',     # if True, we will record phases
+        '_max_phases',  # maximum amount of phases to keep
+        '_num_phases'   # amount of phases we recorded so far
+    )
+
+    # -------------------------
+    # @name Configuration
+    # @{
+
+    # The formats we can write
+    FORMAT_JSON = 'json'
+    FORMAT_CHROME_TRACE = 'chrome'
+
+    formats = (FORMAT_JSON, FORMAT_CHROME_TRACE)
+
+    # Default maximum amount of phases to keep. Phases beyond that are counted in the 'phases dropped' counter
+    # of the root
+    max_phases = 10000
+
+    # -- End Configuration -- @}
+
+    _null_phase = _NullPhaseContext()
+
+    def __init__(self, name='root', enabled=False, max_phases=None):
+        """Initialize this instance
+        @param name of the root phase
+        @param enabled if True, we will start recording right away
+        @param max_phases maximum amount of phases to keep, or None to use the default"""
+        self._lock = threading.Lock()
+        self._enabled = enabled
+        self._root = TimingPhase(name)
+        self._local = threading.local()
+        self._max_phases = max_phases or self.max_phases
+        self._num_phases = 0
+
+    # -------------------------
+    # @name Utilities
+    # @{
+
+    def _stack(self):
+        """@return list of running phases of the current thread"""
+        try:
+            return self._local.stack
+        except AttributeError:
+            self._local.stack = stack = list()
+            return stack
+        # end initialize thread local
+
+    def _push(self, name):
+        """@return a new phase, which is a child of the current one unless we have recorded too many phases"""
+        phase = TimingPhase(name)
+        stack = self._stack()
+        parent = stack and stack[-1] or self._root
+        self._lock.acquire()
+        try:
+            if self._num_phases < self._max_phases:
+                parent.children.append(phase)
+                self._num_phases += 1
+            else:
+                self._root.counters['phases dropped'] = self._root.counters.get('phases dropped', 0) + 1
+            # end handle phase limit
+        finally:
+            self._lock.release()
+        # end assure lock is released
+        stack.append(phase)
+        return phase
+
+    def _pop(self, phase):
+        """Finish the given phase, which must be the current one"""
+        phase.end = time.time()
+        stack = self._stack()
+        if stack and stack[-1] is phase:
+            stack.pop()
+        # end handle stack
+
+    def _iter_phases(self, phase=None):
+        """@return iterator yielding all phases depth-first, starting at the given one, or our root"""
+        phase = phase or self._root
+        yield phase
+        for child in phase.children:
+            for item in self._iter_phases(child):
+                yield item
+            # end for each item of child
+        # end for each child
+
+    # -- End Utilities -- @}
+
+    # -------------------------
+    # @name Interface
+    # @{
+
+    def enable(self, enabled=True):
+        """Enable or disable recording of new phases and counters
+        @return self"""
+        self._enabled = enabled
+        return self
+
+    def is_enabled(self):
+        """@return True if we are recording"""
+        return self._enabled
+
+    def phase(self, name):
+        """@return a context manager recording a phase with the given name, as child of the current phase
+        of the calling thread"""
+        if not self._enabled:
+            return self._null_phase
+        # end handle disabled state
+        return _PhaseContext(self, name)
+
+    def count(self, name, amount=1):
+        """Add the given amount to the counter with the given name in the current phase of the calling thread
+        @return self"""
+        if not self._enabled:
+            return self
+        # end handle disabled state
+        stack = self._stack()
+        phase = stack and stack[-1] or self._root
+        self._lock.acquire()
+        try:
+            phase.counters[name] = phase.counters.get(name, 0) + amount
+        finally:
+            self._lock.release()
+        # end assure lock is released
+        return self
+
+    def root(self):
+        """@return our root phase"""
+        return self._root
+
+    def reset(self):
+        """Discard all recorded phases, and restart the root phase
+        @return self"""
+        self._root = TimingPhase(self._root.name)
+        self._local = threading.local()
+        self._num_phases = 0
+        return self
+
+    def counters(self):
+        """@return a dict with all counters of all phases summed up"""
+        res = dict()
+        for phase in self._iter_phases():
+            for name, amount in phase.counters.items():
+                res[name] = res.get(name, 0) + amount
+            # end for each counter
+        # end for each phase
+        return res
+
+    def to_dict(self):
+        """@return all recorded data as nested dict, whose times are in milliseconds relative to the start
+        of our root phase"""
+        return self._root.to_dict(self._root.start)
+
+    def to_chrome_trace(self):
+        """@return a dict in the chrome trace event format, which can be loaded into chrome://tracing"""
+        origin = self._root.start
+        pid = os.getpid()
+        events = list()
+        for phase in self._iter_phases():
+            events.append(dict(name=phase.name,
+                               ph='X',
+                               ts=(phase.start - origin) * 1000000.0,
+                               dur=phase.elapsed() * 1000000.0,
+                               pid=pid,
+                               tid=phase.thread_id,
+                               args=dict(phase.counters)))
+        # end for each phase
+        return dict(traceEvents=events, displayTimeUnit='ms')
+
+    def write(self, stream, format=FORMAT_JSON):
+        """Write all recorded data to the given stream in the given format
+        @param stream a stream supporting write()
+        @param format one of our formats
+        @return self
+        @throw ValueError if the format is unknown"""
+        if format == self.FORMAT_JSON:
+            data = self.to_dict()
+        elif format == self.FORMAT_CHROME_TRACE:
+            data = self.to_chrome_trace()
+        else:
+            raise ValueError("Unknown timing format '%s' - valid formats are %s" % (format, ', '.join(self.formats)))
+        # end handle format
+        stream.write(str(json.dumps(data, indent=2, sort_keys=True)))
+        return self
+
+    # -- End Interface -- @}
+
+# end class TimingTree
+
+# -- End Types -- @}
+
+
+# ==============================================================================
+# @name Globals
+# ------------------------------------------------------------------------------
+# @{
+
+# Used to record the startup phases of a program, like the creation of an Application. It is disabled by default
+startup_timing = TimingTree('startup')
+
+# -- End Globals -- @}
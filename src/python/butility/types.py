@@ -682,7 +682,8 @@ class ProgressIndicator(object):
         '_max',
         '_rr',
         '_relative',
-        '_may_abort'
+        '_may_abort',
+        '_listeners'
     )
 
     #{ Initialization
@@ -700,6 +701,7 @@ class ProgressIndicator(object):
         self.set_abortable(may_abort)
         self.set_round_robin(round_robin)
         self._progress_value = min
+        self._listeners = list()
 
     def begin(self):
         """intiialize the progress indicator before calling `set` """
@@ -731,6 +733,9 @@ class ProgressIndicator(object):
 
         if not omit_refresh:
             self.refresh(message=message)
+        for listener in self._listeners:
+            listener(self, message)
+        # end for each listener to notify
 
     def set_range(self, min, max):
         """set the range within we expect our progress to occour"""
@@ -752,6 +757,23 @@ class ProgressIndicator(object):
         be interrupted"""
         self._may_abort = state
 
+    def add_listener(self, listener):
+        """Add a listener to be called whenever our value is set, which allows to observe progress without
+        polling it.
+        @param listener f(progress, message) called with this instance and the message passed to `set`.
+        It is called on the thread that sets the progress
+        @return self"""
+        self._listeners.append(listener)
+        return self
+
+    def remove_listener(self, listener):
+        """Remove a listener previously added with `add_listener`. Unknown listeners are ignored
+        @return self"""
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+        # end handle unknown listeners
+        return self
+
     def setup(self, range=None, relative=None, abortable=None, begin=True, round_robin=None):
         """Multifunctional, all in one convenience method setting all important attributes
         at once. This allows setting up the progress indicator with one call instead of many
@@ -815,6 +837,10 @@ class ProgressIndicator(object):
         """@return True if round_robin mode is enabled"""
         return self._rr
 
+    def listeners(self):
+        """@return a list of all listeners added with `add_listener`"""
+        return list(self._listeners)
+
     def prefix(self, value):
         """
         @return a prefix indicating the progress according to the current range